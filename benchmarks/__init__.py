@@ -0,0 +1,9 @@
+"""Benchmarks for the library's hot paths on synthetic catalogs.
+
+Run from the repository root::
+
+    PYTHONPATH=src python -m benchmarks --sizes 1k,10k,100k --baseline benchmarks/baseline.json
+
+See :mod:`benchmarks.__main__` for the options, :mod:`benchmarks.generators`
+for the synthetic data and :mod:`benchmarks.scenarios` for what is timed.
+"""
@@ -0,0 +1,106 @@
+"""Run the benchmark scenarios and check them against a baseline.
+
+Examples, from the repository root::
+
+    PYTHONPATH=src python -m benchmarks --sizes 1k,10k --output results.json
+    PYTHONPATH=src python -m benchmarks --baseline benchmarks/baseline.json --threshold 0.3
+    PYTHONPATH=src python -m benchmarks --sizes 1m,5m --repeats 1 --scenario library.load --scenario library.search
+    PYTHONPATH=src python -m benchmarks --baseline benchmarks/baseline.json --update-baseline
+
+The exit status is 1 when a scenario is slower than its baseline by more
+than the threshold.
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+from pathlib import Path
+from typing import List, Optional
+
+from .harness import compare, load_results, measure, merge_baseline, write_results
+from .scenarios import SCENARIOS, Workspace
+
+DEFAULT_SIZES = "1k,10k,100k"
+_MULTIPLIERS = {"k": 1_000, "m": 1_000_000}
+
+
+def parse_size(text: str) -> int:
+    text = text.strip().lower().replace("_", "")
+    multiplier = _MULTIPLIERS.get(text[-1:], 1)
+    number = text[:-1] if multiplier != 1 else text
+    try:
+        size = int(float(number) * multiplier)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid size: {text!r}") from None
+    if size < 1:
+        raise argparse.ArgumentTypeError(f"size must be positive: {text!r}")
+    return size
+
+
+def _sizes(text: str) -> List[int]:
+    return [parse_size(part) for part in text.split(",") if part.strip()]
+
+
+def _format_bytes(value: Optional[int]) -> str:
+    return "-" if value is None else f"{value / 2**20:.1f}"
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=_sizes, default=_sizes(DEFAULT_SIZES), help="Catalog sizes, e.g. 1k,10k,100k,1m,5m")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="Run only this scenario (repeatable)")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed runs per scenario; the fastest is reported")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the extra tracemalloc run for peak memory")
+    parser.add_argument("--output", type=Path, help="Write the results as JSON to this file")
+    parser.add_argument("--baseline", type=Path, help="Baseline results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed slowdown against the baseline (0.25 = 25%%)")
+    parser.add_argument("--update-baseline", action="store_true", help="Store these results in --baseline instead of comparing")
+    parser.add_argument("--workdir", type=Path, help="Directory for generated libraries (default: a temporary directory)")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.update_baseline and args.baseline is None:
+        parser.error("--update-baseline requires --baseline")
+    scenarios = [SCENARIOS[name] for name in args.scenario] if args.scenario else list(SCENARIOS.values())
+
+    measurements = []
+    print(f"{'scenario':<24} {'size':>9} {'best s':>9} {'mean s':>9} {'peak MiB':>9} {'read MiB':>9} {'write MiB':>9}")
+    with Workspace(args.workdir) as workspace:
+        for size in args.sizes:
+            for scenario in scenarios:
+                result = measure(scenario, size, workspace, repeats=args.repeats, memory=not args.no_memory)
+                measurements.append(result)
+                print(
+                    f"{result.scenario:<24} {result.size:>9} {result.seconds:>9.4f} {result.mean_seconds:>9.4f} "
+                    f"{_format_bytes(result.peak_bytes):>9} {_format_bytes(result.read_bytes):>9} "
+                    f"{_format_bytes(result.write_bytes):>9}",
+                    flush=True,
+                )
+
+    if args.output is not None:
+        write_results(args.output, measurements)
+    if args.baseline is None:
+        return 0
+    if args.update_baseline:
+        merge_baseline(args.baseline, measurements)
+        print(f"Updated baseline {args.baseline}")
+        return 0
+    if not args.baseline.exists():
+        print(f"Baseline {args.baseline} not found; run with --update-baseline to create it", file=sys.stderr)
+        return 1
+    regressions = compare(measurements, load_results(args.baseline), args.threshold)
+    for regression in regressions:
+        print(
+            f"REGRESSION {regression.scenario} [{regression.size}]: {regression.seconds:.4f}s vs "
+            f"{regression.baseline_seconds:.4f}s baseline ({regression.ratio:.2f}x)",
+            file=sys.stderr,
+        )
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,105 @@
+"""Deterministic synthetic catalogs and listening sessions.
+
+Tracks follow rough real-world shapes rather than uniform noise: genres
+have skewed shares, BPM is drawn around a per-genre tempo (and is often
+missing for classical music), moods are correlated with the genre,
+durations are log-normal around a per-genre median, a few artists own most
+of the catalog and play counts are heavy-tailed. The same ``seed`` and
+``count`` always give the same tracks, whatever the Python process.
+"""
+
+from __future__ import annotations
+
+import random
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+from music_app.library import Track
+
+EPOCH = datetime(2024, 6, 1)
+MOODS = ["calm", "energetic", "late night", "focus", "happy", "melancholic", "uplifting", "dark"]
+TITLE_WORDS = (
+    "love night heart fire blue dream city rain light dance summer shadow river gold wild star moon road home "
+    "time ocean echo glass electric silent neon paper winter storm velvet signal golden hollow midnight ghost "
+    "sugar thunder crystal falling running broken lost young forever"
+).split()
+
+
+@dataclass(frozen=True)
+class GenreProfile:
+    share: float
+    bpm_mean: float
+    bpm_spread: float
+    bpm_missing: float
+    median_seconds: float
+    moods: Tuple[str, ...]
+
+
+GENRES: Dict[str, GenreProfile] = {
+    "Pop": GenreProfile(0.22, 118, 12, 0.05, 210, ("happy", "uplifting", "energetic")),
+    "Rock": GenreProfile(0.16, 125, 18, 0.10, 240, ("energetic", "dark", "uplifting")),
+    "Hip Hop": GenreProfile(0.14, 92, 10, 0.05, 220, ("energetic", "dark", "late night")),
+    "Electronic": GenreProfile(0.14, 126, 8, 0.02, 300, ("energetic", "late night", "focus")),
+    "Jazz": GenreProfile(0.08, 110, 30, 0.25, 330, ("calm", "late night", "melancholic")),
+    "Classical": GenreProfile(0.07, 90, 25, 0.50, 420, ("calm", "focus", "melancholic")),
+    "Folk": GenreProfile(0.07, 100, 15, 0.15, 230, ("calm", "melancholic", "happy")),
+    "Ambient": GenreProfile(0.06, 80, 12, 0.20, 360, ("calm", "focus")),
+    "Metal": GenreProfile(0.06, 150, 25, 0.10, 300, ("energetic", "dark")),
+}
+_GENRE_NAMES = list(GENRES)
+_GENRE_WEIGHTS = [profile.share for profile in GENRES.values()]
+
+
+def synthetic_tracks(count: int, seed: int = 7) -> Iterator[Track]:
+    """``count`` tracks with ids ``trk-00000000`` upwards, generated lazily."""
+
+    rng = random.Random(seed)
+    artists = count // 15 + 1
+    albums = count // 8 + 1
+    for number in range(count):
+        genre = rng.choices(_GENRE_NAMES, _GENRE_WEIGHTS)[0]
+        profile = GENRES[genre]
+        moods = [mood for mood in profile.moods if rng.random() < 0.45]
+        if rng.random() < 0.1:
+            moods.append(rng.choice(MOODS))
+        played = rng.random() < 0.6
+        bpm = None
+        if rng.random() >= profile.bpm_missing:
+            bpm = min(220, max(40, round(rng.gauss(profile.bpm_mean, profile.bpm_spread))))
+        title = " ".join(rng.choice(TITLE_WORDS) for _ in range(rng.randint(1, 4))).title()
+        if rng.random() < 0.02:
+            title += " (Remastered)"
+        yield Track(
+            id=f"trk-{number:08d}",
+            title=title,
+            # Skewed towards low numbers: a few artists own much of the catalog.
+            artist=f"Artist {int(artists * rng.random() ** 2.5)}",
+            album=f"Album {int(albums * rng.random() ** 1.5)}",
+            duration_seconds=min(1800, max(30, round(rng.lognormvariate(0, 0.25) * profile.median_seconds))),
+            genre=genre,
+            moods=list(dict.fromkeys(moods)),
+            bpm=bpm,
+            last_played=(EPOCH - timedelta(seconds=rng.randrange(90 * 86400))).isoformat() if played else None,
+            play_count=min(100_000, int(rng.paretovariate(1.1))) if played else 0,
+        )
+
+
+def listening_sessions(track_ids: Sequence[str], sessions: int, length: int, seed: int = 11) -> Iterator[List[str]]:
+    """Play queues that favour popular (low-numbered) tracks, with repeats."""
+
+    rng = random.Random(seed)
+    total = len(track_ids)
+    for _ in range(sessions):
+        yield [track_ids[int(total * rng.random() ** 3)] for _ in range(length)]
+
+
+def search_terms(count: int, seed: int = 13) -> List[str]:
+    """Queries mixing title words, moods, genres and artists."""
+
+    rng = random.Random(seed)
+    pools = [TITLE_WORDS, MOODS, [genre.lower() for genre in _GENRE_NAMES], [f"artist {n}" for n in range(50)]]
+    return [rng.choice(rng.choice(pools)) for _ in range(count)]
+
+
+__all__ = ["GENRES", "MOODS", "listening_sessions", "search_terms", "synthetic_tracks"]
@@ -0,0 +1,163 @@
+"""Measuring scenarios and comparing results with a stored baseline.
+
+Each measurement times ``repeats`` fresh runs of a scenario and keeps the
+fastest and the mean. Peak memory comes from one extra run under
+``tracemalloc`` (which slows Python code down, so it is never timed), and
+I/O is the bytes passed through ``read``/``write`` system calls during the
+fastest timed run, from ``/proc/self/io`` where the platform has it.
+"""
+
+from __future__ import annotations
+
+import gc
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .scenarios import Scenario, Workspace
+
+# Slowdowns smaller than this are treated as timer noise, whatever the ratio.
+MIN_REGRESSION_SECONDS = 0.002
+
+
+@dataclass
+class Measurement:
+    scenario: str
+    size: int
+    seconds: float
+    mean_seconds: float
+    repeats: int
+    peak_bytes: Optional[int]
+    read_bytes: Optional[int]
+    write_bytes: Optional[int]
+
+    @property
+    def key(self) -> Tuple[str, int]:
+        return self.scenario, self.size
+
+
+@dataclass
+class Regression:
+    scenario: str
+    size: int
+    seconds: float
+    baseline_seconds: float
+
+    @property
+    def ratio(self) -> float:
+        return self.seconds / self.baseline_seconds
+
+
+def io_counters() -> Optional[Tuple[int, int]]:
+    """``(bytes read, bytes written)`` by this process so far, if known."""
+
+    try:
+        text = Path("/proc/self/io").read_text()
+    except OSError:
+        return None
+    fields = dict(line.split(": ", 1) for line in text.splitlines() if ": " in line)
+    return int(fields["rchar"]), int(fields["wchar"])
+
+
+def measure(scenario: Scenario, size: int, workspace: Workspace, repeats: int = 3, memory: bool = True) -> Measurement:
+    timings: List[float] = []
+    best_io: Optional[Tuple[int, int]] = None
+    for _ in range(max(1, repeats)):
+        run = scenario.prepare(workspace, size)
+        gc.collect()
+        before = io_counters()
+        started = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - started
+        after = io_counters()
+        if not timings or elapsed < min(timings):
+            best_io = (after[0] - before[0], after[1] - before[1]) if before and after else None
+        timings.append(elapsed)
+
+    peak: Optional[int] = None
+    if memory:
+        run = scenario.prepare(workspace, size)
+        gc.collect()
+        tracemalloc.start()
+        try:
+            baseline, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            run()
+            _, traced_peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        peak = traced_peak - baseline
+
+    return Measurement(
+        scenario=scenario.name,
+        size=size,
+        seconds=min(timings),
+        mean_seconds=sum(timings) / len(timings),
+        repeats=len(timings),
+        peak_bytes=peak,
+        read_bytes=best_io[0] if best_io else None,
+        write_bytes=best_io[1] if best_io else None,
+    )
+
+
+# -- Results files -----------------------------------------------------------
+def results_document(measurements: Iterable[Measurement]) -> dict:
+    return {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "results": [asdict(measurement) for measurement in measurements],
+    }
+
+
+def write_results(path: Path, measurements: Iterable[Measurement]) -> None:
+    path.write_text(json.dumps(results_document(measurements), indent=2) + "\n", encoding="utf-8")
+
+
+def load_results(path: Path) -> Dict[Tuple[str, int], Measurement]:
+    document = json.loads(path.read_text(encoding="utf-8"))
+    measurements = (Measurement(**entry) for entry in document["results"])
+    return {measurement.key: measurement for measurement in measurements}
+
+
+def merge_baseline(path: Path, measurements: Iterable[Measurement]) -> None:
+    """Replace the baseline entries for ``measurements``, keeping the others."""
+
+    merged = load_results(path) if path.exists() else {}
+    merged.update((measurement.key, measurement) for measurement in measurements)
+    write_results(path, sorted(merged.values(), key=lambda measurement: (measurement.scenario, measurement.size)))
+
+
+def compare(
+    measurements: Iterable[Measurement], baseline: Dict[Tuple[str, int], Measurement], threshold: float
+) -> List[Regression]:
+    """Measurements slower than their baseline by more than ``threshold`` (0.25 = 25%)."""
+
+    regressions = []
+    for measurement in measurements:
+        previous = baseline.get(measurement.key)
+        if previous is None:
+            continue
+        limit = max(previous.seconds * (1 + threshold), previous.seconds + MIN_REGRESSION_SECONDS)
+        if measurement.seconds > limit:
+            regressions.append(Regression(measurement.scenario, measurement.size, measurement.seconds, previous.seconds))
+    return regressions
+
+
+__all__ = [
+    "Measurement",
+    "Regression",
+    "compare",
+    "io_counters",
+    "load_results",
+    "measure",
+    "merge_baseline",
+    "results_document",
+    "write_results",
+]
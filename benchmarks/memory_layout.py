@@ -0,0 +1,50 @@
+"""Compare the memory held by plain ``Track`` objects and a ``CompactTrackStore``.
+
+Run from the repository root::
+
+    PYTHONPATH=src python -m benchmarks.memory_layout --tracks 200000
+"""
+
+from __future__ import annotations
+
+import argparse
+import gc
+import time
+import tracemalloc
+from typing import Callable, List
+
+from music_app.compact import CompactTrackStore
+
+from .generators import synthetic_tracks
+
+
+def measure(build: Callable[[], object]) -> tuple:
+    gc.collect()
+    tracemalloc.start()
+    began = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - began
+    gc.collect()
+    current, _peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current, elapsed
+
+
+def main(argv: List[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tracks", type=int, default=200_000)
+    args = parser.parse_args(argv)
+
+    layouts = {
+        "dict of Track": lambda: {track.id: track for track in synthetic_tracks(args.tracks)},
+        "CompactTrackStore": lambda: CompactTrackStore(synthetic_tracks(args.tracks)),
+    }
+    print(f"{'layout':<20} {'total MiB':>10} {'bytes/track':>12} {'build s':>8}")
+    for name, build in layouts.items():
+        result, size, elapsed = measure(build)
+        print(f"{name:<20} {size / 2**20:>10.1f} {size / args.tracks:>12.0f} {elapsed:>8.2f}")
+        del result
+
+
+if __name__ == "__main__":
+    main()
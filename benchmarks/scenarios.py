@@ -0,0 +1,154 @@
+"""The timed scenarios and the workspace that caches their fixtures.
+
+A :class:`Scenario`'s ``prepare`` builds whatever one run needs and returns
+the zero-argument callable that is timed; it is called again before every
+run, so runs that change state (imports, plays) always start fresh. Large
+fixtures (a populated library per size, its saved file) are built once per
+process by the :class:`Workspace` and shared between scenarios.
+"""
+
+from __future__ import annotations
+
+import shutil
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from music_app.library import MusicLibrary, Track
+from music_app.player import MusicPlayer
+from music_app.playlist import Playlist
+from music_app.recommendation import RecommendationEngine
+
+from .generators import listening_sessions, search_terms, synthetic_tracks
+
+SEARCH_QUERIES = 20
+SIMILAR_SEEDS = 20
+PLAYLIST_ADD_LIMIT = 100_000
+PLAY_QUEUE_LIMIT = 10_000
+
+
+class Workspace:
+    """Temporary directory plus fixtures cached per catalog size."""
+
+    def __init__(self, root: Optional[Path] = None) -> None:
+        self._owned = root is None
+        self.root = Path(tempfile.mkdtemp(prefix="music-bench-")) if root is None else root
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._libraries: Dict[int, MusicLibrary] = {}
+
+    def close(self) -> None:
+        for library in self._libraries.values():
+            library.close()
+        self._libraries.clear()
+        if self._owned:
+            shutil.rmtree(self.root, ignore_errors=True)
+
+    def __enter__(self) -> Workspace:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+    def fresh_path(self) -> Path:
+        return Path(tempfile.mkdtemp(prefix="run-", dir=self.root)) / "library.json"
+
+    def library(self, size: int) -> MusicLibrary:
+        """A saved library of ``size`` synthetic tracks, shared by scenarios.
+
+        A library left in a reused ``root`` by an earlier run is kept.
+        """
+
+        library = self._libraries.get(size)
+        if library is None:
+            path = self.root / f"library-{size}" / "library.json"
+            path.parent.mkdir(exist_ok=True)
+            library = MusicLibrary(storage_path=path)
+            if len(library) != size:
+                library.import_tracks(synthetic_tracks(size), overwrite=True)
+                library.save()
+            self._libraries[size] = library
+        return library
+
+    def track_ids(self, size: int) -> List[str]:
+        return [f"trk-{number:08d}" for number in range(size)]
+
+
+@dataclass(frozen=True)
+class Scenario:
+    name: str
+    description: str
+    prepare: Callable[[Workspace, int], Callable[[], object]]
+
+
+def _library_save(workspace: Workspace, size: int) -> Callable[[], object]:
+    return workspace.library(size).save
+
+
+def _library_load(workspace: Workspace, size: int) -> Callable[[], object]:
+    path = workspace.library(size).storage_path
+    return lambda: MusicLibrary(storage_path=path)
+
+
+def _library_search(workspace: Workspace, size: int) -> Callable[[], object]:
+    library = workspace.library(size)
+    queries = search_terms(SEARCH_QUERIES)
+    return lambda: [library.search(query, limit=50) for query in queries]
+
+
+def _import_tracks(workspace: Workspace, size: int) -> Callable[[], object]:
+    library = MusicLibrary(storage_path=workspace.fresh_path())
+    tracks = list(synthetic_tracks(size))
+    return lambda: library.import_tracks(tracks)
+
+
+def _recommend_similar(workspace: Workspace, size: int) -> Callable[[], object]:
+    library = workspace.library(size)
+    engine = RecommendationEngine(library)
+    step = max(1, size // SIMILAR_SEEDS)
+    seeds: List[Track] = library.get_tracks(workspace.track_ids(size)[::step][:SIMILAR_SEEDS])[0]
+    return lambda: [engine.recommend_similar(seed, limit=10) for seed in seeds]
+
+
+def _top_trending(workspace: Workspace, size: int) -> Callable[[], object]:
+    engine = RecommendationEngine(workspace.library(size))
+    return lambda: engine.top_trending(limit=50)
+
+
+def _playlist_add_tracks(workspace: Workspace, size: int) -> Callable[[], object]:
+    ids = next(listening_sessions(workspace.track_ids(size), 1, min(size, PLAYLIST_ADD_LIMIT)))
+    playlist = Playlist(name="bench")
+    return lambda: playlist.add_tracks(ids)
+
+
+def _play_playlist(workspace: Workspace, size: int) -> Callable[[], object]:
+    library = workspace.library(size)
+    queue = next(listening_sessions(workspace.track_ids(size), 1, min(size, PLAY_QUEUE_LIMIT)))
+    playlist = Playlist(name="bench")
+    playlist.add_tracks(queue)  # repeats collapse, as in a saved playlist
+    player = MusicPlayer(library)
+    return lambda: player.play_playlist(playlist)
+
+
+SCENARIOS: Dict[str, Scenario] = {
+    scenario.name: scenario
+    for scenario in [
+        Scenario("library.save", "MusicLibrary.save of the whole catalog", _library_save),
+        Scenario("library.load", "open a saved library (MusicLibrary._load)", _library_load),
+        Scenario(
+            "library.search", f"{SEARCH_QUERIES} searches, 50 results each; indexes warm after the first run", _library_search
+        ),
+        Scenario("library.import_tracks", "import_tracks of the whole catalog into an empty library", _import_tracks),
+        Scenario(
+            "recommend.similar",
+            f"recommend_similar for {SIMILAR_SEEDS} seeds, cold result cache, warm indexes after the first run",
+            _recommend_similar,
+        ),
+        Scenario("recommend.top_trending", "top_trending(50), cold result cache, warm indexes after the first run", _top_trending),
+        Scenario("playlist.add_tracks", f"add_tracks of up to {PLAYLIST_ADD_LIMIT:,} ids with repeats", _playlist_add_tracks),
+        Scenario("player.play_playlist", f"play_playlist of up to {PLAY_QUEUE_LIMIT:,} queued tracks", _play_playlist),
+    ]
+}
+
+
+__all__ = ["SCENARIOS", "Scenario", "Workspace"]
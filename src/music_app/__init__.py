@@ -1,13 +1,48 @@
-"""Advanced music software package."""
+"""Advanced music software package.
+
+The public classes are imported on first access, so ``python -m
+music_app.cli`` can forward a command to a running daemon without paying
+for the library, player and recommendation modules.
+"""
+
+from __future__ import annotations
+
+from importlib import import_module
+from typing import TYPE_CHECKING, Any, Dict, List
+
+if TYPE_CHECKING:
+    from .library import BatchResult, MusicLibrary, Track
+    from .player import MusicPlayer
+    from .playlist import Playlist
+    from .recommendation import RecommendationEngine
+
+_EXPORTS: Dict[str, str] = {
+    "MusicLibrary": "library",
+    "Track": "library",
+    "BatchResult": "library",
+    "MusicPlayer": "player",
+    "Playlist": "playlist",
+    "RecommendationEngine": "recommendation",
+}
+
+
+def __getattr__(name: str) -> Any:
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> List[str]:
+    return sorted([*globals(), *_EXPORTS])
 
-from .library import MusicLibrary, Track
-from .player import MusicPlayer
-from .playlist import Playlist
-from .recommendation import RecommendationEngine
 
 __all__ = [
     "MusicLibrary",
     "Track",
+    "BatchResult",
     "MusicPlayer",
     "Playlist",
     "RecommendationEngine",
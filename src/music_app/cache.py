@@ -0,0 +1,87 @@
+"""Bounded LRU/TTL cache for results derived from a versioned library."""
+
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Generic, Hashable, Optional, Tuple, TypeVar
+
+ValueT = TypeVar("ValueT")
+
+
+@dataclass
+class CacheStats:
+    """Counters of a :class:`ResultCache` since creation or the last :meth:`~ResultCache.clear`."""
+
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    invalidations: int = 0
+    size: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class ResultCache(Generic[ValueT]):
+    """LRU cache whose entries also expire after ``ttl`` seconds.
+
+    Every entry remembers the version token it was computed under; a lookup
+    with a different token counts as an invalidation and recomputes. A
+    ``maxsize`` of 0 disables caching while still counting misses.
+    """
+
+    def __init__(self, maxsize: int = 256, ttl: Optional[float] = None, clock: Callable[[], float] = time.monotonic) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._entries: "OrderedDict[Hashable, Tuple[Hashable, float, ValueT]]" = OrderedDict()
+        self._stats = CacheStats()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_or_compute(self, key: Hashable, token: Hashable, compute: Callable[[], ValueT]) -> ValueT:
+        now = self._clock()
+        entry = self._entries.get(key)
+        if entry is not None:
+            entry_token, expires, value = entry
+            if entry_token == token and now < expires:
+                self._entries.move_to_end(key)
+                self._stats.hits += 1
+                return value
+            del self._entries[key]
+            if entry_token != token:
+                self._stats.invalidations += 1
+            else:
+                self._stats.expirations += 1
+        self._stats.misses += 1
+        value = compute()
+        if self.maxsize > 0:
+            expires = now + self.ttl if self.ttl is not None else float("inf")
+            self._entries[key] = (token, expires, value)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self._stats.evictions += 1
+        return value
+
+    def stats(self) -> CacheStats:
+        return CacheStats(
+            hits=self._stats.hits,
+            misses=self._stats.misses,
+            evictions=self._stats.evictions,
+            expirations=self._stats.expirations,
+            invalidations=self._stats.invalidations,
+            size=len(self._entries),
+        )
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._stats = CacheStats()
+
+
+__all__ = ["CacheStats", "ResultCache"]
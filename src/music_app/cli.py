@@ -1,87 +1,457 @@
-"""Command line interface for the advanced music software."""
+"""Command line interface for the advanced music software.
+
+Library commands are forwarded to a running ``serve`` daemon when there is
+one (see :mod:`music_app.daemon`). Everything beyond argument parsing is
+imported only when a command runs in this process, so forwarding stays
+fast.
+"""
 
 from __future__ import annotations
 
 import argparse
 import json
+import sys
+from datetime import datetime
 from pathlib import Path
+from typing import TYPE_CHECKING, List, Optional
+
+from . import daemon, metrics
+
+if TYPE_CHECKING:
+    from .dedup import DedupIndex
+    from .importer import ImportReport
+    from .library import MusicLibrary, Track
+    from .player import MusicPlayer
 
-from .library import MusicLibrary, Track
-from .player import MusicPlayer
-from .playlist import Playlist
-from .recommendation import RecommendationEngine
+PROFILE_LINES = 25
+# Commands that need the library; these are the ones a daemon can run.
+LIBRARY_COMMANDS = frozenset({"import", "list", "play", "playlist", "recommend", "history"})
 
 
 def _parse_track_payload(payload: str) -> Track:
-    data = json.loads(payload)
-    return Track(
-        id=data["id"],
-        title=data["title"],
-        artist=data.get("artist", "Unknown"),
-        album=data.get("album", "Unknown"),
-        duration_seconds=int(data.get("duration_seconds", 0)),
-        genre=data.get("genre", "Unknown"),
-        moods=data.get("moods", []),
-        bpm=data.get("bpm"),
-    )
+    from .importer import track_from_payload
+
+    return track_from_payload(json.loads(payload))
+
+
+def _print_import_progress(report: ImportReport) -> None:
+    print(f"... {report.records} records read, {report.imported} imported, {report.failed} failed", file=sys.stderr)
+
+
+def _storage_path() -> Path:
+    from .library import DEFAULT_STORAGE_PATH
+
+    return DEFAULT_STORAGE_PATH
+
+
+class CommandContext:
+    """The library and the objects built around it, shared by library commands.
+
+    A CLI run builds one for its single command; ``serve`` keeps one warm
+    for every forwarded command.
+    """
+
+    def __init__(self, library: Optional[MusicLibrary] = None) -> None:
+        from .history import HistoryLog, history_path_for
+        from .library import MusicLibrary
+        from .playlist import PlaylistCollection
+        from .playlist_store import playlists_path_for
+        from .recommendation import RecommendationEngine
+        from .transitions import TransitionModel, transitions_path_for
+
+        self.library = library if library is not None else MusicLibrary()
+        path = self.library.storage_path
+        self.transitions = TransitionModel(path=transitions_path_for(path))
+        self.history = HistoryLog(history_path_for(path))
+        self.engine = RecommendationEngine(self.library, transitions=self.transitions)
+        self.playlists = PlaylistCollection(playlists_path_for(path))
+        self._dedup: Optional[DedupIndex] = None
+
+    def player(self) -> MusicPlayer:
+        """A new player, so queues and event lists never carry over between commands.
+
+        Its events go to the durable history log, so they are stamped with
+        the wall clock, as in ``PlayerService``, not the simulated timeline.
+        """
+
+        from .player import MusicPlayer
+
+        return MusicPlayer(self.library, transitions=self.transitions, history_log=self.history, clock=datetime.utcnow)
+
+    def dedup(self) -> DedupIndex:
+        if self._dedup is None:
+            from .dedup import DedupIndex, dedup_path_for
+
+            self._dedup = DedupIndex(self.library, dedup_path_for(self.library.storage_path))
+        return self._dedup
+
+    def close(self) -> None:
+        self.history.close()
+        self.library.close()
 
 
 def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(description="Advanced command-line music application")
+    parser.add_argument("--profile", type=Path, metavar="FILE", help="Run the command under cProfile and save the stats to FILE")
+    parser.add_argument("--no-daemon", action="store_true", help="Run the command here even if a daemon is serving the library")
     subparsers = parser.add_subparsers(dest="command")
 
     add_parser = subparsers.add_parser("import", help="Import tracks from a JSON file")
-    add_parser.add_argument("path", type=Path, help="Path to JSON file containing track data")
+    add_parser.add_argument("path", type=Path, help="Path to a JSON array or NDJSON file containing track data")
+    add_parser.add_argument("--format", choices=["auto", "json", "ndjson"], default="auto", help="Input format")
+    add_parser.add_argument("--workers", type=int, default=0, help="Validate records across this many processes")
+    add_parser.add_argument("--batch-size", type=int, default=5000, help="Tracks committed to the library per batch")
+    add_parser.add_argument("--progress", action="store_true", help="Report progress on stderr after each batch")
+    add_parser.add_argument(
+        "--duplicates",
+        choices=["flag", "merge", "off"],
+        default="flag",
+        help="Near-duplicates of existing tracks (e.g. remastered re-deliveries): report them, skip them, or do not check",
+    )
 
     list_parser = subparsers.add_parser("list", help="List tracks in the library")
-    list_parser.add_argument("--filter", help="Search query to filter tracks")
+    list_parser.add_argument(
+        "--filter",
+        help="Search text or structured query, e.g. 'genre=Ambient bpm=85..100 duration<300 mood=calm played=never'",
+    )
+    list_parser.add_argument("--explain", action="store_true", help="Print the query plan instead of the tracks")
+    list_parser.add_argument("--limit", type=int, help="Maximum number of tracks to show")
+    list_parser.add_argument("--offset", type=int, default=0, help="Number of matching tracks to skip")
 
     play_parser = subparsers.add_parser("play", help="Simulate playing tracks from a playlist")
-    play_parser.add_argument("playlist", type=Path, help="Path to playlist JSON file")
+    play_parser.add_argument("playlist", help="Name of a saved playlist or path to a playlist JSON file")
+
+    playlist_parser = subparsers.add_parser("playlist", help="Manage saved playlists")
+    playlist_parser.add_argument("action", choices=["create", "add", "generate", "list", "delete"], help="Playlist action")
+    playlist_parser.add_argument("name", nargs="?", help="Playlist name")
+    playlist_parser.add_argument("track_ids", nargs="*", help="Track ids to add")
+    playlist_parser.add_argument("--from", dest="source", type=Path, help="Create the playlist from a JSON array file")
+    playlist_parser.add_argument("--seed", help="generate: first track of the flow")
+    playlist_parser.add_argument("--length", type=int, help="generate: number of tracks, seed included")
+    playlist_parser.add_argument("--minutes", type=float, help="generate: target wall-clock length including crossfades")
+    playlist_parser.add_argument(
+        "--bpm-step", nargs=2, type=float, default=(-5.0, 5.0), metavar=("MIN", "MAX"), help="generate: allowed BPM change per track"
+    )
+    playlist_parser.add_argument("--target-step", type=float, default=0.0, help="generate: preferred BPM change per track")
+    playlist_parser.add_argument("--mood", action="append", default=[], help="generate: allowed mood (repeatable)")
+    playlist_parser.add_argument("--genre", action="append", default=[], help="generate: allowed genre (repeatable)")
 
     recommend_parser = subparsers.add_parser("recommend", help="Generate recommendations")
-    recommend_parser.add_argument("mode", choices=["mood", "trending"], help="Recommendation mode")
+    recommend_parser.add_argument("mode", choices=["mood", "trending", "next"], help="Recommendation mode")
     recommend_parser.add_argument("value", nargs="?", help="Value to use for the recommendation mode")
 
+    history_parser = subparsers.add_parser("history", help="Show logged playback events")
+    history_parser.add_argument("--limit", type=int, default=10, help="Show the most recent N matching events")
+    history_parser.add_argument("--since", type=datetime.fromisoformat, help="Only events at or after this UTC time")
+    history_parser.add_argument("--until", type=datetime.fromisoformat, help="Only events before this UTC time")
+    history_parser.add_argument("--track", help="Only events for this track id")
+    history_parser.add_argument("--action", help="Only events with this action, e.g. play")
+    history_parser.add_argument("--daily", action="store_true", help="Show per-track daily play counts rolled up from old segments")
+
+    render_parser = subparsers.add_parser("render", help="Equalize a PCM WAV file (requires the 'dsp' extra)")
+    render_parser.add_argument("source", type=Path, help="Input WAV file")
+    render_parser.add_argument("destination", type=Path, help="Output WAV file, same format as the input")
+    render_parser.add_argument("--eq", default="flat", help="Equalizer preset to apply")
+    render_parser.add_argument("--to", dest="target", help="Ramp from --eq to this preset")
+    render_parser.add_argument("--ramp", type=float, default=5.0, help="Ramp length in seconds when --to is given")
+    render_parser.add_argument("--block-frames", type=int, default=4096, help="Frames filtered per block")
+
+    migrate_parser = subparsers.add_parser("migrate", help="Copy the library into another storage backend")
+    migrate_parser.add_argument("source", help="Existing library, e.g. ~/.ztcsr_music/library.json")
+    migrate_parser.add_argument("destination", help="Target location, e.g. sqlite:///home/me/.ztcsr_music/library.db")
+
+    stats_parser = subparsers.add_parser("stats", help="Show instrumentation totals (collected with ZTSCR_METRICS=1)")
+    stats_parser.add_argument("--prometheus", action="store_true", help="Print the Prometheus text format instead of a table")
+    stats_parser.add_argument("--reset", action="store_true", help="Discard the collected totals")
+
+    serve_parser = subparsers.add_parser("serve", help="Keep the library warm and run forwarded commands on a Unix socket")
+    serve_parser.add_argument("--socket", type=Path, help="Socket path (default: ZTSCR_DAEMON_SOCKET or library.json.sock)")
+
     return parser
 
 
+def _print_stats(totals: metrics.MetricsRegistry) -> None:
+    print(f"{'timer':<56} {'calls':>8} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'total s':>9}")
+    for (name, labels), histogram in sorted(totals.histograms.items()):
+        label = name + "".join(f" {key}={value}" for key, value in labels)
+        mean = histogram.total / histogram.count if histogram.count else 0.0
+        quantiles = " ".join(f"{histogram.quantile(q) * 1000:>9.3f}" for q in (0.5, 0.95, 0.99))
+        print(f"{label:<56} {histogram.count:>8} {mean * 1000:>9.3f} {quantiles} {histogram.total:>9.3f}")
+    print()
+    print(f"{'counter':<56} {'value':>8}")
+    for (name, labels), value in sorted(totals.counters.items()):
+        label = name + "".join(f" {key}={value}" for key, value in labels)
+        print(f"{label:<56} {value:>8g}")
+
+
+def _flush_metrics() -> None:
+    if metrics.enabled() and metrics.REGISTRY:
+        path = _storage_path()
+        metrics.flush(metrics.metrics_path_for(path), metrics.prometheus_path_for(path))
+
+
 def main(argv: list[str] | None = None) -> int:
     parser = build_parser()
     args = parser.parse_args(argv)
+    if args.command in LIBRARY_COMMANDS and args.profile is None and not args.no_daemon:
+        code = daemon.forward(sys.argv[1:] if argv is None else list(argv))
+        if code is not None:
+            return code
 
-    library = MusicLibrary()
-    player = MusicPlayer(library)
-    engine = RecommendationEngine(library)
+    if args.profile is None:
+        try:
+            return _run(parser, args)
+        finally:
+            _flush_metrics()
+
+    import cProfile
+    import pstats
+
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(_run, parser, args)
+    finally:
+        profiler.dump_stats(args.profile)
+        pstats.Stats(profiler, stream=sys.stderr).sort_stats("cumulative").print_stats(PROFILE_LINES)
+        _flush_metrics()
+
+
+def _run(parser: argparse.ArgumentParser, args: argparse.Namespace) -> int:
+    if args.command == "stats":
+        storage_path = _storage_path()
+        path = metrics.metrics_path_for(storage_path)
+        if args.reset:
+            path.unlink(missing_ok=True)
+            metrics.prometheus_path_for(storage_path).unlink(missing_ok=True)
+            print("Discarded the collected metrics")
+            return 0
+        totals = metrics.load_metrics(path)
+        if not totals:
+            print("No metrics collected yet; run commands with ZTSCR_METRICS=1", file=sys.stderr)
+            return 1
+        if args.prometheus:
+            sys.stdout.write(totals.prometheus_text())
+        else:
+            _print_stats(totals)
+        return 0
+
+    if args.command == "migrate":
+        from .library import migrate_library
+
+        result = migrate_library(args.source, args.destination)
+        print(f"Migrated {result.total} tracks into {args.destination}")
+        return 0
+
+    if args.command == "render":
+        try:
+            from .dsp import render_wav
+        except ImportError as exc:
+            print(exc, file=sys.stderr)
+            return 1
+        from .player import default_equalizer_bank
+
+        bank = default_equalizer_bank()
+        try:
+            preset = bank.get(args.eq)
+            target = bank.get(args.target) if args.target else None
+            report = render_wav(
+                args.source, args.destination, preset, ramp_to=target, ramp_seconds=args.ramp, block_frames=args.block_frames
+            )
+        except (KeyError, ValueError) as exc:
+            print(exc.args[0], file=sys.stderr)
+            return 1
+        print(
+            f"Rendered {report.audio_seconds:.1f}s of audio in {report.elapsed_seconds:.2f}s "
+            f"({report.realtime_factor:.1f}x real time)"
+        )
+        return 0
+
+    if args.command == "serve":
+        return _serve(args.socket)
+
+    if args.command not in LIBRARY_COMMANDS:
+        parser.print_help()
+        return 1
+    context = CommandContext()
+    try:
+        return run_command(parser, args, context)
+    finally:
+        context.close()
+
+
+def _serve(socket_path: Optional[Path]) -> int:
+    import signal
+
+    context = CommandContext()
+    library = context.library
+    server = daemon.LibraryDaemon(
+        socket_path or daemon.default_socket_path(), library.storage_path, lambda argv: run_argv(argv, context)
+    )
+    try:
+        server.start()
+    except (OSError, RuntimeError) as exc:
+        context.close()
+        print(f"Cannot serve: {exc}", file=sys.stderr)
+        return 1
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print(f"Serving {library.storage_path} ({len(library)} tracks) on {server.socket_path}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        context.close()
+        _flush_metrics()
+    return 0
+
+
+def run_argv(argv: List[str], context: CommandContext) -> int:
+    """Parse and run one library command against ``context``; used by the daemon."""
+
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command not in LIBRARY_COMMANDS:
+        parser.error(f"{args.command or 'no command'} cannot be run by the daemon")
+    try:
+        return run_command(parser, args, context)
+    finally:
+        _flush_metrics()
+
+
+def run_command(parser: argparse.ArgumentParser, args: argparse.Namespace, context: CommandContext) -> int:
+    from .playlist import Playlist
+    from .query import QueryError
+
+    library = context.library
+    playlists = context.playlists
 
     if args.command == "import":
-        with args.path.open("r", encoding="utf-8") as fh:
-            payload = json.load(fh)
-        tracks = [_parse_track_payload(json.dumps(entry)) for entry in payload]
-        library.import_tracks(tracks, overwrite=True)
-        print(f"Imported {len(tracks)} tracks into the library")
+        from .importer import StreamingImporter
+
+        importer = StreamingImporter(
+            library,
+            overwrite=True,
+            batch_size=args.batch_size,
+            workers=args.workers,
+            progress=_print_import_progress if args.progress else None,
+            dedup=None if args.duplicates == "off" else context.dedup(),
+            merge_duplicates=args.duplicates == "merge",
+        )
+        try:
+            report = importer.import_path(args.path, fmt=args.format)
+        except ValueError as exc:
+            print(f"Import failed: {exc}", file=sys.stderr)
+            return 1
+        for error in report.errors:
+            print(f"record {error.record}: {error.message}", file=sys.stderr)
+        for match in report.duplicates:
+            print(f"near-duplicate: {match.track_id} ~ {match.duplicate_of} ({match.similarity:.2f})", file=sys.stderr)
+        print(
+            f"Imported {report.imported} tracks into the library "
+            f"({report.inserted} inserted, {report.overwritten} overwritten, {report.skipped} skipped, "
+            f"{report.failed} failed, {report.merged} merged as duplicates)"
+        )
         return 0
 
     if args.command == "list":
-        tracks = library.search(args.filter) if args.filter else library.list_tracks()
+        try:
+            if args.explain:
+                print(library.explain(args.filter or ""))
+                return 0
+            tracks = library.query(args.filter or "", limit=args.limit, offset=args.offset)
+        except QueryError as exc:
+            parser.error(f"invalid filter: {exc}")
         for track in tracks:
             print(f"{track.id}: {track.title} — {track.artist} ({track.genre})")
         return 0
 
     if args.command == "play":
-        with args.playlist.open("r", encoding="utf-8") as fh:
-            entries = json.load(fh)
-        playlist = Playlist(name=args.playlist.stem, track_ids=entries)
+        if args.playlist in playlists:
+            playlist = playlists.get(args.playlist)
+        else:
+            path = Path(args.playlist)
+            with path.open("r", encoding="utf-8") as fh:
+                playlist = Playlist(name=path.stem, track_ids=json.load(fh))
+        player = context.player()
         player.play_playlist(playlist)
+        context.transitions.save()
+        context.history.close()
         for event in player.history:
             print(f"{event.timestamp.isoformat()} :: {event.action} :: {event.track_id or ''} :: {event.metadata or ''}")
         return 0
 
+    if args.command == "history":
+        if args.daily:
+            since = args.since.date() if args.since else None
+            until = args.until.date() if args.until else None
+            for day, track_id, plays in context.history.daily_counts(args.track, since, until):
+                print(f"{day} :: {track_id} :: {plays} plays")
+            return 0
+        events = context.history.query(args.since, args.until, track_id=args.track, action=args.action, limit=args.limit)
+        for event in events:
+            print(f"{event.timestamp.isoformat()} :: {event.action} :: {event.track_id or ''} :: {event.metadata or ''}")
+        return 0
+
+    if args.command == "playlist":
+        if args.action == "list":
+            for name in playlists.names():
+                print(name)
+            return 0
+        if not args.name:
+            parser.error(f"{args.action} requires a playlist name")
+        try:
+            if args.action == "create":
+                entries = list(args.track_ids)
+                if args.source is not None:
+                    with args.source.open("r", encoding="utf-8") as fh:
+                        entries = json.load(fh) + entries
+                playlist = Playlist(name=args.name, track_ids=entries)
+                playlist.expand(library)  # raises MissingTracksError naming every unknown id
+                playlists.add(playlist)
+                print(f"Created playlist {args.name!r} with {len(playlists.get(args.name).track_ids)} tracks")
+            elif args.action == "generate":
+                from .generator import FlowSpec, PlaylistGenerator, wall_clock_seconds
+
+                if not args.seed:
+                    parser.error("generate requires --seed")
+                spec = FlowSpec(
+                    length=args.length,
+                    duration_seconds=round(args.minutes * 60) if args.minutes is not None else None,
+                    min_bpm_step=args.bpm_step[0],
+                    max_bpm_step=args.bpm_step[1],
+                    target_bpm_step=args.target_step,
+                    moods=args.mood,
+                    genres=args.genre,
+                )
+                player = context.player()
+                generator = PlaylistGenerator.for_player(player)
+                playlist = generator.generate(args.seed, spec, name=args.name)
+                playlists.add(playlist)
+                minutes = wall_clock_seconds(playlist.expand(library), player.crossfade_seconds) / 60
+                print(f"Generated playlist {args.name!r} with {len(playlist.track_ids)} tracks ({minutes:.1f} minutes)")
+            elif args.action == "add":
+                Playlist(name=args.name, track_ids=args.track_ids).expand(library)
+                added = playlists.append(args.name, args.track_ids)
+                print(f"Added {added} tracks to {args.name!r}")
+            else:
+                playlists.remove(args.name)
+                print(f"Deleted playlist {args.name!r}")
+        except (KeyError, ValueError) as exc:
+            print(exc.args[0], file=sys.stderr)
+            return 1
+        return 0
+
     if args.command == "recommend":
+        engine = context.engine
         if args.mode == "mood":
             if not args.value:
                 parser.error("mood mode requires a value")
             results = engine.recommend_by_mood(args.value)
+        elif args.mode == "next":
+            if not args.value:
+                parser.error("next mode requires a track id")
+            results = engine.recommend_next(args.value)
         else:
             results = engine.top_trending()
         for track in results:
@@ -0,0 +1,417 @@
+"""Memory-compact, column-oriented track storage.
+
+:class:`CompactTrackStore` keeps one row per track in parallel columns:
+``array`` columns for the numeric fields, epoch microseconds for
+``last_played``, titles packed into one UTF-8 buffer and pooled ids for
+artist, album, genre and mood sets. A row costs well under half of a
+``Track`` instance with its ``__dict__``, ``moods`` list and timestamp
+string (see ``benchmarks/memory_layout.py``).
+
+Tracks are handed out as :class:`TrackView` objects, ``Track`` subclasses
+whose attributes read and write the row, so the player, playlists and the
+recommendation engine work unchanged. Storing a plain ``Track`` copies its
+values into a row and leaves the object alone; fetch the stored track to
+see later changes. A row that is overwritten or removed while a view of it
+is alive is kept for that view, which goes on holding the values it had;
+storing such a view again brings its row back, which is what transaction
+rollback relies on.
+"""
+
+from __future__ import annotations
+
+import weakref
+from array import array
+from dataclasses import fields
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Generic, Hashable, Iterable, Iterator, List, MutableMapping, Optional, TypeVar
+
+from .library import Track
+
+FIELD_NAMES = tuple(field.name for field in fields(Track))
+EPOCH = datetime(1970, 1, 1)
+NO_INT = -(2**31)
+# Numbers that do not fit an ``array("i")`` (floats, huge counts) are kept
+# verbatim, like ``RAW_TIME`` below.
+RAW_INT = NO_INT + 1
+NO_TIME = -(2**63)
+# ``last_played`` values that do not round-trip through epoch microseconds
+# (time zones, date-only strings ...) are kept verbatim.
+RAW_TIME = NO_TIME + 1
+_MICROSECOND = timedelta(microseconds=1)
+
+ValueT = TypeVar("ValueT", bound=Hashable)
+
+
+class ValuePool(Generic[ValueT]):
+    """Assigns each distinct value a small integer id; ids are never reused."""
+
+    def __init__(self) -> None:
+        self._ids: Dict[ValueT, int] = {}
+        self._values: List[ValueT] = []
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def __getitem__(self, value_id: int) -> ValueT:
+        return self._values[value_id]
+
+    def intern(self, value: ValueT) -> int:
+        value_id = self._ids.get(value)
+        if value_id is None:
+            value_id = self._ids[value] = len(self._values)
+            self._values.append(value)
+        return value_id
+
+
+# -- Columns -------------------------------------------------------------------
+class _ObjectColumn:
+    def __init__(self) -> None:
+        self.values: List[Any] = []
+
+    def grow(self) -> None:
+        self.values.append(None)
+
+    def get(self, row: int) -> Any:
+        return self.values[row]
+
+    def set(self, row: int, value: Any) -> None:
+        self.values[row] = value
+
+    def clear(self, row: int) -> None:
+        self.values[row] = None
+
+
+class _TextColumn:
+    """Unique strings (titles) as UTF-8 slices of one growing buffer.
+
+    Overwritten values leave garbage behind; the buffer is rewritten once
+    garbage outweighs live text.
+    """
+
+    def __init__(self) -> None:
+        self.blob = bytearray()
+        self.offsets = array("Q")
+        self.lengths = array("I")
+        self.garbage = 0
+
+    def grow(self) -> None:
+        self.offsets.append(0)
+        self.lengths.append(0)
+
+    def get(self, row: int) -> str:
+        start = self.offsets[row]
+        return self.blob[start : start + self.lengths[row]].decode("utf-8")
+
+    def set(self, row: int, value: str) -> None:
+        data = value.encode("utf-8")
+        self.clear(row)
+        self.offsets[row] = len(self.blob)
+        self.lengths[row] = len(data)
+        self.blob += data
+        if self.garbage > len(self.blob) // 2:
+            self._compact()
+
+    def clear(self, row: int) -> None:
+        self.garbage += self.lengths[row]
+        self.lengths[row] = 0
+
+    def _compact(self) -> None:
+        blob = bytearray()
+        for row, length in enumerate(self.lengths):
+            start = self.offsets[row]
+            self.offsets[row] = len(blob)
+            blob += self.blob[start : start + length]
+        self.blob = blob
+        self.garbage = 0
+
+
+class _PooledColumn:
+    def __init__(self, pool: ValuePool[str]) -> None:
+        self.pool = pool
+        self.ids = array("I")
+
+    def grow(self) -> None:
+        self.ids.append(0)
+
+    def get(self, row: int) -> str:
+        return self.pool[self.ids[row]]
+
+    def set(self, row: int, value: str) -> None:
+        self.ids[row] = self.pool.intern(value)
+
+    def clear(self, row: int) -> None:
+        pass
+
+
+class _MoodColumn:
+    """Whole mood lists are pooled: catalogs reuse a few thousand combinations."""
+
+    def __init__(self, strings: ValuePool[str]) -> None:
+        self.strings = strings
+        self.sets: ValuePool[tuple] = ValuePool()
+        self.ids = array("I")
+
+    def grow(self) -> None:
+        self.ids.append(0)
+
+    def get(self, row: int) -> List[str]:
+        return list(self.sets[self.ids[row]])  # the view wraps it in a _MoodList
+
+    def set(self, row: int, value: Iterable[str]) -> None:
+        strings = self.strings
+        moods = tuple(strings[strings.intern(mood)] for mood in value)
+        self.ids[row] = self.sets.intern(moods)
+
+    def clear(self, row: int) -> None:
+        pass
+
+
+class _IntColumn:
+    def __init__(self, nullable: bool) -> None:
+        self.nullable = nullable
+        self.values = array("i")
+        self.raw: Dict[int, Any] = {}
+
+    def grow(self) -> None:
+        self.values.append(0)
+
+    def get(self, row: int) -> Any:
+        value = self.values[row]
+        if value == NO_INT and self.nullable:
+            return None
+        if value == RAW_INT:
+            return self.raw[row]
+        return value
+
+    def set(self, row: int, value: Any) -> None:
+        self.raw.pop(row, None)
+        if value is None and self.nullable:
+            self.values[row] = NO_INT
+        elif type(value) is int and RAW_INT < value < 2**31:
+            self.values[row] = value
+        else:
+            self.values[row] = RAW_INT
+            self.raw[row] = value
+
+    def clear(self, row: int) -> None:
+        self.raw.pop(row, None)
+
+
+class _TimestampColumn:
+    def __init__(self) -> None:
+        self.values = array("q")
+        self.raw: Dict[int, Any] = {}
+
+    def grow(self) -> None:
+        self.values.append(NO_TIME)
+
+    def get(self, row: int) -> Optional[str]:
+        value = self.values[row]
+        if value == NO_TIME:
+            return None
+        if value == RAW_TIME:
+            return self.raw[row]
+        return (EPOCH + value * _MICROSECOND).isoformat()
+
+    def set(self, row: int, value: Optional[str]) -> None:
+        self.raw.pop(row, None)
+        if value is None:
+            self.values[row] = NO_TIME
+            return
+        try:
+            moment = datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            moment = None
+        if moment is not None and moment.tzinfo is None and moment.isoformat() == value:
+            self.values[row] = (moment - EPOCH) // _MICROSECOND
+        else:
+            self.values[row] = RAW_TIME
+            self.raw[row] = value
+
+    def clear(self, row: int) -> None:
+        self.raw.pop(row, None)
+
+
+# -- Views ---------------------------------------------------------------------
+class _MoodList(List[str]):
+    """A view's ``moods``: a list whose in-place edits are written to the row."""
+
+    __slots__ = ("_view",)
+
+    def __init__(self, moods: Iterable[str] = (), view: Optional[TrackView] = None) -> None:
+        super().__init__(moods)
+        self._view = view
+
+    def __reduce__(self) -> tuple:
+        return list, (list(self),)
+
+
+def _writing(name: str) -> Callable[..., Any]:
+    method = getattr(list, name)
+
+    def wrapper(self: _MoodList, *args: Any) -> Any:
+        result = method(self, *args)
+        if self._view is not None:
+            self._view._store._columns["moods"].set(self._view._row, self)
+        return result
+
+    wrapper.__name__ = name
+    return wrapper
+
+
+for _name in (
+    "append", "extend", "insert", "remove", "pop", "clear", "sort", "reverse",
+    "__setitem__", "__delitem__", "__iadd__", "__imul__",
+):
+    setattr(_MoodList, _name, _writing(_name))
+
+
+class TrackView(Track):
+    """A ``Track`` whose fields live in a :class:`CompactTrackStore` row.
+
+    Views compare equal to plain tracks with the same values and pickle as
+    plain tracks. Editing ``moods`` in place writes the new list to the row.
+    """
+
+    _store: CompactTrackStore
+    _row: int
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Track):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in FIELD_NAMES)
+
+    def __reduce__(self) -> tuple:
+        return Track, tuple(list(self.moods) if name == "moods" else getattr(self, name) for name in FIELD_NAMES)
+
+
+def _column_property(name: str) -> property:
+    def fget(view: TrackView) -> Any:
+        value = view._store._columns[name].get(view._row)
+        return _MoodList(value, view) if name == "moods" else value
+
+    def fset(view: TrackView, value: Any) -> None:
+        if name == "id":
+            raise AttributeError("track ids cannot change in a compact store")
+        view._store._columns[name].set(view._row, value)
+
+    return property(fget, fset)
+
+
+for _name in FIELD_NAMES:
+    setattr(TrackView, _name, _column_property(_name))
+
+
+class CompactTrackStore(MutableMapping[str, Track]):
+    """Ordered id -> track mapping backed by columns instead of objects.
+
+    ``adopt`` is applied to every view the store creates; the library uses
+    it to attach its play observer.
+    """
+
+    def __init__(self, tracks: Iterable[Track] = (), adopt: Optional[Callable[[Track], Track]] = None) -> None:
+        self._adopt = adopt
+        self._strings: ValuePool[str] = ValuePool()
+        self._columns: Dict[str, Any] = {
+            "id": _ObjectColumn(),
+            "title": _TextColumn(),
+            "artist": _PooledColumn(self._strings),
+            "album": _PooledColumn(self._strings),
+            "duration_seconds": _IntColumn(nullable=False),
+            "genre": _PooledColumn(self._strings),
+            "moods": _MoodColumn(self._strings),
+            "bpm": _IntColumn(nullable=True),
+            "last_played": _TimestampColumn(),
+            "play_count": _IntColumn(nullable=False),
+        }
+        self._rows: Dict[str, int] = {}
+        self._free: List[int] = []
+        # Unmapped rows kept for a live view; freed when the view goes away.
+        self._orphans: Dict[int, weakref.ref] = {}
+        self._capacity = 0
+        self._views: weakref.WeakValueDictionary[int, TrackView] = weakref.WeakValueDictionary()
+        for track in tracks:
+            self[track.id] = track
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._rows)
+
+    def __contains__(self, track_id: object) -> bool:
+        return track_id in self._rows
+
+    def __getitem__(self, track_id: str) -> Track:
+        row = self._rows[track_id]
+        view = self._views.get(row)
+        if view is None:
+            view = TrackView.__new__(TrackView)
+            view._store = self
+            view._row = row
+            if self._adopt is not None:
+                self._adopt(view)
+            self._views[row] = view
+        return view
+
+    def __setitem__(self, track_id: str, track: Track) -> None:
+        if track.id != track_id:
+            raise ValueError(f"track id {track.id!r} does not match key {track_id!r}")
+        row = self._rows.get(track_id)
+        if isinstance(track, TrackView) and track._store is self:
+            if track._row != row:
+                self._restore(track_id, track._row)
+            return
+        values = [getattr(track, name) for name in FIELD_NAMES]
+        if row is None or row in self._views:
+            # A live view keeps the values it has; the new ones get a new row.
+            if row is not None:
+                self._orphan(row)
+            row = self._rows[track_id] = self._allocate()
+        for name, value in zip(FIELD_NAMES, values):
+            self._columns[name].set(row, value)
+
+    def __delitem__(self, track_id: str) -> None:
+        self._orphan(self._rows.pop(track_id))
+
+    def reorder(self, order: Iterable[str]) -> None:
+        """Restore iteration order: ids in ``order`` first, then the rest."""
+
+        rows = {track_id: self._rows[track_id] for track_id in order if track_id in self._rows}
+        rows.update(self._rows)
+        self._rows = rows
+
+    def _allocate(self) -> int:
+        if self._free:
+            return self._free.pop()
+        for column in self._columns.values():
+            column.grow()
+        self._capacity += 1
+        return self._capacity - 1
+
+    def _orphan(self, row: int) -> None:
+        view = self._views.get(row)
+        if view is None:
+            self._release(row)
+        else:
+            self._orphans[row] = weakref.ref(view, lambda _, row=row: self._release(row))  # type: ignore[misc]
+
+    def _restore(self, track_id: str, row: int) -> None:
+        """Map ``track_id`` back to the orphaned row of a view handed out earlier."""
+
+        current = self._rows.get(track_id)
+        if current is not None:
+            self._orphan(current)
+        del self._orphans[row]  # dropping the weakref cancels its callback
+        self._rows[track_id] = row
+
+    def _release(self, row: int) -> None:
+        self._orphans.pop(row, None)
+        for column in self._columns.values():
+            column.clear(row)
+        self._free.append(row)
+
+
+__all__ = ["CompactTrackStore", "TrackView", "ValuePool"]
@@ -0,0 +1,192 @@
+"""Warm-library daemon: run CLI commands in one long-lived process.
+
+``cli serve`` loads the library once and keeps it, its indexes and the
+recommendation engine in memory behind a Unix socket. Later CLI runs of
+library commands send their arguments there instead of loading everything
+again, and print the output they get back. The protocol is one JSON line
+each way, ``{"argv", "cwd", "library"}`` and ``{"code", "stdout",
+"stderr"}``. Connections are accepted concurrently but commands run one at
+a time, so all library writes come from a single writer.
+
+Every CLI run imports this module, so it only uses the standard library.
+The socket is created readable and writable by its owner only.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import io
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+import traceback
+from pathlib import Path
+from typing import Callable, List, Optional
+
+SOCKET_SUFFIX = ".sock"
+LISTEN_BACKLOG = 128
+
+Runner = Callable[[List[str]], int]
+
+
+def library_location() -> str:
+    """The library a CLI run would open, resolved like ``library.DEFAULT_STORAGE_LOCATION``."""
+
+    return os.environ.get("ZTSCR_LIBRARY_PATH", str(Path.home() / ".ztcsr_music" / "library.json"))
+
+
+def _location_path(location: str) -> Path:
+    # storage_location_path() without importing the storage backends.
+    return Path(location.split("://", 1)[-1]).expanduser()
+
+
+def socket_path_for(storage_path: Path) -> Path:
+    return storage_path.with_name(storage_path.name + SOCKET_SUFFIX)
+
+
+def default_socket_path() -> Path:
+    """``ZTSCR_DAEMON_SOCKET`` if set, else a socket next to the library."""
+
+    override = os.environ.get("ZTSCR_DAEMON_SOCKET")
+    return Path(override).expanduser() if override else socket_path_for(_location_path(library_location()))
+
+
+def _connect(path: Path) -> Optional[socket.socket]:
+    family = getattr(socket, "AF_UNIX", None)
+    if family is None or not path.exists():
+        return None
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    try:
+        # Blocking, so a full backlog makes the client wait rather than fall
+        # back to running the command beside the daemon.
+        sock.connect(str(path))
+    except (FileNotFoundError, ConnectionRefusedError):
+        sock.close()
+        return None  # no daemon behind a leftover socket file
+    except BaseException:
+        sock.close()
+        raise
+    return sock
+
+
+def forward(argv: List[str], path: Optional[Path] = None) -> Optional[int]:
+    """Run ``argv`` in the daemon and copy its output here.
+
+    Returns the command's exit status, or ``None`` when no daemon for this
+    library is listening and the caller should run the command itself.
+    """
+
+    sock = _connect(path or default_socket_path())
+    if sock is None:
+        return None
+    request = {"argv": argv, "cwd": os.getcwd(), "library": library_location()}
+    with sock, sock.makefile("rb") as reader:
+        sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        line = reader.readline()
+    if not line:
+        print("The daemon closed the connection without replying", file=sys.stderr)
+        return 1
+    reply = json.loads(line)
+    if reply["code"] is None:
+        return None
+    sys.stdout.write(reply["stdout"])
+    sys.stderr.write(reply["stderr"])
+    return reply["code"]
+
+
+# -- Server ------------------------------------------------------------------
+class _Handler(socketserver.StreamRequestHandler):
+    server: _Server
+
+    def handle(self) -> None:
+        try:
+            request = json.loads(self.rfile.readline())
+        except ValueError:
+            return
+        reply = self.server.owner.execute(request)
+        self.wfile.write(json.dumps(reply, ensure_ascii=False).encode("utf-8") + b"\n")
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = LISTEN_BACKLOG
+
+    def __init__(self, path: Path, owner: LibraryDaemon) -> None:
+        self.owner = owner
+        super().__init__(str(path), _Handler)
+
+
+class LibraryDaemon:
+    """Serve ``run(argv)`` calls for one library on a Unix socket.
+
+    ``run`` executes a CLI command against the warm library and returns its
+    exit status; whatever it prints is captured and sent to the client.
+    """
+
+    def __init__(self, socket_path: Path, library_path: Path, run: Runner) -> None:
+        self.socket_path = socket_path
+        self.library_path = library_path
+        self.requests = 0
+        self._run = run
+        self._lock = threading.Lock()
+        self._server: Optional[_Server] = None
+
+    def start(self) -> None:
+        """Bind the socket, replacing one left behind by a daemon that died."""
+
+        if self.socket_path.exists():
+            live = _connect(self.socket_path)
+            if live is not None:
+                live.close()
+                raise RuntimeError(f"another daemon is listening on {self.socket_path}")
+            self.socket_path.unlink()
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True)
+        umask = os.umask(0o177)
+        try:
+            self._server = _Server(self.socket_path, self)
+        finally:
+            os.umask(umask)
+
+    def serve_forever(self) -> None:
+        if self._server is None:
+            self.start()
+        assert self._server is not None
+        self._server.serve_forever(poll_interval=0.2)
+
+    def shutdown(self) -> None:
+        """Stop :meth:`serve_forever`; call from another thread."""
+
+        if self._server is not None:
+            self._server.shutdown()
+
+    def close(self) -> None:
+        if self._server is not None:
+            self._server.server_close()
+            self._server = None
+            self.socket_path.unlink(missing_ok=True)
+
+    def execute(self, request: dict) -> dict:
+        if _location_path(str(request.get("library", ""))).resolve() != self.library_path.resolve():
+            return {"code": None, "stdout": "", "stderr": f"this daemon serves {self.library_path}"}
+        stdout, stderr = io.StringIO(), io.StringIO()
+        with self._lock:
+            previous = os.getcwd()
+            with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+                try:
+                    os.chdir(request.get("cwd") or previous)  # relative paths are the client's
+                    code = self._run(list(request["argv"]))
+                except SystemExit as exc:  # argparse errors and --help
+                    code = 0 if exc.code is None else exc.code if isinstance(exc.code, int) else 1
+                except Exception:
+                    traceback.print_exc()
+                    code = 1
+                finally:
+                    os.chdir(previous)
+            self.requests += 1
+        return {"code": code, "stdout": stdout.getvalue(), "stderr": stderr.getvalue()}
+
+
+__all__ = ["LibraryDaemon", "default_socket_path", "forward", "library_location", "socket_path_for"]
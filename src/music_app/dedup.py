@@ -0,0 +1,393 @@
+"""Near-duplicate track detection with MinHash signatures and LSH banding.
+
+Catalog feeds re-deliver the same recording under new ids with cosmetic
+title changes ("(Remastered)", casing, accents). :class:`DedupIndex` keeps
+a MinHash signature sketch of each track's normalized title, artist and
+album and finds likely duplicates of a new track without comparing it to
+every other track:
+
+* the normalized text is cut into character 3-grams and hashed once each
+  into :data:`NUM_PERM` bins (one-permutation hashing, empty bins filled
+  from their right neighbour), giving a signature whose matching positions
+  estimate the Jaccard similarity of two tracks' 3-gram sets;
+* the signature is split into :data:`BANDS` bands, and tracks sharing at
+  least :data:`MIN_SHARED_BANDS` band hashes become candidates (LSH
+  banding), so a lookup costs one binary search per band whatever the
+  catalog size;
+* candidates are then checked against the live library: duration and BPM
+  within tolerance and an estimated similarity of at least ``threshold``.
+
+Only band keys and ids are kept; candidate signatures are recomputed from
+the library's tracks, so stale entries (removed or re-titled tracks) cost a
+wasted check but never a false match. The index is saved next to the
+library as sorted ``(band key, ordinal)`` arrays plus an id table; entries
+added since the last save are held in per-band dicts and merged on save.
+
+Tracks can reach the library without passing through the index (``add``,
+``migrate``, ``import --duplicates off``, metadata edits), so the saved file
+is stamped with :func:`catalog_stamp` of the library it covers, and an index
+whose stamp no longer matches the library is rebuilt.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import heapq
+import re
+import struct
+import unicodedata
+import zlib
+from array import array
+from bisect import bisect_left
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional, Set, Tuple
+
+from .journal import atomic_write_bytes
+from .library import MusicLibrary, Track
+
+MAGIC = b"ZTDEDUP2"
+# magic, signature length, bands, entry count, then the catalog stamp
+# (track count, digest) of the library the entries cover.
+HEADER = struct.Struct("<8sIIIQQ")
+NUM_PERM = 64  # signature length; a power of two
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+DEFAULT_THRESHOLD = 0.8
+DEFAULT_DURATION_TOLERANCE = 5
+DEFAULT_BPM_TOLERANCE = 2.0
+# Bucket entries examined per band; keeps lookups bounded for very common keys.
+MAX_BUCKET = 64
+# Band hits needed to become a candidate. A pair at the default threshold
+# shares ~6.5 of 16 bands on average and at least 2 over 99% of the time.
+MIN_SHARED_BANDS = 2
+SHINGLE_SIZE = 3
+
+# Words that mark a re-release of the same recording rather than a new one.
+NOISE_WORDS = frozenset(
+    "remaster remastered remastering version mono stereo deluxe edition expanded anniversary bonus track digital "
+    "explicit clean original single album lp".split()
+)
+_FEATURING = frozenset({"feat", "ft", "featuring", "with"})
+_SEGMENT = re.compile(r"\(([^()]*)\)|\[([^\[\]]*)\]|\s[-–—]\s(.*)$")
+_WORD = re.compile(r"\w+")
+_EMPTY = 0xFFFFFFFF
+_SPREAD = 0x9E3779B1  # offsets values borrowed by empty bins
+
+
+def dedup_path_for(library_path: Path) -> Path:
+    return library_path.with_name(library_path.name + ".dedup")
+
+
+def normalize_text(text: str) -> str:
+    """Case- and accent-folded words, without re-release annotations.
+
+    Bracketed or dash-separated parts made only of :data:`NOISE_WORDS` and
+    years ("(2011 Remaster)", "- Mono Version") are dropped, as are
+    featured-artist credits.
+    """
+
+    decomposed = unicodedata.normalize("NFKD", text)
+    text = "".join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+
+    def annotation(match: re.Match) -> str:
+        body = next(group for group in match.groups() if group is not None)
+        words = _WORD.findall(body)
+        if not words or words[0] in _FEATURING or all(word in NOISE_WORDS or word.isdigit() for word in words):
+            return " "
+        return f" {body} "
+
+    return " ".join(_WORD.findall(_SEGMENT.sub(annotation, text)))
+
+
+def shingles(track: Track) -> Set[str]:
+    text = " | ".join(normalize_text(part) for part in (track.title, track.artist, track.album))
+    return {text[start : start + SHINGLE_SIZE] for start in range(max(1, len(text) - SHINGLE_SIZE + 1))}
+
+
+def signature(track: Track) -> Optional[array]:
+    """The track's MinHash signature, or ``None`` if its text is empty.
+
+    Tracks built without the importer's checks may carry ``None`` or other
+    non-string titles, artists or albums; they get no signature either.
+    """
+
+    if not all(isinstance(part, str) for part in (track.title, track.artist, track.album)):
+        return None
+    bins = [_EMPTY] * NUM_PERM
+    mask = NUM_PERM - 1
+    filled = False
+    for shingle in shingles(track):
+        if not shingle.strip(" |"):
+            continue
+        value = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "little")
+        slot, value = value & mask, value >> 32
+        if value < bins[slot]:
+            bins[slot] = value
+            filled = True
+    if not filled:
+        return None
+    sketch = array("I", bins)
+    for slot in range(NUM_PERM):
+        if bins[slot] == _EMPTY:
+            # Borrow from the next bin that hashing filled, offset by distance.
+            distance = 1
+            while bins[(slot + distance) & mask] == _EMPTY:
+                distance += 1
+            sketch[slot] = (bins[(slot + distance) & mask] + distance * _SPREAD) & 0xFFFFFFFF
+    return sketch
+
+
+def catalog_stamp(tracks: Iterable[Track]) -> Tuple[int, int]:
+    """Track count and an order-independent digest of each track's id and indexed text."""
+
+    count = digest = 0
+    for track in tracks:
+        text = "\x00".join(map(str, (track.id, track.title, track.artist, track.album)))
+        digest += zlib.crc32(text.encode("utf-8", "surrogatepass"))
+        count += 1
+    return count, digest & 0xFFFFFFFFFFFFFFFF
+
+
+def similarity(left: array, right: array) -> float:
+    return sum(a == b for a, b in zip(left, right)) / NUM_PERM
+
+
+def band_keys(sketch: array) -> List[int]:
+    return [zlib.crc32(sketch[band * ROWS : (band + 1) * ROWS].tobytes()) for band in range(BANDS)]
+
+
+@dataclass
+class DuplicateMatch:
+    """``track_id`` looks like a re-delivery of ``duplicate_of``."""
+
+    track_id: str
+    duplicate_of: str
+    similarity: float
+
+
+class DedupIndex:
+    """LSH index over a library's tracks; see the module docstring.
+
+    Opening an index whose file does not exist yet, or whose stamp does not
+    match the library, indexes the whole library once. Call :meth:`refresh`
+    before a run of lookups if the library may have changed since, :meth:`add`
+    for each track that enters the library and :meth:`save` once the library
+    changes are committed.
+    """
+
+    def __init__(
+        self,
+        library: MusicLibrary,
+        path: Optional[Path] = None,
+        threshold: float = DEFAULT_THRESHOLD,
+        duration_tolerance: int = DEFAULT_DURATION_TOLERANCE,
+        bpm_tolerance: float = DEFAULT_BPM_TOLERANCE,
+    ) -> None:
+        self.library = library
+        self.path = path
+        self.threshold = threshold
+        self.duration_tolerance = duration_tolerance
+        self.bpm_tolerance = bpm_tolerance
+        # Saved entries: per band, keys sorted with their ordinals alongside.
+        self._keys: List[array] = [array("I") for _ in range(BANDS)]
+        self._ordinals: List[array] = [array("I") for _ in range(BANDS)]
+        self._id_offsets = array("Q", [0])
+        self._id_blob = b""
+        # Entries added since the last save.
+        self._new_ids: List[str] = []
+        self._pending: List[Dict[int, List[int]]] = [{} for _ in range(BANDS)]
+        # The catalog stamp the entries cover, and the library's
+        # catalog_version when it was last known to match.
+        self._stamp: Tuple[int, int] = (0, 0)
+        self._synced_version: Optional[int] = None
+        if path is not None and path.exists():
+            self._load(path)
+            self.refresh()
+        else:
+            self.rebuild()
+
+    def __len__(self) -> int:
+        return len(self._id_offsets) - 1 + len(self._new_ids)
+
+    # -- Lookup ------------------------------------------------------------
+    def match(self, track: Track, unsaved: Optional[Mapping[str, Track]] = None) -> Optional[DuplicateMatch]:
+        """The most similar indexed track that ``track`` duplicates, if any.
+
+        ``unsaved`` resolves ids that are indexed but not in the library yet,
+        such as earlier tracks of the batch being imported.
+        """
+
+        sketch = signature(track)
+        if sketch is None:
+            return None
+        best: Optional[DuplicateMatch] = None
+        for candidate_id in self._candidates(band_keys(sketch)):
+            if candidate_id == track.id:
+                continue
+            candidate = unsaved.get(candidate_id) if unsaved else None
+            if candidate is None:
+                try:
+                    candidate = self.library.get_track(candidate_id)
+                except KeyError:
+                    continue  # removed since it was indexed
+            if not self._compatible(track, candidate):
+                continue
+            candidate_sketch = signature(candidate)
+            if candidate_sketch is None:
+                continue
+            score = similarity(sketch, candidate_sketch)
+            if score >= self.threshold and (best is None or score > best.similarity):
+                best = DuplicateMatch(track.id, candidate_id, score)
+        return best
+
+    def _compatible(self, track: Track, candidate: Track) -> bool:
+        if abs(track.duration_seconds - candidate.duration_seconds) > self.duration_tolerance:
+            return False
+        if track.bpm is not None and candidate.bpm is not None:
+            return abs(track.bpm - candidate.bpm) <= self.bpm_tolerance
+        return True
+
+    def _candidates(self, keys: List[int]) -> Iterator[str]:
+        """Ids sharing at least :data:`MIN_SHARED_BANDS` band keys with ``keys``."""
+
+        hits: Dict[int, int] = {}
+        for band, key in enumerate(keys):
+            saved_keys, saved_ordinals = self._keys[band], self._ordinals[band]
+            position = bisect_left(saved_keys, key)
+            stop = min(len(saved_keys), position + MAX_BUCKET)
+            while position < stop and saved_keys[position] == key:
+                ordinal = saved_ordinals[position]
+                hits[ordinal] = hits.get(ordinal, 0) + 1
+                position += 1
+            for ordinal in self._pending[band].get(key, ())[:MAX_BUCKET]:
+                hits[ordinal] = hits.get(ordinal, 0) + 1
+        for ordinal, count in hits.items():
+            if count >= MIN_SHARED_BANDS:
+                yield self._id(ordinal)
+
+    def _id(self, ordinal: int) -> str:
+        saved = len(self._id_offsets) - 1
+        if ordinal >= saved:
+            return self._new_ids[ordinal - saved]
+        return self._id_blob[self._id_offsets[ordinal] : self._id_offsets[ordinal + 1]].decode("utf-8")
+
+    # -- Updates -----------------------------------------------------------
+    def add(self, track: Track) -> bool:
+        """Index ``track``; returns ``False`` if it has no usable text.
+
+        Re-adding an id after its metadata changed is fine: older entries
+        only produce candidates that are re-checked against the library.
+        """
+
+        sketch = signature(track)
+        if sketch is None:
+            return False
+        ordinal = len(self)
+        self._new_ids.append(track.id)
+        for band, key in enumerate(band_keys(sketch)):
+            self._pending[band].setdefault(key, []).append(ordinal)
+        return True
+
+    def add_many(self, tracks: Iterable[Track]) -> int:
+        return sum(self.add(track) for track in tracks)
+
+    def refresh(self) -> bool:
+        """Rebuild if the library no longer matches the index; returns whether it did."""
+
+        version = self.library.catalog_version
+        if version == self._synced_version:
+            return False
+        if catalog_stamp(self.library.list_tracks()) != self._stamp:
+            self.rebuild()
+            return True
+        self._synced_version = version
+        return False
+
+    def rebuild(self) -> None:
+        """Drop every entry and index the library's current tracks."""
+
+        self._keys = [array("I") for _ in range(BANDS)]
+        self._ordinals = [array("I") for _ in range(BANDS)]
+        self._id_offsets = array("Q", [0])
+        self._id_blob = b""
+        self._new_ids = []
+        self._pending = [{} for _ in range(BANDS)]
+        tracks = self.library.list_tracks()
+        self.add_many(tracks)
+        self._stamp = catalog_stamp(tracks)
+        self._synced_version = self.library.catalog_version
+
+    # -- Persistence -------------------------------------------------------
+    def save(self, path: Optional[Path] = None) -> None:
+        """Write the index, stamped as covering the library's current tracks."""
+
+        path = path or self.path
+        if path is None:
+            raise ValueError("DedupIndex has no path to save to")
+        self._merge_pending()
+        self._stamp = catalog_stamp(self.library.list_tracks())
+        self._synced_version = self.library.catalog_version
+        header = HEADER.pack(MAGIC, NUM_PERM, BANDS, len(self), *self._stamp)
+        parts = [header, self._id_offsets.tobytes(), self._id_blob]
+        for keys, ordinals in zip(self._keys, self._ordinals):
+            parts.extend((keys.tobytes(), ordinals.tobytes()))
+        atomic_write_bytes(path, b"".join(parts))
+
+    def _merge_pending(self) -> None:
+        if not self._new_ids:
+            return
+        encoded = [track_id.encode("utf-8") for track_id in self._new_ids]
+        offset = self._id_offsets[-1]
+        for raw in encoded:
+            offset += len(raw)
+            self._id_offsets.append(offset)
+        self._id_blob += b"".join(encoded)
+        self._new_ids = []
+        for band, pending in enumerate(self._pending):
+            added = sorted((key, ordinal) for key, ordinals in pending.items() for ordinal in ordinals)
+            merged = heapq.merge(zip(self._keys[band], self._ordinals[band]), added)
+            keys, ordinals = array("I"), array("I")
+            for key, ordinal in merged:
+                keys.append(key)
+                ordinals.append(ordinal)
+            self._keys[band], self._ordinals[band] = keys, ordinals
+        self._pending = [{} for _ in range(BANDS)]
+
+    def _load(self, path: Path) -> None:
+        data = path.read_bytes()
+        if not data.startswith(MAGIC[:-1]):
+            raise ValueError(f"{path} is not a dedup index")
+        if not data.startswith(MAGIC):
+            self.rebuild()  # an older file format
+            return
+        magic, num_perm, bands, count, *stamp = HEADER.unpack_from(data, 0)
+        if (num_perm, bands) != (NUM_PERM, BANDS):
+            # Built with other parameters: its band keys are not comparable.
+            self.rebuild()
+            return
+        self._stamp = (stamp[0], stamp[1])
+        offset = HEADER.size
+        self._id_offsets = array("Q")
+        self._id_offsets.frombytes(data[offset : offset + 8 * (count + 1)])
+        offset += 8 * (count + 1)
+        blob_length = self._id_offsets[-1]
+        self._id_blob = data[offset : offset + blob_length]
+        offset += blob_length
+        for band in range(BANDS):
+            for column in (self._keys[band], self._ordinals[band]):
+                column.frombytes(data[offset : offset + 4 * count])
+                offset += 4 * count
+
+
+__all__ = [
+    "BANDS",
+    "DedupIndex",
+    "DuplicateMatch",
+    "NUM_PERM",
+    "catalog_stamp",
+    "dedup_path_for",
+    "normalize_text",
+    "signature",
+    "similarity",
+]
@@ -0,0 +1,201 @@
+"""Constraint-based "flow" playlist generation.
+
+:class:`PlaylistGenerator` grows a playlist from a seed track with a beam
+search. Each step only looks at tracks inside the allowed BPM window around
+the previous track, read nearest-first from the library's sorted BPM index,
+so a step costs O(log n + candidates) however large the library is. Mood and
+genre constraints are resolved once per call against the hash indexes into a
+BPM-sorted candidate bucket.
+"""
+
+from __future__ import annotations
+
+import heapq
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Dict, FrozenSet, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from .indexes import HashIndex, SortedEntries, SortedIndex
+from .library import MusicLibrary, Track
+from .playlist import Playlist
+
+if TYPE_CHECKING:
+    from .player import MusicPlayer
+
+DEFAULT_CROSSFADE_SECONDS = 5
+# Guards duration targets against libraries of near-zero-length tracks.
+MAX_FLOW_LENGTH = 10_000
+
+
+def wall_clock_seconds(tracks: Sequence[Track], crossfade_seconds: int) -> int:
+    """Playing time of ``tracks`` back to back, as :class:`MusicPlayer` schedules them.
+
+    Each transition overlaps the outgoing track by
+    ``min(crossfade_seconds, outgoing duration)``.
+    """
+
+    total = sum(track.duration_seconds for track in tracks)
+    return total - sum(min(crossfade_seconds, track.duration_seconds) for track in tracks[:-1])
+
+
+@dataclass
+class FlowSpec:
+    """Constraints for a generated playlist.
+
+    Give exactly one of ``length`` (tracks, seed included) or
+    ``duration_seconds`` (wall-clock target). Consecutive tracks change BPM by
+    ``min_bpm_step`` to ``max_bpm_step``, preferring ``target_bpm_step``.
+    Empty ``moods`` or ``genres`` allow any; moods match if a track has at
+    least one of them. The seed itself is always the first track.
+    """
+
+    length: Optional[int] = None
+    duration_seconds: Optional[int] = None
+    min_bpm_step: float = -5.0
+    max_bpm_step: float = 5.0
+    target_bpm_step: float = 0.0
+    moods: Sequence[str] = ()
+    genres: Sequence[str] = ()
+    beam_width: int = 8
+    branching: int = 4
+
+    def validate(self) -> None:
+        if (self.length is None) == (self.duration_seconds is None):
+            raise ValueError("give exactly one of length or duration_seconds")
+        if self.min_bpm_step > self.max_bpm_step:
+            raise ValueError("min_bpm_step must not exceed max_bpm_step")
+        if self.beam_width < 1 or self.branching < 1:
+            raise ValueError("beam_width and branching must be positive")
+
+
+class _State(NamedTuple):
+    score: float
+    wall: int
+    length: int
+    track: Track
+    used: FrozenSet[str]
+    path: Optional[tuple]  # (track_id, parent path) links, newest first
+
+    def track_ids(self) -> List[str]:
+        ids: List[str] = []
+        node = self.path
+        while node is not None:
+            ids.append(node[0])
+            node = node[1]
+        ids.reverse()
+        return ids
+
+
+class PlaylistGenerator:
+    """Beam search over BPM-adjacent candidates; see :class:`FlowSpec`."""
+
+    def __init__(self, library: MusicLibrary, crossfade_seconds: int = DEFAULT_CROSSFADE_SECONDS) -> None:
+        self.library = library
+        self.crossfade_seconds = crossfade_seconds
+        self._buckets: Dict[Tuple[FrozenSet[str], FrozenSet[str]], Tuple[int, SortedEntries]] = {}
+
+    @classmethod
+    def for_player(cls, player: MusicPlayer) -> PlaylistGenerator:
+        return cls(player.library, crossfade_seconds=player.crossfade_seconds)
+
+    def generate(self, seed_id: str, spec: FlowSpec, name: Optional[str] = None) -> Playlist:
+        spec.validate()
+        seed = self.library.get_track(seed_id)
+        if seed.bpm is None:
+            raise ValueError(f"Seed track {seed_id!r} has no bpm")
+        candidates = self._candidates(spec)
+        seed_moods = frozenset(mood.lower() for mood in seed.moods)
+        target_step = min(max(spec.target_bpm_step, spec.min_bpm_step), spec.max_bpm_step)
+        span = max(1.0, spec.max_bpm_step - spec.min_bpm_step)
+
+        start = _State(0.0, seed.duration_seconds, 1, seed, frozenset({seed.id}), (seed.id, None))
+        best = start
+        beam = [start]
+        while beam:
+            children: List[_State] = []
+            for state in beam:
+                if self._rank(state, spec) > self._rank(best, spec):
+                    best = state
+                if self._done(state, spec):
+                    continue
+                overlap = min(self.crossfade_seconds, state.track.duration_seconds)
+                bpm = state.track.bpm
+                assert bpm is not None
+                window = _nearest(candidates, bpm + target_step, bpm + spec.min_bpm_step, bpm + spec.max_bpm_step)
+                for track in self._expand(window, state.used, spec.branching):
+                    assert track.bpm is not None
+                    step_cost = abs(track.bpm - bpm - target_step) / span
+                    moods = frozenset(mood.lower() for mood in track.moods)
+                    mood_fit = len(moods & seed_moods) / len(moods | seed_moods) if moods or seed_moods else 1.0
+                    genre_fit = 0.25 if track.genre == state.track.genre else 0.0
+                    children.append(
+                        _State(
+                            state.score + mood_fit + genre_fit - step_cost,
+                            state.wall - overlap + track.duration_seconds,
+                            state.length + 1,
+                            track,
+                            state.used | {track.id},
+                            (track.id, state.path),
+                        )
+                    )
+            beam = heapq.nlargest(spec.beam_width, children, key=lambda state: state.score)
+        return Playlist(name=name or f"{seed.title} flow", track_ids=best.track_ids())
+
+    # -- Candidates --------------------------------------------------------
+    def _candidates(self, spec: FlowSpec) -> SortedEntries:
+        library = self.library
+        bpm_index = library._index("sorted:bpm", lambda: SortedIndex("bpm"))
+        if not spec.moods and not spec.genres:
+            return bpm_index.entries()
+        key = (frozenset(mood.lower() for mood in spec.moods), frozenset(genre.lower() for genre in spec.genres))
+        cached = self._buckets.get(key)
+        if cached is not None and cached[0] == library.catalog_version:
+            return cached[1]
+        allowed: Optional[set] = None
+        if spec.genres:
+            allowed = library._index("hash:genre", lambda: HashIndex("genre")).lookup(spec.genres)
+        if spec.moods:
+            by_mood = library._index("hash:moods", lambda: HashIndex("moods")).lookup(spec.moods)
+            allowed = by_mood if allowed is None else allowed & by_mood
+        bucket = bpm_index.entries(allowed)
+        self._buckets[key] = (library.catalog_version, bucket)
+        return bucket
+
+    def _expand(self, window: Iterator[tuple], used: FrozenSet[str], branching: int) -> Iterator[Track]:
+        produced = 0
+        for _, _, track_id in window:
+            if track_id in used:
+                continue
+            yield self.library.get_track(track_id)
+            produced += 1
+            if produced >= branching:
+                return
+
+    @staticmethod
+    def _done(state: _State, spec: FlowSpec) -> bool:
+        if state.length >= MAX_FLOW_LENGTH:
+            return True
+        if spec.length is not None:
+            return state.length >= spec.length
+        assert spec.duration_seconds is not None
+        return state.wall >= spec.duration_seconds
+
+    @staticmethod
+    def _rank(state: _State, spec: FlowSpec) -> Tuple[float, float]:
+        if spec.length is not None:
+            return min(state.length, spec.length), state.score
+        assert spec.duration_seconds is not None
+        return -abs(state.wall - spec.duration_seconds), state.score
+
+
+def _nearest(entries: SortedEntries, target: float, low: float, high: float) -> Iterator[tuple]:
+    """``(bpm, ordinal, id)`` entries with ``low <= bpm <= high``, nearest to ``target`` first."""
+
+    start = entries.bisect_left((low,))
+    stop = entries.bisect_right((high, float("inf")))
+    pivot = min(max(entries.bisect_left((target,)), start), stop)
+    above = entries.islice(pivot, stop)
+    below = entries.islice(start, pivot, reverse=True)
+    return heapq.merge(above, below, key=lambda entry: abs(entry[0] - target))
+
+
+__all__ = ["FlowSpec", "PlaylistGenerator", "wall_clock_seconds", "DEFAULT_CROSSFADE_SECONDS", "MAX_FLOW_LENGTH"]
@@ -0,0 +1,393 @@
+"""Durable, time-indexed playback history.
+
+Events are appended as JSON lines to numbered segment files in a directory
+next to the library::
+
+    00000001.log   one event per line: {"t": epoch µs, "a": action, "id": ..., "m": ...}
+    00000001.idx   sparse index: one fixed-size entry per block of events
+    daily.json     per-track daily play counts rolled up from expired segments
+
+Each index entry covers ``block_events`` consecutive lines and records their
+byte range, their minimum and maximum timestamp (player timestamps are not
+monotonic: a crossfade steps back in time) and 64-bit masks of their track
+ids and actions. Queries skip whole segments and blocks whose range or masks
+cannot match and only read the rest. Appends are buffered and written in
+groups (``flush_events`` events or ``flush_interval`` seconds); a torn tail
+left by a crash is ignored on read and truncated before the next append.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import struct
+import time
+import zlib
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple
+
+from . import metrics
+from .journal import atomic_write_bytes
+from .player import PlaybackEvent
+
+HISTORY_SUFFIX = ".history"
+DAILY_NAME = "daily.json"
+DEFAULT_SEGMENT_BYTES = 4 * 1024 * 1024
+DEFAULT_BLOCK_EVENTS = 256
+DEFAULT_FLUSH_EVENTS = 64
+DEFAULT_FLUSH_INTERVAL = 1.0
+_RETENTION_DAYS = os.environ.get("ZTSCR_HISTORY_RETENTION_DAYS", "")
+DEFAULT_RETENTION = timedelta(days=float(_RETENTION_DAYS)) if _RETENTION_DAYS else None
+BLOCK = struct.Struct("<qqQIQQ")  # min µs, max µs, offset, length, track mask, action mask
+EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def history_path_for(library_path: Path) -> Path:
+    return library_path.with_name(library_path.name + HISTORY_SUFFIX)
+
+
+def _micros(moment: datetime) -> int:
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return (moment - EPOCH) // _MICROSECOND
+
+
+def _bit(text: str) -> int:
+    return 1 << (zlib.crc32(text.encode("utf-8")) & 63)
+
+
+@dataclass
+class _Block:
+    offset: int
+    low: int = 0
+    high: int = 0
+    length: int = 0
+    tracks: int = 0
+    actions: int = 0
+    count: int = 0
+
+    def add(self, micros: int, action: str, track_id: Optional[str], size: int) -> None:
+        if self.count == 0 or micros < self.low:
+            self.low = micros
+        if self.count == 0 or micros > self.high:
+            self.high = micros
+        self.length += size
+        self.actions |= _bit(action)
+        if track_id is not None:
+            self.tracks |= _bit(track_id)
+        self.count += 1
+
+    def pack(self) -> bytes:
+        return BLOCK.pack(self.low, self.high, self.offset, self.length, self.tracks, self.actions)
+
+    def matches(self, low: Optional[int], high: Optional[int], tracks: int, actions: int) -> bool:
+        if low is not None and self.high < low:
+            return False
+        if high is not None and self.low >= high:
+            return False
+        return (self.tracks & tracks) == tracks and (self.actions & actions) == actions
+
+
+@dataclass
+class _Segment:
+    number: int
+    directory: Path
+    blocks: List[_Block] = field(default_factory=list)
+    tail: Optional[_Block] = None  # unindexed lines after the last block
+
+    @property
+    def log_path(self) -> Path:
+        return self.directory / f"{self.number:08d}.log"
+
+    @property
+    def idx_path(self) -> Path:
+        return self.directory / f"{self.number:08d}.idx"
+
+    def summary(self) -> _Block:
+        summary = _Block(0)
+        for block in self.all_blocks():
+            if block.count:
+                summary.low = block.low if summary.count == 0 else min(summary.low, block.low)
+                summary.high = block.high if summary.count == 0 else max(summary.high, block.high)
+                summary.count += block.count
+            summary.tracks |= block.tracks
+            summary.actions |= block.actions
+        return summary
+
+    def all_blocks(self) -> List[_Block]:
+        return self.blocks + ([self.tail] if self.tail is not None and self.tail.count else [])
+
+
+def _load_segment(segment: _Segment) -> None:
+    data = segment.idx_path.read_bytes() if segment.idx_path.exists() else b""
+    segment.blocks = []
+    for position in range(0, len(data) - len(data) % BLOCK.size, BLOCK.size):
+        low, high, offset, length, tracks, actions = BLOCK.unpack_from(data, position)
+        # Count is not stored; any non-zero value marks the block as populated.
+        segment.blocks.append(_Block(offset, low, high, length, tracks, actions, count=1))
+    start = segment.blocks[-1].offset + segment.blocks[-1].length if segment.blocks else 0
+    tail = _Block(start)
+    if segment.log_path.exists():
+        with segment.log_path.open("rb") as fh:
+            fh.seek(start)
+            for raw in fh:
+                record = _decode(raw)
+                if record is None:
+                    break
+                tail.add(record["t"], record["a"], record.get("id"), len(raw))
+    segment.tail = tail
+
+
+def _decode(raw: bytes) -> Optional[dict]:
+    if not raw.endswith(b"\n"):
+        return None
+    try:
+        return json.loads(raw)
+    except json.JSONDecodeError:
+        return None
+
+
+def _event(record: dict) -> PlaybackEvent:
+    return PlaybackEvent(
+        timestamp=EPOCH + record["t"] * _MICROSECOND,
+        action=record["a"],
+        track_id=record.get("id"),
+        metadata=record.get("m"),
+    )
+
+
+class HistoryLog:
+    """Append-only, segmented playback event log with range queries.
+
+    With ``retention`` set, segments whose newest event is older than
+    ``retention`` before the newest logged event are rolled up into daily
+    per-track play counts and deleted whenever a segment is completed.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        segment_bytes: int = DEFAULT_SEGMENT_BYTES,
+        block_events: int = DEFAULT_BLOCK_EVENTS,
+        flush_events: int = DEFAULT_FLUSH_EVENTS,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        retention: Optional[timedelta] = DEFAULT_RETENTION,
+        fsync: bool = True,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.path = path
+        self.segment_bytes = segment_bytes
+        self.block_events = block_events
+        self.flush_events = flush_events
+        self.flush_interval = flush_interval
+        self.retention = retention
+        self.fsync = fsync
+        self._clock = clock
+        self._segments: List[_Segment] = []
+        if path.exists():
+            numbers = sorted(int(child.stem) for child in path.glob("*.log") if child.stem.isdigit())
+            self._segments = [_Segment(number, path) for number in numbers]
+            for segment in self._segments:
+                _load_segment(segment)
+        self._pending: List[bytes] = []
+        self._pending_since = 0.0
+        self._fh: Optional[BinaryIO] = None
+        summaries = [segment.summary() for segment in self._segments]
+        self._newest: Optional[int] = max((summary.high for summary in summaries if summary.count), default=None)
+
+    # -- Writing -----------------------------------------------------------
+    def append(self, event: PlaybackEvent) -> None:
+        record: dict = {"t": _micros(event.timestamp), "a": event.action}
+        if event.track_id is not None:
+            record["id"] = event.track_id
+        if event.metadata:
+            record["m"] = event.metadata
+        raw = json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+        segment = self._active()
+        assert segment.tail is not None
+        segment.tail.add(record["t"], event.action, event.track_id, len(raw))
+        if self._newest is None or record["t"] > self._newest:
+            self._newest = record["t"]
+        if not self._pending:
+            self._pending_since = self._clock()
+        self._pending.append(raw)
+        if len(self._pending) >= self.flush_events or self._clock() - self._pending_since >= self.flush_interval:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write buffered events, then index entries for completed blocks."""
+
+        if not self._pending:
+            return
+        segment = self._active()
+        tail = segment.tail
+        assert tail is not None
+        data = b"".join(self._pending)
+        fh = self._open(segment, valid_size=tail.offset + tail.length - len(data))
+        fh.write(data)
+        fh.flush()
+        if self.fsync:
+            os.fsync(fh.fileno())
+        self._pending.clear()
+        metrics.inc("music_bytes_written_total", len(data), file="history")
+        if tail.count >= self.block_events or tail.offset + tail.length >= self.segment_bytes:
+            self._seal(segment)
+        if tail.offset + tail.length >= self.segment_bytes:
+            self._rotate()
+
+    def close(self) -> None:
+        self.flush()
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+    def _active(self) -> _Segment:
+        if not self._segments:
+            self._segments.append(_Segment(1, self.path, tail=_Block(0)))
+        return self._segments[-1]
+
+    def _open(self, segment: _Segment, valid_size: int) -> BinaryIO:
+        if self._fh is None:
+            self.path.mkdir(parents=True, exist_ok=True)
+            self._fh = segment.log_path.open("ab")
+            if self._fh.tell() > valid_size:
+                self._fh.truncate(valid_size)  # drop a torn tail
+        return self._fh
+
+    def _seal(self, segment: _Segment) -> None:
+        tail = segment.tail
+        assert tail is not None
+        if tail.count == 0:
+            return
+        with segment.idx_path.open("ab") as fh:
+            fh.truncate(len(segment.blocks) * BLOCK.size)
+            fh.write(tail.pack())
+            fh.flush()
+            if self.fsync:
+                os.fsync(fh.fileno())
+        segment.blocks.append(tail)
+        segment.tail = _Block(tail.offset + tail.length)
+
+    def _rotate(self) -> None:
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+        self._segments.append(_Segment(self._segments[-1].number + 1, self.path, tail=_Block(0)))
+        if self.retention is not None and self._newest is not None:
+            self.rollup(EPOCH + self._newest * _MICROSECOND - self.retention)
+
+    # -- Queries -----------------------------------------------------------
+    def query(
+        self,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        track_id: Optional[str] = None,
+        action: Optional[str] = None,
+        limit: Optional[int] = None,
+    ) -> List[PlaybackEvent]:
+        """Events with ``since <= timestamp < until`` in log order; the last ``limit`` if given."""
+
+        self.flush()
+        low = _micros(since) if since is not None else None
+        high = _micros(until) if until is not None else None
+        tracks = _bit(track_id) if track_id is not None else 0
+        actions = _bit(action) if action is not None else 0
+        found: List[List[PlaybackEvent]] = []
+        total = 0
+        for segment in reversed(self._segments):
+            if not segment.summary().matches(low, high, tracks, actions):
+                continue
+            for block in reversed(segment.all_blocks()):
+                if not block.matches(low, high, tracks, actions):
+                    continue
+                matches = [
+                    _event(record)
+                    for record in self._read(segment, block)
+                    if (low is None or record["t"] >= low)
+                    and (high is None or record["t"] < high)
+                    and (track_id is None or record.get("id") == track_id)
+                    and (action is None or record["a"] == action)
+                ]
+                found.append(matches)
+                total += len(matches)
+                if limit is not None and total >= limit:
+                    break
+            if limit is not None and total >= limit:
+                break
+        events = [event for matches in reversed(found) for event in matches]
+        if limit is not None:
+            events = events[-limit:] if limit > 0 else []
+        return events
+
+    def segment_count(self) -> int:
+        return len(self._segments)
+
+    @staticmethod
+    def _read(segment: _Segment, block: _Block) -> Iterator[dict]:
+        with segment.log_path.open("rb") as fh:
+            fh.seek(block.offset)
+            data = fh.read(block.length)
+        for raw in data.splitlines(keepends=True):
+            record = _decode(raw)
+            if record is not None:
+                yield record
+
+    # -- Retention ---------------------------------------------------------
+    def rollup(self, before: datetime) -> int:
+        """Fold segments whose events all precede ``before`` into daily play counts and delete them.
+
+        The active segment is never rolled up. Returns the number of segments removed.
+        """
+
+        cutoff = _micros(before)
+        expired = [segment for segment in self._segments[:-1] if segment.summary().high < cutoff]
+        if not expired:
+            return 0
+        state = self._daily_state()
+        rolled = set(state["segments"])
+        days: Dict[str, Dict[str, int]] = state["days"]
+        for segment in expired:
+            if segment.number in rolled:
+                continue
+            for block in segment.all_blocks():
+                for record in self._read(segment, block):
+                    if record["a"] == "play" and record.get("id") is not None:
+                        day = (EPOCH + record["t"] * _MICROSECOND).date().isoformat()
+                        counts = days.setdefault(day, {})
+                        counts[record["id"]] = counts.get(record["id"], 0) + 1
+            rolled.add(segment.number)
+        state["segments"] = sorted(rolled)
+        atomic_write_bytes(self.path / DAILY_NAME, json.dumps(state, sort_keys=True).encode("utf-8"))
+        for segment in expired:
+            segment.log_path.unlink(missing_ok=True)
+            segment.idx_path.unlink(missing_ok=True)
+            self._segments.remove(segment)
+        return len(expired)
+
+    def daily_counts(
+        self, track_id: Optional[str] = None, since: Optional[date] = None, until: Optional[date] = None
+    ) -> List[Tuple[str, str, int]]:
+        """Rolled-up ``(day, track_id, plays)`` rows for ``since <= day < until``, sorted by day."""
+
+        rows: List[Tuple[str, str, int]] = []
+        for day, counts in sorted(self._daily_state()["days"].items()):
+            if since is not None and day < since.isoformat():
+                continue
+            if until is not None and day >= until.isoformat():
+                continue
+            for counted_id, plays in sorted(counts.items()):
+                if track_id is None or counted_id == track_id:
+                    rows.append((day, counted_id, plays))
+        return rows
+
+    def _daily_state(self) -> dict:
+        path = self.path / DAILY_NAME
+        if not path.exists():
+            return {"segments": [], "days": {}}
+        return json.loads(path.read_text("utf-8"))
+
+
+__all__ = ["HistoryLog", "history_path_for", "HISTORY_SUFFIX", "DEFAULT_SEGMENT_BYTES"]
@@ -0,0 +1,327 @@
+"""Streaming track importer for large JSON and NDJSON catalog dumps."""
+
+from __future__ import annotations
+
+import json
+from concurrent.futures import Future, ProcessPoolExecutor
+from collections import deque
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Deque, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from .library import MusicLibrary, Track
+
+if TYPE_CHECKING:
+    from .dedup import DedupIndex, DuplicateMatch
+
+READ_CHUNK_SIZE = 1 << 16
+DEFAULT_BATCH_SIZE = 5000
+DEFAULT_CHUNK_SIZE = 1000
+NDJSON_SUFFIXES = {".ndjson", ".jsonl"}
+
+# A raw record is either an undecoded NDJSON line or an already decoded value.
+RawRecord = Tuple[int, object]
+
+
+@dataclass
+class RecordError:
+    """A record that could not be imported, identified by its 1-based position."""
+
+    record: int
+    message: str
+
+
+@dataclass
+class ImportReport:
+    """Running totals of a streaming import."""
+
+    records: int = 0
+    inserted: int = 0
+    overwritten: int = 0
+    skipped: int = 0
+    failed: int = 0
+    merged: int = 0
+    errors: List[RecordError] = field(default_factory=list)
+    duplicates: List[DuplicateMatch] = field(default_factory=list)
+
+    @property
+    def imported(self) -> int:
+        return self.inserted + self.overwritten
+
+
+def track_from_payload(data: object) -> Track:
+    """Validate a decoded track record and build a :class:`Track` from it."""
+
+    if not isinstance(data, dict):
+        raise ValueError(f"expected a JSON object, got {type(data).__name__}")
+    for key in ("id", "title"):
+        if not isinstance(data.get(key), str) or not data[key]:
+            raise ValueError(f"missing or invalid {key!r}")
+    for key in ("artist", "album", "genre"):
+        if not isinstance(data.get(key, "Unknown"), str):
+            raise ValueError(f"{key!r} must be a string")
+    moods = data.get("moods", [])
+    if not isinstance(moods, list) or not all(isinstance(mood, str) for mood in moods):
+        raise ValueError("'moods' must be a list of strings")
+    bpm = data.get("bpm")
+    try:
+        duration = int(data.get("duration_seconds", 0))
+        bpm = None if bpm is None else int(bpm)
+    except (TypeError, ValueError) as exc:
+        raise ValueError(f"invalid numeric field: {exc}") from exc
+    return Track(
+        id=data["id"],
+        title=data["title"],
+        artist=data.get("artist", "Unknown"),
+        album=data.get("album", "Unknown"),
+        duration_seconds=duration,
+        genre=data.get("genre", "Unknown"),
+        moods=moods,
+        bpm=bpm,
+    )
+
+
+def detect_format(path: Path) -> str:
+    if path.suffix.lower() in NDJSON_SUFFIXES:
+        return "ndjson"
+    with path.open("r", encoding="utf-8") as fh:
+        while True:
+            chunk = fh.read(256)
+            if not chunk:
+                return "json"
+            stripped = chunk.lstrip()
+            if stripped:
+                return "json" if stripped[0] == "[" else "ndjson"
+
+
+def iter_ndjson(fh: TextIO) -> Iterator[RawRecord]:
+    """Yield non-blank lines undecoded so decoding can happen in workers."""
+
+    for number, line in enumerate(fh, start=1):
+        if line.strip():
+            yield number, line
+
+
+def iter_json_array(fh: TextIO, read_size: int = READ_CHUNK_SIZE) -> Iterator[RawRecord]:
+    """Incrementally decode the elements of a top-level JSON array."""
+
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    eof = False
+
+    def fill() -> bool:
+        nonlocal buffer, pos, eof
+        chunk = fh.read(read_size)
+        if not chunk:
+            eof = True
+            return False
+        buffer = buffer[pos:] + chunk
+        pos = 0
+        return True
+
+    def skip_whitespace() -> bool:
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos].isspace():
+                pos += 1
+            if pos < len(buffer):
+                return True
+            if not fill():
+                return False
+
+    if not skip_whitespace() or buffer[pos] != "[":
+        raise ValueError("expected a JSON array of track objects")
+    pos += 1
+    number = 0
+    while True:
+        if not skip_whitespace():
+            raise ValueError("unterminated JSON array")
+        if buffer[pos] == "]":
+            return
+        if number and buffer[pos] == ",":
+            pos += 1
+            if not skip_whitespace():
+                raise ValueError("unterminated JSON array")
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof or not fill():
+                    raise ValueError(f"malformed JSON near element {number + 1}") from None
+                continue
+            # A value ending exactly at the buffer edge may be a truncated number.
+            if end == len(buffer) and not eof and fill():
+                continue
+            break
+        number += 1
+        pos = end
+        yield number, value
+
+
+def validate_records(chunk: List[RawRecord]) -> Tuple[List[Track], List[RecordError]]:
+    """Decode and validate a chunk of raw records; runs in worker processes."""
+
+    tracks: List[Track] = []
+    errors: List[RecordError] = []
+    for number, raw in chunk:
+        try:
+            data = json.loads(raw) if isinstance(raw, str) else raw
+            tracks.append(track_from_payload(data))
+        except (ValueError, TypeError) as exc:
+            errors.append(RecordError(number, str(exc)))
+    return tracks, errors
+
+
+def _chunked(records: Iterable[RawRecord], size: int) -> Iterator[List[RawRecord]]:
+    chunk: List[RawRecord] = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class StreamingImporter:
+    """Parse, validate and load a catalog file without holding it in memory.
+
+    Records are validated in chunks, optionally across a process pool, and
+    handed to the library in bounded batches. Invalid records are reported in
+    :attr:`ImportReport.errors` (up to ``max_errors``) instead of aborting.
+
+    Each batch commits on its own: if the import stops early (the source or
+    the library raises), the batches before it stay imported on every
+    backend. Plain JSON storage, which rewrites the whole file per commit,
+    is written once at the end instead of once per batch.
+
+    With a ``dedup`` index, each track is checked for near-duplicates of
+    tracks already indexed (including earlier tracks of the same import) and
+    reported in :attr:`ImportReport.duplicates`; ``merge_duplicates`` drops
+    them instead of importing them under their new ids.
+    """
+
+    def __init__(
+        self,
+        library: MusicLibrary,
+        overwrite: bool = True,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        workers: int = 0,
+        max_errors: int = 1000,
+        progress: Optional[Callable[[ImportReport], None]] = None,
+        dedup: Optional[DedupIndex] = None,
+        merge_duplicates: bool = False,
+    ) -> None:
+        self.library = library
+        self.overwrite = overwrite
+        self.batch_size = max(1, batch_size)
+        self.chunk_size = max(1, chunk_size)
+        self.workers = workers
+        self.max_errors = max_errors
+        self.progress = progress
+        self.dedup = dedup
+        self.merge_duplicates = merge_duplicates
+
+    def import_path(self, path: Path, fmt: str = "auto") -> ImportReport:
+        if fmt == "auto":
+            fmt = detect_format(path)
+        with path.open("r", encoding="utf-8") as fh:
+            records = iter_ndjson(fh) if fmt == "ndjson" else iter_json_array(fh)
+            return self.import_records(records)
+
+    def import_records(self, records: Iterable[RawRecord]) -> ImportReport:
+        report = ImportReport()
+        pending: List[Track] = []
+        if self.dedup is not None:
+            self.dedup.refresh()
+        with ExitStack() as stack:
+            if not self.library.incremental:
+                # Plain JSON storage: hold the batches in one outer transaction
+                # (each is a savepoint in it) so the file is written once.
+                stack.callback(self._save_dedup)
+                stack.enter_context(self.library.batch())
+            try:
+                for tracks, errors, size in self._validated(_chunked(records, self.chunk_size)):
+                    report.records += size
+                    report.failed += len(errors)
+                    room = self.max_errors - len(report.errors)
+                    if room > 0:
+                        report.errors.extend(errors[:room])
+                    pending.extend(tracks)
+                    if len(pending) >= self.batch_size:
+                        self._flush(pending, report)
+                        pending = []
+                self._flush(pending, report)
+            except BaseException:
+                stack.close()  # commit the batches flushed before the failure
+                raise
+        return report
+
+    def _validated(self, chunks: Iterator[List[RawRecord]]) -> Iterator[Tuple[List[Track], List[RecordError], int]]:
+        if self.workers <= 1:
+            for chunk in chunks:
+                yield (*validate_records(chunk), len(chunk))
+            return
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            in_flight: Deque[Tuple[Future, int]] = deque()
+            for chunk in chunks:
+                in_flight.append((executor.submit(validate_records, chunk), len(chunk)))
+                if len(in_flight) >= self.workers * 2:
+                    future, size = in_flight.popleft()
+                    yield (*future.result(), size)
+            while in_flight:
+                future, size = in_flight.popleft()
+                yield (*future.result(), size)
+
+    def _flush(self, tracks: List[Track], report: ImportReport) -> None:
+        if self.dedup is not None:
+            tracks = self._deduplicated(tracks, report)
+        if tracks:
+            result = self.library.import_tracks(tracks, overwrite=self.overwrite, skip_existing=not self.overwrite)
+            report.inserted += result.inserted
+            report.overwritten += result.overwritten
+            report.skipped += result.skipped
+            if self.library.incremental:
+                self._save_dedup()  # the batch is committed; keep the index in step
+        if self.progress is not None:
+            self.progress(report)
+
+    def _save_dedup(self) -> None:
+        if self.dedup is not None and self.dedup.path is not None:
+            self.dedup.save()
+
+    def _deduplicated(self, tracks: List[Track], report: ImportReport) -> List[Track]:
+        assert self.dedup is not None
+        existing, _ = self.library.get_tracks(track.id for track in tracks)
+        indexed = {track.id: (track.title, track.artist, track.album) for track in existing}
+        kept: List[Track] = []
+        unsaved: Dict[str, Track] = {}
+        for track in tracks:
+            match = self.dedup.match(track, unsaved=unsaved)
+            if match is not None:
+                if len(report.duplicates) < self.max_errors:
+                    report.duplicates.append(match)
+                if self.merge_duplicates:
+                    report.merged += 1
+                    continue
+            kept.append(track)
+            unsaved[track.id] = track
+            # Re-deliveries of unchanged tracks are indexed already.
+            if indexed.get(track.id) != (track.title, track.artist, track.album):
+                self.dedup.add(track)
+        return kept
+
+
+__all__ = [
+    "ImportReport",
+    "RecordError",
+    "StreamingImporter",
+    "detect_format",
+    "iter_json_array",
+    "iter_ndjson",
+    "track_from_payload",
+    "validate_records",
+]
@@ -0,0 +1,601 @@
+"""Secondary indexes kept in sync with :class:`~music_app.library.MusicLibrary`."""
+
+from __future__ import annotations
+
+import heapq
+from bisect import bisect_left, bisect_right, insort
+from itertools import accumulate, chain, groupby, islice
+from typing import TYPE_CHECKING, Any, Callable, Dict, FrozenSet, Iterable, Iterator, List, Optional, Set, Tuple
+
+if TYPE_CHECKING:
+    from .library import Track
+
+NGRAM_SIZE = 3
+SORTED_CHUNK_SIZE = 512
+
+
+class TrackIndex:
+    """Base class for incrementally maintained track indexes.
+
+    ``ordinal`` is the track's position in library order; indexes use it to
+    return results in the same order as :meth:`MusicLibrary.list_tracks`.
+    ``fields`` names the track attributes the index depends on, so the library
+    can skip it when unrelated attributes change.
+    """
+
+    fields: FrozenSet[str] = frozenset()
+
+    def add(self, track: Track, ordinal: int) -> None:
+        """Insert ``track`` or refresh the entry already stored for its id."""
+
+        raise NotImplementedError
+
+    def discard(self, track_id: str) -> None:
+        raise NotImplementedError
+
+    def build(self, tracks: Iterable[Tuple[Track, int]]) -> None:
+        """Populate an empty index from ``(track, ordinal)`` pairs."""
+
+        for track, ordinal in tracks:
+            self.add(track, ordinal)
+
+
+def _searchable_texts(track: Track) -> Tuple[str, ...]:
+    return (
+        track.title.lower(),
+        track.artist.lower(),
+        track.album.lower(),
+        track.genre.lower(),
+        *(mood.lower() for mood in track.moods),
+    )
+
+
+def _ngrams(text: str) -> Set[str]:
+    return {text[index : index + NGRAM_SIZE] for index in range(len(text) - NGRAM_SIZE + 1)}
+
+
+class SubstringIndex(TrackIndex):
+    """Character n-gram postings over title, artist, album, genre and moods.
+
+    A query of at least ``NGRAM_SIZE`` characters intersects the postings of
+    its rarest n-grams and verifies the few surviving candidates, so results
+    match a plain case-insensitive substring scan exactly.
+    """
+
+    fields = frozenset({"title", "artist", "album", "genre", "moods"})
+
+    def __init__(self) -> None:
+        self._postings: Dict[str, Set[str]] = {}
+        self._texts: Dict[str, Tuple[str, ...]] = {}
+        self._ordinals: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._texts)
+
+    def add(self, track: Track, ordinal: int) -> None:
+        texts = _searchable_texts(track)
+        old_texts = self._texts.get(track.id)
+        if old_texts == texts:
+            self._ordinals[track.id] = ordinal
+            return
+        if old_texts is not None:
+            self._unpost(track.id, old_texts)
+        self._texts[track.id] = texts
+        self._ordinals[track.id] = ordinal
+        for gram in set().union(*map(_ngrams, texts)):
+            self._postings.setdefault(gram, set()).add(track.id)
+
+    def discard(self, track_id: str) -> None:
+        texts = self._texts.pop(track_id, None)
+        if texts is None:
+            return
+        del self._ordinals[track_id]
+        self._unpost(track_id, texts)
+
+    def search(self, query: str, limit: Optional[int] = None, offset: int = 0) -> List[str]:
+        """Return matching track ids in library order, paged by ``offset``/``limit``."""
+
+        needle = query.lower()
+        if len(needle) < NGRAM_SIZE:
+            return self._scan(needle, self._texts, limit, offset)
+        candidates = self._candidates(needle)
+        matches = (track_id for track_id in candidates if any(needle in text for text in self._texts[track_id]))
+        if limit is None:
+            ordered = sorted(matches, key=self._ordinals.__getitem__)
+            return ordered[offset:]
+        return heapq.nsmallest(offset + limit, matches, key=self._ordinals.__getitem__)[offset:]
+
+    def estimate(self, query: str) -> int:
+        """Upper bound on the number of matches, read from the rarest posting."""
+
+        needle = query.lower()
+        if len(needle) < NGRAM_SIZE:
+            return len(self._texts)
+        return min((len(self._postings.get(gram, ())) for gram in _ngrams(needle)), default=0)
+
+    def _candidates(self, needle: str) -> Set[str]:
+        postings = []
+        for gram in _ngrams(needle):
+            posting = self._postings.get(gram)
+            if not posting:
+                return set()
+            postings.append(posting)
+        postings.sort(key=len)
+        candidates = set(postings[0])
+        # The rarest few postings already prune almost everything; the
+        # remaining candidates are verified against the full text anyway.
+        for posting in postings[1:4]:
+            candidates &= posting
+            if not candidates:
+                break
+        return candidates
+
+    @staticmethod
+    def _scan(needle: str, texts: Dict[str, Tuple[str, ...]], limit: Optional[int], offset: int) -> List[str]:
+        results: List[str] = []
+        skipped = 0
+        for track_id, fields in texts.items():
+            if any(needle in text for text in fields):
+                if skipped < offset:
+                    skipped += 1
+                    continue
+                results.append(track_id)
+                if limit is not None and len(results) >= limit:
+                    break
+        return results
+
+    def _unpost(self, track_id: str, texts: Iterable[str]) -> None:
+        for gram in set().union(*map(_ngrams, texts)):
+            posting = self._postings.get(gram)
+            if posting is not None:
+                posting.discard(track_id)
+                if not posting:
+                    del self._postings[gram]
+
+
+class HashIndex(TrackIndex):
+    """Case-insensitive equality postings for a string or list-of-strings field."""
+
+    def __init__(self, field: str) -> None:
+        self.field = field
+        self.fields = frozenset({field})
+        self._postings: Dict[str, Set[str]] = {}
+        self._keys: Dict[str, Tuple[str, ...]] = {}
+
+    def _values(self, track: Track) -> Tuple[str, ...]:
+        value = getattr(track, self.field)
+        if value is None:
+            return ()
+        if isinstance(value, str):
+            return (value.lower(),)
+        return tuple(dict.fromkeys(item.lower() for item in value))
+
+    def add(self, track: Track, ordinal: int) -> None:
+        values = self._values(track)
+        if self._keys.get(track.id) == values:
+            return
+        self.discard(track.id)
+        self._keys[track.id] = values
+        for value in values:
+            self._postings.setdefault(value, set()).add(track.id)
+
+    def discard(self, track_id: str) -> None:
+        for value in self._keys.pop(track_id, ()):
+            posting = self._postings[value]
+            posting.discard(track_id)
+            if not posting:
+                del self._postings[value]
+
+    def count(self, values: Iterable[str]) -> int:
+        return sum(len(self._postings.get(value.lower(), ())) for value in set(values))
+
+    def lookup(self, values: Iterable[str]) -> Set[str]:
+        result: Set[str] = set()
+        for value in values:
+            result.update(self._postings.get(value.lower(), ()))
+        return result
+
+    def vocabulary(self) -> Iterator[str]:
+        return iter(self._postings)
+
+
+# UTF-8 never uses bytes above 0xF4, so ``0xF4 - byte`` reverses byte order
+# and leaves 0xFF free for a terminator that sorts after every other byte.
+_REVERSED_UTF8 = bytes(max(0xF4 - byte, 0) for byte in range(256))
+
+
+def descending_text(value: str) -> bytes:
+    """Key that sorts strings in reverse order while comparing as plain bytes."""
+
+    return value.encode("utf-8", "surrogatepass").translate(_REVERSED_UTF8) + b"\xff"
+
+
+class SortedEntries:
+    """A sorted list stored as bounded chunks.
+
+    An insert or removal shifts at most ``2 * chunk_size`` entries instead of
+    the whole list, so updates stay O(log n) in practice at millions of
+    entries. Global positions go through per-chunk offsets that are rebuilt
+    lazily after a change.
+    """
+
+    def __init__(self, chunk_size: Optional[int] = None) -> None:
+        self._chunk_size = chunk_size or SORTED_CHUNK_SIZE
+        self._chunks: List[list] = []
+        self._maxes: list = []
+        self._offsets: Optional[List[int]] = None
+        self._len = 0
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __iter__(self) -> Iterator[Any]:
+        return chain.from_iterable(self._chunks)
+
+    def load(self, values: Iterable[Any]) -> None:
+        """Replace the contents with ``values``; one sort instead of n inserts."""
+
+        ordered = sorted(values)
+        size = self._chunk_size
+        self._chunks = [ordered[start : start + size] for start in range(0, len(ordered), size)]
+        self._maxes = [chunk[-1] for chunk in self._chunks]
+        self._len = len(ordered)
+        self._offsets = None
+
+    def __reversed__(self) -> Iterator[Any]:
+        return chain.from_iterable(map(reversed, reversed(self._chunks)))
+
+    def add(self, value: Any) -> None:
+        chunks, maxes = self._chunks, self._maxes
+        if not chunks:
+            chunks.append([value])
+            maxes.append(value)
+        else:
+            position = bisect_left(maxes, value)
+            if position == len(maxes):
+                position -= 1
+                chunk = chunks[position]
+                chunk.append(value)
+                maxes[position] = value
+            else:
+                chunk = chunks[position]
+                insort(chunk, value)
+            if len(chunk) > 2 * self._chunk_size:
+                half = self._chunk_size
+                chunks[position : position + 1] = [chunk[:half], chunk[half:]]
+                maxes[position : position + 1] = [chunk[half - 1], chunk[-1]]
+        self._len += 1
+        self._offsets = None
+
+    def remove(self, value: Any) -> None:
+        """Remove ``value``, which must be present."""
+
+        position = bisect_left(self._maxes, value)
+        chunk = self._chunks[position]
+        del chunk[bisect_left(chunk, value)]
+        if chunk:
+            self._maxes[position] = chunk[-1]
+        else:
+            del self._chunks[position], self._maxes[position]
+        self._len -= 1
+        self._offsets = None
+
+    def _offset(self, chunk: int) -> int:
+        if self._offsets is None:
+            self._offsets = [0, *accumulate(map(len, self._chunks))]
+        return self._offsets[chunk]
+
+    def bisect_left(self, value: Any) -> int:
+        position = bisect_left(self._maxes, value)
+        if position == len(self._maxes):
+            return self._len
+        return self._offset(position) + bisect_left(self._chunks[position], value)
+
+    def bisect_right(self, value: Any) -> int:
+        position = bisect_right(self._maxes, value)
+        if position == len(self._maxes):
+            return self._len
+        return self._offset(position) + bisect_right(self._chunks[position], value)
+
+    def islice(self, start: int, stop: int, reverse: bool = False) -> Iterator[Any]:
+        """Entries at positions ``start:stop``; with ``reverse``, from ``stop - 1`` down."""
+
+        stop = min(stop, self._len)
+        if start >= stop:
+            return iter(())
+        self._offset(0)
+        assert self._offsets is not None
+        if reverse:
+            last = bisect_right(self._offsets, stop - 1) - 1
+            skip = self._offsets[last + 1] - stop
+            chunks = map(reversed, reversed(self._chunks[: last + 1]))
+            return islice(chain.from_iterable(chunks), skip, skip + stop - start)
+        first = bisect_right(self._offsets, start) - 1
+        skip = start - self._offsets[first]
+        return islice(chain.from_iterable(self._chunks[first:]), skip, skip + stop - start)
+
+
+class SortedIndex(TrackIndex):
+    """Order-maintaining index of ``(key, ordinal, track_id)`` entries.
+
+    Tracks whose key is ``None`` are left out. Entries with equal keys are in
+    library order, so :meth:`head` matches a stable sort on the key. Inserts
+    and removals touch one chunk of :class:`SortedEntries`; range counts are
+    two binary searches.
+    """
+
+    def __init__(self, field: str, key: Optional[Callable[[Track], Any]] = None, depends_on: Iterable[str] = ()) -> None:
+        self.field = field
+        self.fields = frozenset({field, *depends_on})
+        self._key = key or (lambda track: getattr(track, field))
+        self._entries = SortedEntries()
+        self._by_id: Dict[str, Tuple[Any, int, str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, track_id: object) -> bool:
+        return track_id in self._by_id
+
+    def add(self, track: Track, ordinal: int) -> None:
+        key = self._key(track)
+        entry = (key, ordinal, track.id)
+        if self._by_id.get(track.id) == entry:
+            return
+        self.discard(track.id)
+        if key is None:
+            return
+        self._entries.add(entry)
+        self._by_id[track.id] = entry
+
+    def discard(self, track_id: str) -> None:
+        entry = self._by_id.pop(track_id, None)
+        if entry is not None:
+            self._entries.remove(entry)
+
+    def build(self, tracks: Iterable[Tuple[Track, int]]) -> None:
+        key = self._key
+        for track, ordinal in tracks:
+            value = key(track)
+            if value is not None:
+                self._by_id[track.id] = (value, ordinal, track.id)
+        self._entries.load(self._by_id.values())
+
+    def _bounds(self, low: Any, high: Any, low_inclusive: bool, high_inclusive: bool) -> Tuple[int, int]:
+        # Entries are tuples, so compare against one-element tuples: (k,) sorts
+        # before every (k, ...) entry, and (k, inf) after all of them.
+        entries = self._entries
+        start = 0
+        stop = len(entries)
+        if low is not None:
+            start = entries.bisect_left((low,)) if low_inclusive else entries.bisect_right((low, float("inf")))
+        if high is not None:
+            stop = entries.bisect_right((high, float("inf"))) if high_inclusive else entries.bisect_left((high,))
+        return start, max(start, stop)
+
+    def count_range(self, low: Any = None, high: Any = None, low_inclusive: bool = True, high_inclusive: bool = True) -> int:
+        start, stop = self._bounds(low, high, low_inclusive, high_inclusive)
+        return stop - start
+
+    def range(self, low: Any = None, high: Any = None, low_inclusive: bool = True, high_inclusive: bool = True) -> Iterator[str]:
+        start, stop = self._bounds(low, high, low_inclusive, high_inclusive)
+        return (entry[2] for entry in self._entries.islice(start, stop))
+
+    def head(self, limit: int) -> List[str]:
+        """Ids of the first ``limit`` entries, in O(limit)."""
+
+        return [entry[2] for entry in islice(self._entries, max(0, limit))]
+
+    def entries(self, track_ids: Optional[Iterable[str]] = None) -> SortedEntries:
+        """The live entries, or a sorted copy restricted to ``track_ids``."""
+
+        if track_ids is None:
+            return self._entries
+        by_id = self._by_id
+        subset = SortedEntries()
+        subset.load(by_id[track_id] for track_id in track_ids if track_id in by_id)
+        return subset
+
+    def ascending(self) -> Iterator[Tuple[Any, int, str]]:
+        return iter(self._entries)
+
+    def descending(self) -> Iterator[Tuple[Any, int, str]]:
+        return reversed(self._entries)
+
+
+class MoodIndex(TrackIndex):
+    """Per-mood posting lists of ``(key, ordinal, track_id)``, kept sorted by ``key``.
+
+    Moods are normalized to lower case. A substring query is resolved against
+    the mood vocabulary, which is tiny next to the library, and the heads of
+    the matching postings are merged, so the first ``limit`` results cost
+    O(vocabulary + limit * log postings).
+    """
+
+    def __init__(self, key: Callable[[Track], Any], depends_on: Iterable[str] = ()) -> None:
+        self._key = key
+        self.fields = frozenset({"moods", *depends_on})
+        self._postings: Dict[str, SortedEntries] = {}
+        self._entries: Dict[str, Tuple[Tuple[str, ...], Tuple[Any, int, str]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _moods(track: Track) -> Tuple[str, ...]:
+        return tuple(dict.fromkeys(mood.lower() for mood in track.moods))
+
+    def add(self, track: Track, ordinal: int) -> None:
+        stored = (self._moods(track), (self._key(track), ordinal, track.id))
+        if self._entries.get(track.id) == stored:
+            return
+        self.discard(track.id)
+        moods, entry = stored
+        for mood in moods:
+            self._postings.setdefault(mood, SortedEntries()).add(entry)
+        self._entries[track.id] = stored
+
+    def discard(self, track_id: str) -> None:
+        stored = self._entries.pop(track_id, None)
+        if stored is None:
+            return
+        moods, entry = stored
+        for mood in moods:
+            posting = self._postings[mood]
+            posting.remove(entry)
+            if not posting:
+                del self._postings[mood]
+
+    def build(self, tracks: Iterable[Tuple[Track, int]]) -> None:
+        postings: Dict[str, List[Tuple[Any, int, str]]] = {}
+        for track, ordinal in tracks:
+            stored = (self._moods(track), (self._key(track), ordinal, track.id))
+            for mood in stored[0]:
+                postings.setdefault(mood, []).append(stored[1])
+            self._entries[track.id] = stored
+        for mood, entries in postings.items():
+            self._postings[mood] = SortedEntries()
+            self._postings[mood].load(entries)
+
+    def vocabulary(self, fragment: str = "") -> List[str]:
+        """Indexed moods containing ``fragment`` (case-insensitive)."""
+
+        needle = fragment.lower()
+        return [mood for mood in self._postings if needle in mood]
+
+    def head(self, fragment: str, limit: int) -> List[str]:
+        """First ``limit`` ids by key among tracks with a mood containing ``fragment``."""
+
+        results: List[str] = []
+        if limit <= 0:
+            return results
+        seen: Set[str] = set()
+        # A track tagged with several matching moods appears once per posting.
+        for _, _, track_id in heapq.merge(*(self._postings[mood] for mood in self.vocabulary(fragment))):
+            if track_id not in seen:
+                seen.add(track_id)
+                results.append(track_id)
+                if len(results) >= limit:
+                    break
+        return results
+
+
+# -- Similarity ----------------------------------------------------------------
+# (tag bits, genre id, bpm) of a track, as seen by SimilarityIndex.
+Profile = Tuple[int, int, int]
+SimilarEntry = Tuple[int, int, str]
+
+
+def _by_distance(entries: List[SimilarEntry], bpm: int) -> Iterator[SimilarEntry]:
+    """Yield ``(distance, ordinal, id)`` for ``(bpm, ordinal, id)`` entries, nearest first.
+
+    Walks outwards from ``bpm``; entries at the same distance come out in
+    ordinal order, so the stream is sorted by ``(distance, ordinal)``.
+    """
+
+    right = bisect_left(entries, (bpm,))
+    left = right - 1
+    while left >= 0 or right < len(entries):
+        below = bpm - entries[left][0] if left >= 0 else None
+        above = entries[right][0] - bpm if right < len(entries) else None
+        distance = min(value for value in (below, above) if value is not None)
+        run: List[SimilarEntry] = []
+        if below == distance:
+            start = bisect_left(entries, (entries[left][0],), 0, left)
+            run.extend(entries[start : left + 1])
+            left = start - 1
+        if above == distance:
+            stop = bisect_right(entries, (entries[right][0], float("inf")), right)
+            run.extend(entries[right:stop])
+            right = stop
+        if below == distance and above == distance:
+            run.sort(key=lambda entry: entry[1])
+        for _, ordinal, track_id in run:
+            yield distance, ordinal, track_id
+
+
+class SimilarityIndex(TrackIndex):
+    """Tag bitsets grouped by profile, for ranking tracks similar to a seed.
+
+    The similarity of two tracks is the size of the multiset intersection of
+    their ``[genre, *moods]`` tags. Every ``(tag, occurrence)`` pair gets its
+    own bit, so that size is ``(a & b).bit_count()``. Tracks sharing tag bits
+    and genre form one group, kept sorted by bpm; ranking a seed scores each
+    group once and then pulls candidates from the best groups nearest to the
+    seed's bpm, so only the returned tracks are ever touched individually.
+    """
+
+    fields = frozenset({"genre", "moods", "bpm"})
+
+    def __init__(self) -> None:
+        self._bits: Dict[Tuple[str, int], int] = {}
+        self._genres: Dict[str, int] = {}
+        self._groups: Dict[Tuple[int, int], List[SimilarEntry]] = {}
+        self._entries: Dict[str, Tuple[Tuple[int, int], SimilarEntry]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def profile(self, track: Track, register: bool = False) -> Profile:
+        """Tags absent from the index cannot be shared, so a seed leaves them out."""
+
+        bits = 0
+        seen: Dict[str, int] = {}
+        for tag in (track.genre, *track.moods):
+            occurrence = seen[tag] = seen.get(tag, 0) + 1
+            bit = self._bits.get((tag, occurrence))
+            if bit is None and register:
+                bit = self._bits[(tag, occurrence)] = len(self._bits)
+            if bit is not None:
+                bits |= 1 << bit
+        genre = self._genres.get(track.genre, -1)
+        if genre < 0 and register:
+            genre = self._genres[track.genre] = len(self._genres)
+        return bits, genre, track.bpm or 0
+
+    def add(self, track: Track, ordinal: int) -> None:
+        bits, genre, bpm = self.profile(track, register=True)
+        group, entry = (bits, genre), (bpm, ordinal, track.id)
+        if self._entries.get(track.id) == (group, entry):
+            return
+        self.discard(track.id)
+        insort(self._groups.setdefault(group, []), entry)
+        self._entries[track.id] = (group, entry)
+
+    def discard(self, track_id: str) -> None:
+        stored = self._entries.pop(track_id, None)
+        if stored is None:
+            return
+        group, entry = stored
+        entries = self._groups[group]
+        del entries[bisect_left(entries, entry)]
+        if not entries:
+            del self._groups[group]
+
+    def build(self, tracks: Iterable[Tuple[Track, int]]) -> None:
+        for track, ordinal in tracks:
+            bits, genre, bpm = self.profile(track, register=True)
+            group, entry = (bits, genre), (bpm, ordinal, track.id)
+            self._groups.setdefault(group, []).append(entry)
+            self._entries[track.id] = (group, entry)
+        for entries in self._groups.values():
+            entries.sort()
+
+    def ranked(self, profile: Profile, limit: int) -> List[str]:
+        """Ids ordered by (most shared tags, same genre, closest bpm, library order)."""
+
+        bits, genre, bpm = profile
+        scored = sorted(
+            ((-(group_bits & bits).bit_count(), group_genre != genre), (group_bits, group_genre))
+            for group_bits, group_genre in self._groups
+        )
+        results: List[str] = []
+        for _, tier in groupby(scored, key=lambda item: item[0]):
+            streams = [_by_distance(self._groups[group], bpm) for _, group in tier]
+            results.extend(track_id for _, _, track_id in islice(heapq.merge(*streams), limit - len(results)))
+            if len(results) >= limit:
+                break
+        return results
+
+
+__all__ = ["TrackIndex", "SubstringIndex", "HashIndex", "SortedIndex", "SortedEntries", "MoodIndex", "SimilarityIndex", "descending_text", "NGRAM_SIZE"]
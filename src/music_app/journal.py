@@ -0,0 +1,172 @@
+"""Write-ahead journal used for incremental library persistence."""
+
+from __future__ import annotations
+
+import json
+import os
+import secrets
+import time
+from pathlib import Path
+from typing import BinaryIO, Iterable, List, Optional, Tuple
+
+from . import metrics
+
+JOURNAL_SUFFIX = ".journal"
+DEFAULT_COMPACT_BYTES = 4 * 1024 * 1024
+DEFAULT_COMPACT_INTERVAL = 300.0
+
+
+def _create_temp(path: Path) -> Tuple[int, str]:
+    """A new file beside ``path``, opened for writing.
+
+    Unlike ``mkstemp``'s owner-only file it is created with mode 0o666, so the
+    kernel applies the umask just as ``open()`` would; reading the umask would
+    mean setting it, which races with other threads creating files.
+    """
+
+    flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0)
+    for _ in range(100):
+        name = str(path.with_name(f".{path.name}.{secrets.token_hex(4)}.tmp"))
+        try:
+            return os.open(name, flags, 0o666), name
+        except FileExistsError:
+            continue
+    raise FileExistsError(f"no free temporary name next to {path}")
+
+
+def atomic_write_bytes(path: Path, data: bytes) -> None:
+    """Write ``data`` to ``path`` so readers only ever see the old or new file.
+
+    The file keeps its permissions; a new one gets the umask default.
+    """
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = _create_temp(path)
+    try:
+        try:
+            os.chmod(tmp_name, path.stat().st_mode & 0o7777)
+        except FileNotFoundError:
+            pass
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(data)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp_name, path)
+        metrics.inc("music_bytes_written_total", len(data), file=path.suffix.lstrip(".") or path.name)
+    except BaseException:
+        try:
+            os.unlink(tmp_name)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def journal_path_for(storage_path: Path) -> Path:
+    return storage_path.with_name(storage_path.name + JOURNAL_SUFFIX)
+
+
+class LibraryJournal:
+    """Append-only log of library mutations replayed on top of a snapshot.
+
+    Each entry is one JSON object per line. A torn trailing line left behind by
+    a crash is ignored on replay and truncated before the next append.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        compact_bytes: int = DEFAULT_COMPACT_BYTES,
+        compact_interval: float = DEFAULT_COMPACT_INTERVAL,
+        fsync: bool = True,
+    ) -> None:
+        self.path = path
+        self.compact_bytes = compact_bytes
+        self.compact_interval = compact_interval
+        self.fsync = fsync
+        self._fh: Optional[BinaryIO] = None
+        self._size = path.stat().st_size if path.exists() else 0
+        self._valid_size: Optional[int] = None
+        self._last_compaction = time.monotonic()
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def replay(self) -> List[dict]:
+        """Return every complete entry currently in the journal."""
+
+        entries: List[dict] = []
+        valid_size = 0
+        if not self.path.exists():
+            return entries
+        with self.path.open("rb") as fh:
+            for raw in fh:
+                if not raw.endswith(b"\n"):
+                    break
+                try:
+                    entries.append(json.loads(raw))
+                except json.JSONDecodeError:
+                    break
+                valid_size += len(raw)
+        self._valid_size = valid_size
+        self._size = valid_size
+        return entries
+
+    def append(self, entries: Iterable[dict]) -> int:
+        data = b"".join(
+            json.dumps(entry, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+            for entry in entries
+        )
+        if not data:
+            return 0
+        fh = self._open()
+        fh.write(data)
+        fh.flush()
+        if self.fsync:
+            os.fsync(fh.fileno())
+        self._size += len(data)
+        metrics.inc("music_bytes_written_total", len(data), file="journal")
+        return len(data)
+
+    def needs_compaction(self) -> bool:
+        if self._size == 0:
+            return False
+        if self._size >= self.compact_bytes:
+            return True
+        return time.monotonic() - self._last_compaction >= self.compact_interval
+
+    def reset(self) -> None:
+        """Discard all entries; called once their effects are in a snapshot."""
+
+        self.close()
+        if self.path.exists():
+            with self.path.open("wb"):
+                pass
+        self._size = 0
+        self._valid_size = None
+        self._last_compaction = time.monotonic()
+
+    def close(self) -> None:
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+    def _open(self) -> BinaryIO:
+        if self._fh is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._fh = self.path.open("ab")
+            if self._valid_size is not None and self._fh.tell() > self._valid_size:
+                self._fh.truncate(self._valid_size)
+                self._fh.seek(self._valid_size)
+            self._valid_size = None
+        return self._fh
+
+
+__all__ = [
+    "LibraryJournal",
+    "JOURNAL_SUFFIX",
+    "DEFAULT_COMPACT_BYTES",
+    "DEFAULT_COMPACT_INTERVAL",
+    "atomic_write_bytes",
+    "journal_path_for",
+]
@@ -2,20 +2,58 @@
 
 from __future__ import annotations
 
-import json
 import os
-from dataclasses import dataclass, asdict, field
+from contextlib import contextmanager
+from dataclasses import dataclass, field
 from datetime import datetime
+from itertools import islice
 from pathlib import Path
-from typing import Dict, Iterable, List, Optional
+from typing import Callable, Dict, Iterable, Iterator, List, Mapping, MutableMapping, Optional, Tuple, TypeVar
 
-DEFAULT_STORAGE_PATH = Path(os.environ.get("ZTSCR_LIBRARY_PATH", Path.home() / ".ztcsr_music" / "library.json"))
+from . import metrics
+from .indexes import MoodIndex, SortedIndex, descending_text, SubstringIndex, TrackIndex
+from .journal import DEFAULT_COMPACT_BYTES, DEFAULT_COMPACT_INTERVAL, journal_path_for
+from .query import QueryPlanner, parse_query
+from .storage import StorageBackend, StorageLocation, open_storage, storage_location_path
+
+# May carry a scheme, e.g. ``sqlite:///srv/music/library.db``; see open_storage().
+DEFAULT_STORAGE_LOCATION = os.environ.get("ZTSCR_LIBRARY_PATH", str(Path.home() / ".ztcsr_music" / "library.json"))
+DEFAULT_STORAGE_PATH = storage_location_path(DEFAULT_STORAGE_LOCATION)
+DEFAULT_JOURNAL_MODE = os.environ.get("ZTSCR_LIBRARY_JOURNAL", "").lower() in {"1", "true", "yes", "on"}
+DEFAULT_COMPACT_MODE = os.environ.get("ZTSCR_LIBRARY_COMPACT", "").lower() in {"1", "true", "yes", "on"}
+# A one-off query is cheaper as a scan than as an index build; build the
+# search index once a library instance has answered this many searches.
+SEARCH_INDEX_THRESHOLD = 2
+
+IndexT = TypeVar("IndexT", bound=TrackIndex)
+PLAY_FIELDS = frozenset({"play_count", "last_played"})
 
 
 def _ensure_storage_directory(path: Path) -> None:
     path.parent.mkdir(parents=True, exist_ok=True)
 
 
+# Keys of the rankings behind top_tracks(), recently_played() and
+# popular_tracks(). SortedIndex keeps equal keys in library order, which is
+# exactly what the stable ``sorted(..., reverse=True)`` calls they replace did.
+def _plays_key(track: Track) -> int:
+    return -track.play_count
+
+
+def _recency_key(track: Track) -> Optional[bytes]:
+    return descending_text(track.last_played) if track.last_played else None
+
+
+def _popularity_key(track: Track) -> Tuple[int, bytes]:
+    return -track.play_count, descending_text(track.last_played or "")
+
+
+def _keeps_order(tracks: MutableMapping[str, Track]) -> bool:
+    """Whether rollback can restore the iteration order of ``tracks``."""
+
+    return isinstance(tracks, dict) or hasattr(tracks, "reorder")
+
+
 @dataclass
 class Track:
     """Representation of a single track in the library."""
@@ -31,49 +69,278 @@ class Track:
     last_played: Optional[str] = None
     play_count: int = 0
 
+    # Set by the owning library so it can keep its indexes current; a plain
+    # class attribute rather than a field, so it never reaches asdict().
+    _observer = None
+
     def mark_played(self) -> None:
         """Increment play count and update last played timestamp."""
 
         self.play_count += 1
         self.last_played = datetime.utcnow().isoformat()
+        if self._observer is not None:
+            self._observer(self)
+
+
+@dataclass
+class BatchResult:
+    """Counts of tracks touched by a :meth:`MusicLibrary.batch` transaction."""
+
+    inserted: int = 0
+    overwritten: int = 0
+    skipped: int = 0
+
+    @property
+    def total(self) -> int:
+        return self.inserted + self.overwritten + self.skipped
+
+
+@dataclass
+class _Transaction:
+    undo: List[Tuple[object, ...]] = field(default_factory=list)
+    pending: List[dict] = field(default_factory=list)
+    results: List[BatchResult] = field(default_factory=list)
+    order: Optional[List[str]] = None
 
 
 class MusicLibrary:
     """Persistent store for tracks and associated metadata."""
 
-    def __init__(self, storage_path: Path = DEFAULT_STORAGE_PATH) -> None:
-        self.storage_path = storage_path
+    def __init__(
+        self,
+        storage_path: StorageLocation = DEFAULT_STORAGE_LOCATION,
+        journal: bool = DEFAULT_JOURNAL_MODE,
+        compact_bytes: int = DEFAULT_COMPACT_BYTES,
+        compact_interval: float = DEFAULT_COMPACT_INTERVAL,
+        backend: Optional[StorageBackend] = None,
+        compact: bool = DEFAULT_COMPACT_MODE,
+    ) -> None:
+        if backend is None:
+            backend = open_storage(storage_path, journal=journal, compact_bytes=compact_bytes, compact_interval=compact_interval)
+        self._backend = backend
+        self._compact = compact
+        self.storage_path = backend.path
         _ensure_storage_directory(self.storage_path)
-        self._tracks: Dict[str, Track] = {}
+        self._tracks: MutableMapping[str, Track] = {}
+        self._batch: Optional[_Transaction] = None
+        self._indexes: Dict[str, TrackIndex] = {}
+        self._ordinals: Optional[Dict[str, int]] = None
+        self._next_ordinal = 0
+        self._searches = 0
+        self._version = 0
+        self._catalog_version = 0
+        self._play_listeners: List[Callable[[Track], None]] = []
         self._load()
 
     # -- Persistence -----------------------------------------------------
+    @metrics.timed("music_library_operation_seconds", operation="load")
     def _load(self) -> None:
-        if not self.storage_path.exists():
-            self._tracks = {}
-            return
-        with self.storage_path.open("r", encoding="utf-8") as fh:
-            data = json.load(fh)
-        self._tracks = {track_id: Track(**payload) for track_id, payload in data.items()}
+        self._drop_indexes()
+        self._changed()
+        into: Optional[MutableMapping[str, Track]] = None
+        if self._compact:
+            from .compact import CompactTrackStore  # imports Track from this module
+
+            into = CompactTrackStore(adopt=self._adopt)
+        self._tracks = self._backend.load(lambda payload: self._adopt(Track(**payload)), into)
 
+    @metrics.timed("music_library_operation_seconds", operation="save")
     def save(self) -> None:
-        _ensure_storage_directory(self.storage_path)
-        payload = {track_id: asdict(track) for track_id, track in self._tracks.items()}
-        with self.storage_path.open("w", encoding="utf-8") as fh:
-            json.dump(payload, fh, ensure_ascii=False, indent=2)
+        """Persist the full library state, including play counts."""
+
+        self._backend.save(self._tracks)
+
+    # -- Versions ----------------------------------------------------------
+    @property
+    def version(self) -> int:
+        """Incremented on every change to the library, including plays."""
+
+        return self._version
+
+    @property
+    def catalog_version(self) -> int:
+        """Incremented on every change except ``Track.mark_played``."""
+
+        return self._catalog_version
+
+    def _changed(self, played: bool = False) -> None:
+        self._version += 1
+        if not played:
+            self._catalog_version += 1
+
+    @property
+    def backend(self) -> StorageBackend:
+        return self._backend
+
+    @property
+    def incremental(self) -> bool:
+        """Whether a single mutation is persisted without rewriting the library."""
+
+        return self._backend.incremental
+
+    def close(self) -> None:
+        self._backend.close()
+
+    def _persist(self, entries: List[dict]) -> None:
+        if entries:
+            self._backend.persist(entries, self._tracks)
+
+    def _record(self, entry: dict, undo: Tuple[object, ...]) -> None:
+        if self._batch is None:
+            self._persist([entry])
+            return
+        self._batch.undo.append(undo)
+        self._batch.pending.append(entry)
+
+    # -- Transactions ------------------------------------------------------
+    @contextmanager
+    def batch(self) -> Iterator[BatchResult]:
+        """Group mutations into one transaction with a single flush at commit.
+
+        Any exception raised inside the block rolls back every change made in
+        it. Nested batches join the enclosing transaction and act as savepoints.
+        """
+
+        outer = self._batch is None
+        if outer:
+            self._backend.begin()
+            self._batch = _Transaction()
+        txn = self._batch
+        assert txn is not None
+        savepoint = (len(txn.undo), len(txn.pending))
+        result = BatchResult()
+        txn.results.append(result)
+        try:
+            yield result
+        except BaseException:
+            self._rollback(txn, savepoint)
+            txn.results.pop()
+            for enclosing in txn.results:
+                enclosing.inserted -= result.inserted
+                enclosing.overwritten -= result.overwritten
+                enclosing.skipped -= result.skipped
+            if outer:
+                self._batch = None
+            raise
+        txn.results.pop()
+        if outer:
+            self._batch = None
+            self._persist(txn.pending)
+
+    def _count(self, outcome: str) -> None:
+        if self._batch is not None:
+            for result in self._batch.results:
+                setattr(result, outcome, getattr(result, outcome) + 1)
+
+    def _rollback(self, txn: _Transaction, savepoint: Tuple[int, int]) -> None:
+        undo_mark, pending_mark = savepoint
+        while len(txn.undo) > undo_mark:
+            kind, track_id, *rest = txn.undo.pop()
+            if kind == "put":
+                (previous,) = rest
+                if previous is None:
+                    self._tracks.pop(track_id, None)
+                else:
+                    self._tracks[track_id] = previous
+            elif kind == "delete":
+                (previous,) = rest
+                self._tracks[track_id] = previous
+            elif kind == "update":
+                (previous,) = rest
+                track = self._tracks[track_id]
+                for key, value in previous.items():
+                    setattr(track, key, value)
+        del txn.pending[pending_mark:]
+        if txn.order is not None and isinstance(self._tracks, dict):
+            # Restore dict ordering disturbed by re-inserting removed tracks.
+            restored = {track_id: self._tracks[track_id] for track_id in txn.order if track_id in self._tracks}
+            restored.update(self._tracks)
+            self._tracks = restored
+        elif txn.order is not None and hasattr(self._tracks, "reorder"):
+            self._tracks.reorder(txn.order)
+        self._drop_indexes()
+        self._changed()
+
+    # -- Indexes -----------------------------------------------------------
+    def _adopt(self, track: Track) -> Track:
+        track._observer = self._on_track_played
+        return track
+
+    def _on_track_played(self, track: Track) -> None:
+        if self._tracks.get(track.id) is track:
+            self._backend.record_play(track)
+            self._reindex(track, PLAY_FIELDS)
+            self._changed(played=True)
+            for listener in self._play_listeners:
+                listener(track)
+
+    def add_play_listener(self, listener: Callable[[Track], None]) -> None:
+        """Call ``listener(track)`` after every ``mark_played()`` of a track in this library."""
+
+        self._play_listeners.append(listener)
+
+    def _index(self, name: str, factory: Callable[[], IndexT]) -> IndexT:
+        """Return the named index, building it from the current tracks on first use."""
+
+        index = self._indexes.get(name)
+        if index is None:
+            ordinals = self._ensure_ordinals()
+            index = factory()
+            index.build((track, ordinals[track_id]) for track_id, track in self._tracks.items())
+            self._indexes[name] = index
+        return index  # type: ignore[return-value]
+
+    def _ensure_ordinals(self) -> Dict[str, int]:
+        if self._ordinals is None:
+            self._ordinals = {track_id: ordinal for ordinal, track_id in enumerate(self._tracks)}
+            self._next_ordinal = len(self._ordinals)
+        return self._ordinals
+
+    def _track_ordinal(self, track_id: str) -> int:
+        return self._ensure_ordinals()[track_id]
+
+    def _reindex(self, track: Track, changed: Optional[Iterable[str]] = None) -> None:
+        if self._ordinals is None:
+            return
+        ordinal = self._ordinals.get(track.id)
+        if ordinal is None:
+            ordinal = self._ordinals[track.id] = self._next_ordinal
+            self._next_ordinal += 1
+        for index in self._indexes.values():
+            if changed is None or not index.fields.isdisjoint(changed):
+                index.add(track, ordinal)
+
+    def _unindex(self, track_id: str) -> None:
+        if self._ordinals is None:
+            return
+        self._ordinals.pop(track_id, None)
+        for index in self._indexes.values():
+            index.discard(track_id)
+
+    def _drop_indexes(self) -> None:
+        self._indexes.clear()
+        self._ordinals = None
 
     # -- Library operations ----------------------------------------------
     def add_track(self, track: Track, overwrite: bool = False) -> None:
-        if not overwrite and track.id in self._tracks:
+        previous = self._tracks.get(track.id)
+        if not overwrite and previous is not None:
             raise ValueError(f"Track with id {track.id!r} already exists")
-        self._tracks[track.id] = track
-        self.save()
+        self._tracks[track.id] = self._adopt(track)
+        self._reindex(track)
+        self._changed()
+        self._count("inserted" if previous is None else "overwritten")
+        self._record({"op": "put", "track": track}, ("put", track.id, previous))
 
     def remove_track(self, track_id: str) -> None:
         if track_id not in self._tracks:
             raise KeyError(f"Track with id {track_id!r} does not exist")
-        del self._tracks[track_id]
-        self.save()
+        if self._batch is not None and self._batch.order is None and _keeps_order(self._tracks):
+            self._batch.order = list(self._tracks)
+        previous = self._tracks.pop(track_id)
+        self._unindex(track_id)
+        self._changed()
+        self._record({"op": "delete", "id": track_id}, ("delete", track_id, previous))
 
     def get_track(self, track_id: str) -> Track:
         try:
@@ -81,43 +348,182 @@ class MusicLibrary:
         except KeyError as exc:
             raise KeyError(f"Track with id {track_id!r} not found") from exc
 
+    def get_tracks(self, track_ids: Iterable[str]) -> Tuple[List[Track], List[str]]:
+        """Resolve ``track_ids`` in one pass; returns ``(found, missing_ids)``."""
+
+        tracks = self._tracks
+        found: List[Track] = []
+        missing: List[str] = []
+        for track_id in track_ids:
+            track = tracks.get(track_id)
+            if track is None:
+                missing.append(track_id)
+            else:
+                found.append(track)
+        return found, missing
+
+    def __len__(self) -> int:
+        return len(self._tracks)
+
     def list_tracks(self) -> List[Track]:
         return list(self._tracks.values())
 
-    def search(self, query: str) -> List[Track]:
+    @metrics.timed("music_library_operation_seconds", operation="search")
+    def search(self, query: str, limit: Optional[int] = None, offset: int = 0) -> List[Track]:
+        """Case-insensitive substring match on title, artist, album, genre and moods.
+
+        Results are in library order; ``offset`` and ``limit`` page through them.
+        """
+
+        if self._backend.supports_pushdown:
+            return [self._tracks[track_id] for track_id in self._backend.search_ids(query, limit, offset)]
+        self._searches += 1
+        if "search" not in self._indexes and self._searches < SEARCH_INDEX_THRESHOLD:
+            return self._scan_search(query, limit, offset)
+        index = self._index("search", SubstringIndex)
+        return [self._tracks[track_id] for track_id in index.search(query, limit, offset)]
+
+    @metrics.timed("music_library_operation_seconds", operation="query")
+    def query(self, expression: str, limit: Optional[int] = None, offset: int = 0) -> List[Track]:
+        """Run a structured query (see :mod:`music_app.query`) in library order."""
+
+        predicates = parse_query(expression)
+        if all(predicate.kind == "text" for predicate in predicates):
+            return self.search(predicates[0].values[0] if predicates else "", limit, offset)
+        planner = QueryPlanner(self)
+        track_ids = planner.execute(planner.plan(predicates), limit, offset)
+        return [self._tracks[track_id] for track_id in track_ids]
+
+    def explain(self, expression: str) -> str:
+        return QueryPlanner(self).plan(parse_query(expression)).describe()
+
+    def _scan_search(self, query: str, limit: Optional[int], offset: int) -> List[Track]:
         query_lower = query.lower()
-        return [
+        matches = (
             track
-            for track in self._tracks.values()
+            for track in metrics.counted(self._tracks.values(), "music_tracks_scanned_total", operation="search")
             if query_lower in track.title.lower()
             or query_lower in track.artist.lower()
             or query_lower in track.album.lower()
             or query_lower in track.genre.lower()
             or any(query_lower in mood.lower() for mood in track.moods)
-        ]
+        )
+        stop = None if limit is None else offset + limit
+        return list(islice(matches, offset, stop))
 
-    def import_tracks(self, tracks: Iterable[Track], overwrite: bool = False) -> None:
-        for track in tracks:
-            self.add_track(track, overwrite=overwrite)
+    @metrics.timed("music_library_operation_seconds", operation="import_tracks")
+    def import_tracks(
+        self,
+        tracks: Iterable[Track],
+        overwrite: bool = False,
+        skip_existing: bool = False,
+    ) -> BatchResult:
+        """Add many tracks in one transaction and persist them with one flush.
+
+        Existing ids are replaced when ``overwrite`` is set, counted as skipped
+        when ``skip_existing`` is set, and otherwise abort the whole import.
+        """
+
+        with self.batch() as result:
+            for track in tracks:
+                if not overwrite and skip_existing and track.id in self._tracks:
+                    self._count("skipped")
+                    continue
+                self.add_track(track, overwrite=overwrite)
+        return result
 
     def update_track_metadata(self, track_id: str, **metadata: object) -> Track:
-        track = self.get_track(track_id)
-        for key, value in metadata.items():
-            if not hasattr(track, key):
-                raise AttributeError(f"Track has no attribute {key!r}")
-            setattr(track, key, value)
-        self.save()
+        with self.batch():
+            track = self.get_track(track_id)
+            for key in metadata:
+                if not hasattr(track, key):
+                    raise AttributeError(f"Track has no attribute {key!r}")
+            previous = {key: getattr(track, key) for key in metadata}
+            for key, value in metadata.items():
+                setattr(track, key, value)
+            # Re-assigning pins the edited track in lazily loaded backends.
+            self._tracks[track_id] = track
+            self._reindex(track, metadata)
+            self._changed()
+            self._record({"op": "update", "id": track_id, "fields": dict(metadata)}, ("update", track_id, previous))
         return track
 
+    def record_plays(self, plays: Mapping[str, int], when: Optional[str] = None) -> int:
+        """Apply ``plays[track_id]`` plays per track at once, as that many ``mark_played()`` calls would.
+
+        Each track is written to the backend and reindexed once. Play
+        listeners are still called once per play. Returns the number of plays.
+        """
+
+        when = when or datetime.utcnow().isoformat()
+        played: List[Track] = []
+        total = 0
+        for track_id, count in plays.items():
+            if count <= 0:
+                continue
+            track = self.get_track(track_id)
+            track.play_count += count
+            track.last_played = when
+            self._reindex(track, PLAY_FIELDS)
+            for listener in self._play_listeners:
+                for _ in range(count):
+                    listener(track)
+            played.append(track)
+            total += count
+        if played:
+            self._backend.record_plays(played)
+        if total:
+            self._changed(played=True)
+        return total
+
     def top_tracks(self, limit: int = 10) -> List[Track]:
-        return sorted(self._tracks.values(), key=lambda t: t.play_count, reverse=True)[:limit]
+        """Most played tracks first; ties keep library order."""
+
+        if self._backend.supports_pushdown:
+            return [self._tracks[track_id] for track_id in self._backend.top_ids(limit)]
+        index = self._index("ranked:plays", lambda: SortedIndex("play_count", key=_plays_key))
+        return [self._tracks[track_id] for track_id in index.head(limit)]
 
     def recently_played(self, limit: int = 10) -> List[Track]:
-        return sorted(
-            (track for track in self._tracks.values() if track.last_played),
-            key=lambda t: t.last_played or "",
-            reverse=True,
-        )[:limit]
+        """Played tracks, most recent first; ties keep library order."""
+
+        if self._backend.supports_pushdown:
+            return [self._tracks[track_id] for track_id in self._backend.recent_ids(limit)]
+        index = self._index("ranked:recent", lambda: SortedIndex("last_played", key=_recency_key))
+        return [self._tracks[track_id] for track_id in index.head(limit)]
+
+    def popular_tracks(self, limit: int = 10, mood: Optional[str] = None) -> List[Track]:
+        """Order by ``(play_count, last_played)`` descending; ties keep library order.
+
+        With ``mood``, only tracks having a mood that contains it
+        (case-insensitive) are ranked.
+        """
+
+        if self._backend.supports_pushdown:
+            return [self._tracks[track_id] for track_id in self._backend.popular_ids(limit, mood)]
+        if mood is not None:
+            moods = self._index("ranked:mood", lambda: MoodIndex(_popularity_key, depends_on=PLAY_FIELDS))
+            return [self._tracks[track_id] for track_id in moods.head(mood, limit)]
+        index = self._index(
+            "ranked:popular", lambda: SortedIndex("play_count", key=_popularity_key, depends_on=("last_played",))
+        )
+        return [self._tracks[track_id] for track_id in index.head(limit)]
+
+
+def migrate_library(source: StorageLocation, destination: StorageLocation) -> BatchResult:
+    """Copy every track from ``source`` into ``destination`` in one transaction.
+
+    A journal next to a JSON source is replayed, so unsaved edits migrate too.
+    """
+
+    source_backend = open_storage(source, journal=journal_path_for(storage_location_path(source)).exists())
+    tracks = source_backend.load(lambda payload: Track(**payload))
+    target = MusicLibrary(destination)
+    try:
+        return target.import_tracks(tracks.values(), overwrite=True)
+    finally:
+        target.close()
+        source_backend.close()
 
 
-__all__ = ["MusicLibrary", "Track", "DEFAULT_STORAGE_PATH"]
+__all__ = ["MusicLibrary", "Track", "BatchResult", "DEFAULT_STORAGE_PATH", "DEFAULT_STORAGE_LOCATION", "migrate_library"]
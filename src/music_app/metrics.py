@@ -0,0 +1,370 @@
+"""Opt-in hot-path instrumentation: latency histograms and counters.
+
+Instrumentation is off unless ``ZTSCR_METRICS`` is set (or :func:`enable`
+is called); every hook then costs one attribute check. When on, timers
+feed fixed-bucket latency histograms and counters accumulate bytes
+written and tracks scanned in a process-wide :data:`REGISTRY`.
+
+Each CLI invocation is a short process, so :func:`flush` merges the
+registry into a JSON state file next to the library and rewrites a
+Prometheus text-format file (for node_exporter's textfile collector) from
+the merged totals; ``cli stats`` reads the state file back. The merge holds
+an exclusive ``flock`` on a ``.lock`` file beside the state file, so
+concurrent CLI runs and the daemon do not lose each other's counts.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import functools
+import json
+import os
+from bisect import bisect_left
+from pathlib import Path
+from time import perf_counter
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar
+
+try:
+    import fcntl
+except ImportError:  # not on Windows; flushes there are not serialized
+    fcntl = None  # type: ignore[assignment]
+
+METRICS_SUFFIX = ".metrics.json"
+LOCK_SUFFIX = ".lock"
+PROMETHEUS_SUFFIX = ".prom"
+# Upper bounds in seconds, as in the Prometheus client libraries' defaults
+# but reaching further down, since most library calls finish in microseconds.
+LATENCY_BUCKETS: Tuple[float, ...] = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+Labels = Tuple[Tuple[str, str], ...]
+Key = Tuple[str, Labels]
+F = TypeVar("F", bound=Callable[..., Any])
+T = TypeVar("T")
+
+
+def _env_flag(name: str) -> bool:
+    return os.environ.get(name, "").lower() in {"1", "true", "yes", "on"}
+
+
+def _key(name: str, labels: Dict[str, object]) -> Key:
+    return name, tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+
+class Histogram:
+    """Per-bucket counts (not cumulative) plus the sum and count of observations."""
+
+    __slots__ = ("buckets", "counts", "total", "count")
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last slot is +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def merge(self, other: Histogram) -> None:
+        if other.buckets != self.buckets:
+            raise ValueError("cannot merge histograms with different buckets")
+        self.counts = [mine + theirs for mine, theirs in zip(self.counts, other.counts)]
+        self.total += other.total
+        self.count += other.count
+
+    def quantile(self, q: float) -> float:
+        """Estimate like PromQL's ``histogram_quantile``: interpolate within the bucket."""
+
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for position, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                if position == len(self.buckets):
+                    return self.buckets[-1]  # +Inf bucket: the highest finite bound
+                low = self.buckets[position - 1] if position else 0.0
+                return low + (self.buckets[position] - low) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+
+class MetricsRegistry:
+    """Counters and histograms keyed by metric name and sorted label pairs."""
+
+    def __init__(self, enabled: bool = False) -> None:
+        self.enabled = enabled
+        self.counters: Dict[Key, float] = {}
+        self.histograms: Dict[Key, Histogram] = {}
+
+    def __bool__(self) -> bool:
+        return bool(self.counters or self.histograms)
+
+    def inc(self, key: Key, value: float = 1) -> None:
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, key: Key, value: float) -> None:
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(value)
+
+    def merge(self, other: MetricsRegistry) -> None:
+        for key, value in other.counters.items():
+            self.inc(key, value)
+        for key, histogram in other.histograms.items():
+            mine = self.histograms.get(key)
+            if mine is None:
+                mine = self.histograms[key] = Histogram(histogram.buckets)
+            mine.merge(histogram)
+
+    def reset(self) -> None:
+        self.counters.clear()
+        self.histograms.clear()
+
+    # -- Serialization -----------------------------------------------------
+    def to_dict(self) -> dict:
+        return {
+            "counters": [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(self.counters.items())
+            ],
+            "histograms": [
+                {
+                    "name": name,
+                    "labels": dict(labels),
+                    "buckets": list(histogram.buckets),
+                    "counts": histogram.counts,
+                    "sum": histogram.total,
+                    "count": histogram.count,
+                }
+                for (name, labels), histogram in sorted(self.histograms.items())
+            ],
+        }
+
+    @classmethod
+    def from_dict(cls, payload: dict) -> MetricsRegistry:
+        registry = cls()
+        for entry in payload.get("counters", []):
+            registry.counters[_key(entry["name"], entry["labels"])] = entry["value"]
+        for entry in payload.get("histograms", []):
+            histogram = Histogram(tuple(entry["buckets"]))
+            histogram.counts = list(entry["counts"])
+            histogram.total = entry["sum"]
+            histogram.count = entry["count"]
+            registry.histograms[_key(entry["name"], entry["labels"])] = histogram
+        return registry
+
+    def prometheus_text(self) -> str:
+        """The registry in the Prometheus text exposition format (version 0.0.4)."""
+
+        lines: List[str] = []
+        for name, keys in _group(self.counters):
+            lines.append(f"# TYPE {name} counter")
+            lines.extend(f"{name}{_format_labels(labels)} {_format_value(self.counters[(name, labels)])}" for labels in keys)
+        for name, keys in _group(self.histograms):
+            lines.append(f"# TYPE {name} histogram")
+            for labels in keys:
+                histogram = self.histograms[(name, labels)]
+                cumulative = 0
+                for bound, count in zip([*map(_format_value, histogram.buckets), "+Inf"], histogram.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', bound),))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(histogram.total)}")
+                lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n" if lines else ""
+
+
+def _group(metrics: Dict[Key, Any]) -> Iterator[Tuple[str, List[Labels]]]:
+    names: Dict[str, List[Labels]] = {}
+    for name, labels in sorted(metrics):
+        names.setdefault(name, []).append(labels)
+    return iter(names.items())
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{label}="{value}"' for (label, _), value in zip(labels, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+REGISTRY = MetricsRegistry(enabled=_env_flag("ZTSCR_METRICS"))
+
+
+# -- Hooks -------------------------------------------------------------------
+def enabled() -> bool:
+    return REGISTRY.enabled
+
+
+def enable(flag: bool = True) -> None:
+    REGISTRY.enabled = flag
+
+
+def inc(name: str, value: float = 1, **labels: object) -> None:
+    if REGISTRY.enabled:
+        REGISTRY.inc(_key(name, labels), value)
+
+
+class _Timer:
+    __slots__ = ("key", "started")
+
+    def __init__(self, key: Key) -> None:
+        self.key = key
+        self.started = 0.0
+
+    def __enter__(self) -> _Timer:
+        self.started = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        REGISTRY.observe(self.key, perf_counter() - self.started)
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self) -> _NullTimer:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        return None
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timer(name: str, **labels: object) -> Any:
+    """Context manager observing the block's duration in seconds."""
+
+    return _Timer(_key(name, labels)) if REGISTRY.enabled else _NULL_TIMER
+
+
+def timed(name: str, **labels: object) -> Callable[[F], F]:
+    """Decorator observing each call's duration in seconds."""
+
+    key = _key(name, labels)
+
+    def decorate(function: F) -> F:
+        @functools.wraps(function)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if not REGISTRY.enabled:
+                return function(*args, **kwargs)
+            started = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                REGISTRY.observe(key, perf_counter() - started)
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorate
+
+
+def counted(items: Iterable[T], name: str, **labels: object) -> Iterable[T]:
+    """``items`` unchanged, adding the number actually consumed to a counter.
+
+    The count is recorded when iteration stops, including when a consumer
+    such as ``islice`` abandons the iterator early.
+    """
+
+    if not REGISTRY.enabled:
+        return items
+    return _counting(items, _key(name, labels))
+
+
+def _counting(items: Iterable[T], key: Key) -> Iterator[T]:
+    consumed = 0
+    try:
+        for item in items:
+            consumed += 1
+            yield item
+    finally:
+        REGISTRY.inc(key, consumed)
+
+
+# -- Persistence -------------------------------------------------------------
+def metrics_path_for(storage_path: Path) -> Path:
+    return storage_path.with_name(storage_path.name + METRICS_SUFFIX)
+
+
+def prometheus_path_for(storage_path: Path) -> Path:
+    """``ZTSCR_METRICS_PROM`` if set, else a ``.prom`` file next to the library."""
+
+    override = os.environ.get("ZTSCR_METRICS_PROM")
+    return Path(override).expanduser() if override else storage_path.with_name(storage_path.name + PROMETHEUS_SUFFIX)
+
+
+def load_metrics(path: Path) -> MetricsRegistry:
+    """The totals stored at ``path``; empty if there is no (readable) file."""
+
+    try:
+        return MetricsRegistry.from_dict(json.loads(path.read_text(encoding="utf-8")))
+    except FileNotFoundError:
+        return MetricsRegistry()
+    except (ValueError, KeyError, TypeError):
+        return MetricsRegistry()  # a damaged state file only loses history
+
+
+@contextlib.contextmanager
+def _locked(path: Path) -> Iterator[None]:
+    """Hold an exclusive lock on ``path`` plus :data:`LOCK_SUFFIX` for the block."""
+
+    if fcntl is None:
+        yield
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path.with_name(path.name + LOCK_SUFFIX), "a") as fh:
+        fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+
+
+def flush(path: Path, prometheus_path: Optional[Path] = None) -> MetricsRegistry:
+    """Merge :data:`REGISTRY` into the totals at ``path`` and reset it.
+
+    Also rewrites ``prometheus_path`` from the merged totals. Returns them.
+    The read-merge-write runs under a lock shared with other processes.
+    """
+
+    from .journal import atomic_write_bytes  # journal reports its writes here
+
+    was_enabled, REGISTRY.enabled = REGISTRY.enabled, False  # keep these writes out of the totals
+    try:
+        with _locked(path):
+            totals = load_metrics(path)
+            totals.merge(REGISTRY)
+            REGISTRY.reset()
+            atomic_write_bytes(path, json.dumps(totals.to_dict(), separators=(",", ":")).encode("utf-8"))
+            if prometheus_path is not None:
+                atomic_write_bytes(prometheus_path, totals.prometheus_text().encode("utf-8"))
+    finally:
+        REGISTRY.enabled = was_enabled
+    return totals
+
+
+__all__ = [
+    "Histogram",
+    "LATENCY_BUCKETS",
+    "MetricsRegistry",
+    "REGISTRY",
+    "counted",
+    "enable",
+    "enabled",
+    "flush",
+    "inc",
+    "load_metrics",
+    "metrics_path_for",
+    "prometheus_path_for",
+    "timed",
+    "timer",
+]
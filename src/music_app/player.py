@@ -5,11 +5,16 @@ from __future__ import annotations
 from collections import deque
 from dataclasses import dataclass
 from datetime import datetime, timedelta
-from typing import Deque, Iterable, Optional
+from typing import TYPE_CHECKING, Callable, Deque, Iterable, Optional
 
+from . import metrics
 from .audio_effects import EqualizerBank, EqualizerPreset
 from .library import MusicLibrary, Track
 from .playlist import Playlist
+from .transitions import TransitionModel
+
+if TYPE_CHECKING:
+    from .history import HistoryLog
 
 
 @dataclass
@@ -22,6 +27,16 @@ class PlaybackEvent:
     metadata: Optional[dict[str, object]] = None
 
 
+def default_equalizer_bank() -> EqualizerBank:
+    return EqualizerBank(
+        [
+            EqualizerPreset("flat"),
+            EqualizerPreset("bass_boost", {"bass": 4.0, "low_mid": 2.0}),
+            EqualizerPreset("acoustic", {"mid": 2.5, "presence": 3.0, "brilliance": 2.0}),
+        ]
+    )
+
+
 class MusicPlayer:
     """Advanced simulation of a music player with queue management."""
 
@@ -30,21 +45,26 @@ class MusicPlayer:
         library: MusicLibrary,
         equalizer_bank: Optional[EqualizerBank] = None,
         crossfade_seconds: int = 5,
+        transitions: Optional[TransitionModel] = None,
+        history_log: Optional[HistoryLog] = None,
+        on_play: Optional[Callable[[Track], None]] = None,
+        clock: Optional[Callable[[], datetime]] = None,
     ) -> None:
         self.library = library
+        self.transitions = transitions
+        self.history_log = history_log
+        # A session host can take over play accounting (``on_play`` instead of
+        # ``Track.mark_played``) and stamp events with real time (``clock``).
+        self.on_play = on_play
+        self.clock = clock
         self.crossfade_seconds = crossfade_seconds
-        self.equalizer_bank = equalizer_bank or EqualizerBank(
-            [
-                EqualizerPreset("flat"),
-                EqualizerPreset("bass_boost", {"bass": 4.0, "low_mid": 2.0}),
-                EqualizerPreset("acoustic", {"mid": 2.5, "presence": 3.0, "brilliance": 2.0}),
-            ]
-        )
+        self.equalizer_bank = equalizer_bank or default_equalizer_bank()
         self.current_track: Optional[Track] = None
         self.queue: Deque[str] = deque()
         self.history: Deque[PlaybackEvent] = deque(maxlen=100)
         self.active_preset = "flat"
         self._time_pointer = datetime.utcnow()
+        self._last_played_id: Optional[str] = None
 
     # -- Queue operations -------------------------------------------------
     def enqueue(self, track_ids: Iterable[str]) -> None:
@@ -57,17 +77,27 @@ class MusicPlayer:
             return None
         track_id = self.queue.popleft()
         track = self.library.get_track(track_id)
-        track.mark_played()
+        if self.on_play is not None:
+            self.on_play(track)
+        else:
+            track.mark_played()
         self.current_track = track
         self._advance_time(track.duration_seconds)
         self._log_event("play", track_id)
         return track
 
     def play_playlist(self, playlist: Playlist) -> None:
+        """Play the queue through ``playlist`` and end the listening session.
+
+        The closing ``queue_empty`` keeps the next playlist's first track from
+        counting as a transition from this one's last.
+        """
+
         self.enqueue(playlist.track_ids)
         while self.queue:
             self.play_next()
             self._apply_crossfade()
+        self.play_next()
 
     def skip(self) -> None:
         if self.current_track:
@@ -102,17 +132,27 @@ class MusicPlayer:
         self._advance_time(-overlap)
         self._log_event("crossfade", metadata={"seconds": overlap})
 
+    @metrics.timed("music_player_log_event_seconds")
     def _log_event(self, action: str, track_id: Optional[str] = None, metadata: Optional[dict[str, object]] = None) -> None:
         event = PlaybackEvent(
-            timestamp=self._time_pointer,
+            timestamp=self.clock() if self.clock is not None else self._time_pointer,
             action=action,
             track_id=track_id,
             metadata=metadata,
         )
         self.history.append(event)
+        metrics.inc("music_player_events_total", action=action)
+        if self.history_log is not None:
+            self.history_log.append(event)
+        if action == "play":
+            if self.transitions is not None and self._last_played_id is not None and track_id is not None:
+                self.transitions.observe(self._last_played_id, track_id)
+            self._last_played_id = track_id
+        elif action == "queue_empty":
+            self._last_played_id = None  # the listening session ended
 
     def _advance_time(self, seconds: int) -> None:
         self._time_pointer += timedelta(seconds=seconds)
 
 
-__all__ = ["MusicPlayer", "PlaybackEvent"]
+__all__ = ["MusicPlayer", "PlaybackEvent", "default_equalizer_bank"]
@@ -3,57 +3,231 @@
 from __future__ import annotations
 
 from dataclasses import dataclass, field
-from typing import Iterable, List
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
 
 from .library import MusicLibrary, Track
+from .playlist_store import PlaylistStore
+
+
+class MissingTracksError(KeyError):
+    """Raised by :meth:`Playlist.expand` with every id the library lacks."""
+
+    def __init__(self, playlist: str, missing: List[str]) -> None:
+        super().__init__(f"Playlist {playlist!r} references {len(missing)} missing track(s): {', '.join(missing)}")
+        self.missing = missing
+
+    def __str__(self) -> str:
+        return str(self.args[0])
+
+
+class TrackIdList(List[str]):
+    """A list of track ids that also counts them, for O(1) membership.
+
+    It is a real ``list``, so list methods, slicing, comparisons and
+    ``json.dumps`` work unchanged; every mutating method keeps the counts in
+    step. :meth:`add` and :meth:`discard` give the set-like edits that
+    :class:`Playlist` uses.
+    """
+
+    def __init__(self, track_ids: Iterable[str] = ()) -> None:
+        super().__init__(track_ids)
+        self._counts: Dict[str, int] = {}
+        self._count_all(self)
+
+    def __reduce__(self) -> tuple:
+        return type(self), (list(self),)
+
+    def __contains__(self, track_id: object) -> bool:
+        return track_id in self._counts
+
+    def count(self, track_id: object) -> int:
+        return self._counts.get(track_id, 0)  # type: ignore[call-overload]
+
+    def _count_all(self, track_ids: Iterable[str], step: int = 1) -> None:
+        counts = self._counts
+        for track_id in track_ids:
+            remaining = counts.get(track_id, 0) + step
+            if remaining:
+                counts[track_id] = remaining
+            else:
+                del counts[track_id]
+
+    # -- Set-like edits ----------------------------------------------------
+    def add(self, track_id: str) -> bool:
+        """Append ``track_id`` unless present; returns whether it was added."""
+
+        if track_id in self._counts:
+            return False
+        self.append(track_id)
+        return True
+
+    def discard(self, track_id: str) -> bool:
+        """Remove the first ``track_id`` if present; returns whether one was removed."""
+
+        if track_id not in self._counts:
+            return False
+        self.remove(track_id)
+        return True
+
+    # -- List edits --------------------------------------------------------
+    def append(self, track_id: str) -> None:
+        super().append(track_id)
+        self._counts[track_id] = self._counts.get(track_id, 0) + 1
+
+    def extend(self, track_ids: Iterable[str]) -> None:
+        added = list(track_ids)
+        super().extend(added)
+        self._count_all(added)
+
+    def __iadd__(self, track_ids: Iterable[str]) -> TrackIdList:  # type: ignore[override,misc]
+        self.extend(track_ids)
+        return self
+
+    def __imul__(self, times: int) -> TrackIdList:  # type: ignore[override,misc]
+        self[:] = list(self) * times
+        return self
+
+    def insert(self, index: int, track_id: str) -> None:  # type: ignore[override]
+        super().insert(index, track_id)
+        self._counts[track_id] = self._counts.get(track_id, 0) + 1
+
+    def remove(self, track_id: str) -> None:
+        super().remove(track_id)
+        self._count_all((track_id,), -1)
+
+    def pop(self, index: int = -1) -> str:  # type: ignore[override]
+        track_id = super().pop(index)
+        self._count_all((track_id,), -1)
+        return track_id
+
+    def clear(self) -> None:
+        super().clear()
+        self._counts.clear()
+
+    def __setitem__(self, index: Any, value: Any) -> None:
+        old = self[index] if isinstance(index, slice) else [self[index]]
+        new = list(value) if isinstance(index, slice) else [value]
+        super().__setitem__(index, new if isinstance(index, slice) else value)
+        self._count_all(old, -1)
+        self._count_all(new)
+
+    def __delitem__(self, index: Any) -> None:
+        old = self[index] if isinstance(index, slice) else [self[index]]
+        super().__delitem__(index)
+        self._count_all(old, -1)
 
 
 @dataclass
 class Playlist:
-    """A playlist is an ordered collection of track identifiers."""
+    """A playlist is an ordered collection of track identifiers.
+
+    ``track_ids`` is kept as a :class:`TrackIdList`, in the order given and
+    with any repeats; :meth:`add_track` skips ids already present.
+    """
 
     name: str
-    track_ids: List[str] = field(default_factory=list)
+    track_ids: List[str] = field(default_factory=TrackIdList)
+
+    def __post_init__(self) -> None:
+        if not isinstance(self.track_ids, TrackIdList):
+            self.track_ids = TrackIdList(self.track_ids)
+
+    @property
+    def _ids(self) -> TrackIdList:
+        if not isinstance(self.track_ids, TrackIdList):
+            self.track_ids = TrackIdList(self.track_ids)  # a plain list assigned later
+        return self.track_ids
 
     def add_track(self, track_id: str) -> None:
-        if track_id not in self.track_ids:
-            self.track_ids.append(track_id)
+        self._ids.add(track_id)
 
     def add_tracks(self, track_ids: Iterable[str]) -> None:
+        ids = self._ids
         for track_id in track_ids:
-            self.add_track(track_id)
+            ids.add(track_id)
 
     def remove_track(self, track_id: str) -> None:
-        if track_id in self.track_ids:
-            self.track_ids.remove(track_id)
+        self._ids.discard(track_id)
 
     def reorder(self, old_index: int, new_index: int) -> None:
         track_id = self.track_ids.pop(old_index)
         self.track_ids.insert(new_index, track_id)
 
     def expand(self, library: MusicLibrary) -> List[Track]:
-        return [library.get_track(track_id) for track_id in self.track_ids]
+        """Resolve every id in one pass; raises :class:`MissingTracksError` listing all missing ids."""
+
+        tracks, missing = library.get_tracks(self.track_ids)
+        if missing:
+            raise MissingTracksError(self.name, missing)
+        return tracks
 
 
 class PlaylistCollection:
-    """A collection of playlists stored in memory."""
+    """A collection of playlists, in memory or persisted under ``path``.
+
+    A persistent collection only reads playlist names on startup; each
+    playlist's tracks are loaded from its array file on first access. Use
+    :meth:`append` and :meth:`update` to persist edits to stored playlists.
+    """
 
-    def __init__(self) -> None:
+    def __init__(self, path: Optional[Path] = None) -> None:
         self._playlists: dict[str, Playlist] = {}
+        self._store = PlaylistStore(path) if path is not None else None
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._playlists or (self._store is not None and name in self._store)
+
+    def __len__(self) -> int:
+        return len(self.names())
+
+    def names(self) -> List[str]:
+        if self._store is None:
+            return list(self._playlists)
+        return self._store.names()
 
     def add(self, playlist: Playlist) -> None:
-        if playlist.name in self._playlists:
+        if playlist.name in self:
             raise ValueError(f"Playlist {playlist.name!r} already exists")
+        if self._store is not None:
+            self._store.create(playlist.name, playlist.track_ids)
         self._playlists[playlist.name] = playlist
 
     def get(self, name: str) -> Playlist:
-        try:
-            return self._playlists[name]
-        except KeyError as exc:
-            raise KeyError(f"Playlist {name!r} not found") from exc
+        playlist = self._playlists.get(name)
+        if playlist is not None:
+            return playlist
+        if self._store is None or name not in self._store:
+            raise KeyError(f"Playlist {name!r} not found")
+        playlist = self._playlists[name] = Playlist(name=name, track_ids=TrackIdList(self._store.iter_ids(name)))
+        return playlist
+
+    def append(self, name: str, track_ids: Iterable[str]) -> int:
+        """Add tracks to the end of ``name``; only the new ids are written. Returns how many were added."""
+
+        playlist = self.get(name)
+        added = [track_id for track_id in track_ids if playlist._ids.add(track_id)]
+        if added and self._store is not None:
+            self._store.append(name, added)
+        return len(added)
+
+    def update(self, playlist: Playlist) -> None:
+        """Persist ``playlist`` after removals or reorders, rewriting only its own array."""
+
+        self.get(playlist.name)
+        self._playlists[playlist.name] = playlist
+        if self._store is not None:
+            self._store.replace(playlist.name, playlist.track_ids)
+
+    def remove(self, name: str) -> None:
+        if name not in self:
+            raise KeyError(f"Playlist {name!r} not found")
+        self._playlists.pop(name, None)
+        if self._store is not None:
+            self._store.delete(name)
 
     def list(self) -> List[Playlist]:
-        return list(self._playlists.values())
+        return [self.get(name) for name in self.names()]
 
 
-__all__ = ["Playlist", "PlaylistCollection"]
+__all__ = ["MissingTracksError", "Playlist", "PlaylistCollection", "TrackIdList"]
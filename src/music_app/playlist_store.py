@@ -0,0 +1,179 @@
+"""On-disk playlist storage as memory-mappable arrays of interned track ids.
+
+A store is a directory next to the library file::
+
+    ids             append-only table of track ids, each a u32 length and
+                    UTF-8 bytes; an id's position is its integer id
+    playlists.json  playlist name -> array file name (the only file that is
+                    rewritten when playlists are created or deleted)
+    <n>.u32         one array of u32 track ids per playlist, in order
+
+Opening a store reads only ``playlists.json``. Arrays are mapped when a
+playlist is first read; appending tracks appends to its array file and to
+the id table, and other edits rewrite only the affected playlist's array.
+A torn tail left by a crash is ignored on read and truncated before the
+next append, as with the library journal.
+"""
+
+from __future__ import annotations
+
+import json
+import mmap
+import os
+import struct
+from array import array
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from .journal import atomic_write_bytes
+
+PLAYLISTS_SUFFIX = ".playlists"
+HEADERS_NAME = "playlists.json"
+IDS_NAME = "ids"
+ARRAY_SUFFIX = ".u32"
+_LENGTH = struct.Struct("<I")
+WINDOW_BYTES = 64 * 1024
+
+
+def playlists_path_for(library_path: Path) -> Path:
+    return library_path.with_name(library_path.name + PLAYLISTS_SUFFIX)
+
+
+class _IdTable:
+    """Append-only intern table mapping track ids to dense integers."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._ids: Optional[List[str]] = None
+        self._numbers: Dict[str, int] = {}
+        self._valid_size = 0
+
+    def table(self) -> List[str]:
+        if self._ids is None:
+            ids: List[str] = []
+            data = self.path.read_bytes() if self.path.exists() else b""
+            position = 0
+            while position + _LENGTH.size <= len(data):
+                (length,) = _LENGTH.unpack_from(data, position)
+                end = position + _LENGTH.size + length
+                if end > len(data):
+                    break
+                ids.append(data[position + _LENGTH.size : end].decode("utf-8"))
+                position = end
+            self._ids = ids
+            self._numbers = {track_id: number for number, track_id in enumerate(ids)}
+            self._valid_size = position
+        return self._ids
+
+    def intern_all(self, track_ids: Iterable[str]) -> array:
+        """Numbers for ``track_ids``, appending unseen ids to the table file."""
+
+        ids = self.table()
+        numbers = array("I")
+        pending = bytearray()
+        for track_id in track_ids:
+            number = self._numbers.get(track_id)
+            if number is None:
+                number = self._numbers[track_id] = len(ids)
+                ids.append(track_id)
+                encoded = track_id.encode("utf-8")
+                pending += _LENGTH.pack(len(encoded)) + encoded
+            numbers.append(number)
+        if pending:
+            _append(self.path, bytes(pending), self._valid_size)
+            self._valid_size += len(pending)
+        return numbers
+
+
+def _append(path: Path, data: bytes, valid_size: int) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("ab") as fh:
+        if fh.tell() != valid_size:
+            fh.truncate(valid_size)
+        fh.write(data)
+        fh.flush()
+        os.fsync(fh.fileno())
+
+
+class PlaylistStore:
+    """Playlist arrays under ``path``; see the module docstring for the layout."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._ids = _IdTable(path / IDS_NAME)
+        headers = path / HEADERS_NAME
+        self._files: Dict[str, str] = json.loads(headers.read_text("utf-8")) if headers.exists() else {}
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._files
+
+    def __len__(self) -> int:
+        return len(self._files)
+
+    def names(self) -> List[str]:
+        return list(self._files)
+
+    def track_count(self, name: str) -> int:
+        """Number of tracks in ``name``, read from the array's size alone."""
+
+        return self._array_path(name).stat().st_size // 4
+
+    def read(self, name: str) -> List[str]:
+        return list(self.iter_ids(name))
+
+    def iter_ids(self, name: str) -> Iterator[str]:
+        path = self._array_path(name)
+        size = path.stat().st_size // 4 * 4
+        if not size:
+            return iter(())
+        return self._iter_mapped(path, size)
+
+    def _iter_mapped(self, path: Path, size: int) -> Iterator[str]:
+        # Decode a page-sized window at a time, so only the pages iterated
+        # so far are read and memory stays bounded for long playlists.
+        table = self._ids.table()
+        with path.open("rb") as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for start in range(0, size, WINDOW_BYTES):
+                numbers = array("I")
+                numbers.frombytes(mapped[start : min(size, start + WINDOW_BYTES)])
+                for number in numbers:
+                    yield table[number]
+
+    def create(self, name: str, track_ids: Iterable[str] = ()) -> None:
+        if name in self._files:
+            raise ValueError(f"Playlist {name!r} already exists")
+        file_name = f"{_next_number(self._files.values())}{ARRAY_SUFFIX}"
+        atomic_write_bytes(self.path / file_name, self._ids.intern_all(track_ids).tobytes())
+        self._files[name] = file_name
+        self._write_headers()
+
+    def append(self, name: str, track_ids: Iterable[str]) -> None:
+        path = self._array_path(name)
+        numbers = self._ids.intern_all(track_ids)
+        if numbers:
+            _append(path, numbers.tobytes(), path.stat().st_size // 4 * 4)
+
+    def replace(self, name: str, track_ids: Iterable[str]) -> None:
+        atomic_write_bytes(self._array_path(name), self._ids.intern_all(track_ids).tobytes())
+
+    def delete(self, name: str) -> None:
+        path = self._array_path(name)
+        del self._files[name]
+        self._write_headers()
+        path.unlink(missing_ok=True)
+
+    def _array_path(self, name: str) -> Path:
+        try:
+            return self.path / self._files[name]
+        except KeyError as exc:
+            raise KeyError(f"Playlist {name!r} not found") from exc
+
+    def _write_headers(self) -> None:
+        atomic_write_bytes(self.path / HEADERS_NAME, json.dumps(self._files, indent=2).encode("utf-8"))
+
+
+def _next_number(file_names: Iterable[str]) -> int:
+    return max((int(file_name[: -len(ARRAY_SUFFIX)]) for file_name in file_names), default=-1) + 1
+
+
+__all__ = ["PlaylistStore", "playlists_path_for", "PLAYLISTS_SUFFIX"]
@@ -0,0 +1,288 @@
+"""Structured track queries compiled into index-backed plans.
+
+A query is a list of terms separated by whitespace or commas::
+
+    genre=Ambient bpm=85..100 duration<300 mood=calm played=never
+
+* ``field=value`` matches case-insensitively; ``a|b`` matches either value.
+* ``field!=value`` excludes a value.
+* ``<``, ``<=``, ``>``, ``>=`` and ``lo..hi`` (inclusive) compare numbers and
+  ISO timestamps; either side of ``..`` may be left open.
+* ``field=never`` / ``field=none`` matches tracks where the field is unset.
+* Bare words are matched as one substring against title, artist, album,
+  genre and moods, exactly like :meth:`MusicLibrary.search`.
+"""
+
+from __future__ import annotations
+
+import heapq
+import re
+import shlex
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from . import metrics
+from .indexes import HashIndex, SortedIndex, SubstringIndex, TrackIndex
+
+if TYPE_CHECKING:
+    from .library import MusicLibrary, Track
+
+
+class QueryError(ValueError):
+    """Raised for malformed query expressions."""
+
+
+@dataclass(frozen=True)
+class FieldSpec:
+    attribute: str
+    kind: str  # "hash", "range" or "scan"
+    numeric: bool = False
+
+
+FIELDS: Dict[str, FieldSpec] = {
+    "title": FieldSpec("title", "scan"),
+    "album": FieldSpec("album", "scan"),
+    "artist": FieldSpec("artist", "hash"),
+    "genre": FieldSpec("genre", "hash"),
+    "mood": FieldSpec("moods", "hash"),
+    "moods": FieldSpec("moods", "hash"),
+    "bpm": FieldSpec("bpm", "range", numeric=True),
+    "duration": FieldSpec("duration_seconds", "range", numeric=True),
+    "duration_seconds": FieldSpec("duration_seconds", "range", numeric=True),
+    "plays": FieldSpec("play_count", "range", numeric=True),
+    "play_count": FieldSpec("play_count", "range", numeric=True),
+    "played": FieldSpec("last_played", "range"),
+    "last_played": FieldSpec("last_played", "range"),
+}
+
+MISSING_VALUES = {"never", "none", "null"}
+_TERM = re.compile(r"^(?P<field>[A-Za-z_]+)(?P<op><=|>=|!=|=|<|>)(?P<value>.*)$")
+
+
+@dataclass(frozen=True)
+class Predicate:
+    """One compiled query term."""
+
+    attribute: str
+    kind: str  # "text", "eq", "ne", "range" or "missing"
+    values: Tuple[Any, ...] = ()
+    low: Any = None
+    high: Any = None
+    low_inclusive: bool = True
+    high_inclusive: bool = True
+
+    def matches(self, track: Track) -> bool:
+        if self.kind == "text":
+            needle = self.values[0].lower()
+            return any(
+                needle in text.lower()
+                for text in (track.title, track.artist, track.album, track.genre, *track.moods)
+            )
+        value = getattr(track, self.attribute)
+        if self.kind == "missing":
+            return value is None
+        if self.kind in {"eq", "ne"}:
+            if value is None:
+                found = False
+            elif isinstance(value, list):
+                found = any(item.lower() in self.values for item in value)
+            elif isinstance(value, str):
+                found = value.lower() in self.values
+            else:
+                found = value in self.values
+            return found if self.kind == "eq" else not found
+        if value is None:
+            return False
+        if self.low is not None and (value < self.low or (value == self.low and not self.low_inclusive)):
+            return False
+        if self.high is not None and (value > self.high or (value == self.high and not self.high_inclusive)):
+            return False
+        return True
+
+    def describe(self) -> str:
+        if self.kind == "text":
+            return f"text~{self.values[0]!r}"
+        if self.kind == "missing":
+            return f"{self.attribute} is unset"
+        if self.kind in {"eq", "ne"}:
+            op = "=" if self.kind == "eq" else "!="
+            return f"{self.attribute}{op}{'|'.join(map(str, self.values))}"
+        low = "" if self.low is None else f"{self.low}{'<=' if self.low_inclusive else '<'}"
+        high = "" if self.high is None else f"{'<=' if self.high_inclusive else '<'}{self.high}"
+        return f"{low}{self.attribute}{high}"
+
+
+def _coerce(spec: FieldSpec, raw: str) -> Any:
+    if not spec.numeric:
+        return raw
+    try:
+        number = float(raw)
+    except ValueError as exc:
+        raise QueryError(f"{spec.attribute} expects a number, got {raw!r}") from exc
+    return int(number) if number.is_integer() else number
+
+
+def _compile_term(term: str) -> Optional[Predicate]:
+    match = _TERM.match(term)
+    if match is None or match.group("field").lower() not in FIELDS:
+        return None
+    spec = FIELDS[match.group("field").lower()]
+    op = match.group("op")
+    value = match.group("value").strip()
+    if not value:
+        raise QueryError(f"missing value in {term!r}")
+    if op in {"=", "!="} and value.lower() in MISSING_VALUES and spec.attribute in {"bpm", "last_played"}:
+        if op == "!=":
+            return Predicate(spec.attribute, "range")
+        return Predicate(spec.attribute, "missing")
+    if op == "=" and ".." in value:
+        if spec.kind != "range":
+            raise QueryError(f"{spec.attribute} does not support ranges")
+        low, _, high = value.partition("..")
+        return Predicate(
+            spec.attribute,
+            "range",
+            low=_coerce(spec, low) if low else None,
+            high=_coerce(spec, high) if high else None,
+        )
+    if op in {"<", "<=", ">", ">="}:
+        if spec.kind != "range":
+            raise QueryError(f"{spec.attribute} does not support {op!r}")
+        bound = _coerce(spec, value)
+        if op.startswith("<"):
+            return Predicate(spec.attribute, "range", high=bound, high_inclusive=op == "<=")
+        return Predicate(spec.attribute, "range", low=bound, low_inclusive=op == ">=")
+    values = tuple(_coerce(spec, item) if spec.numeric else item.lower() for item in value.split("|"))
+    kind = "eq" if op == "=" else "ne"
+    if kind == "eq" and spec.kind == "range":
+        if len(values) == 1:
+            return Predicate(spec.attribute, "range", low=values[0], high=values[0])
+    return Predicate(spec.attribute, kind, values=values)
+
+
+def parse_query(expression: str) -> List[Predicate]:
+    """Compile ``expression`` into predicates that must all hold."""
+
+    lexer = shlex.shlex(expression, posix=True)
+    lexer.whitespace += ","
+    lexer.whitespace_split = True
+    try:
+        tokens = list(lexer)
+    except ValueError:
+        # An unbalanced quote, e.g. the apostrophe in "Don't Stop": plain text.
+        return [Predicate("text", "text", values=(expression,))]
+    predicates: List[Predicate] = []
+    words: List[str] = []
+    for token in tokens:
+        predicate = _compile_term(token)
+        if predicate is None:
+            words.append(token)
+        else:
+            predicates.append(predicate)
+    if words:
+        # Pure free-text keeps its exact spacing so it matches search().
+        text = expression if not predicates else " ".join(words)
+        predicates.insert(0, Predicate("text", "text", values=(text,)))
+    return predicates
+
+
+# -- Planning ---------------------------------------------------------------
+def _index_for(library: MusicLibrary, predicate: Predicate) -> Optional[TrackIndex]:
+    if predicate.kind == "text":
+        # The n-gram index is expensive to build, so only use it once search()
+        # has decided to build it; until then free text is a filter.
+        return library._indexes.get("search")
+    spec = next(spec for spec in FIELDS.values() if spec.attribute == predicate.attribute)
+    if spec.kind == "hash":
+        return library._index(f"hash:{spec.attribute}", lambda: HashIndex(spec.attribute))
+    if spec.kind == "range":
+        return library._index(f"sorted:{spec.attribute}", lambda: SortedIndex(spec.attribute))
+    return None
+
+
+@dataclass
+class PlanStep:
+    predicate: Predicate
+    estimate: int
+    indexed: bool
+
+
+@dataclass
+class QueryPlan:
+    """Predicates ordered by estimated selectivity; the first drives the scan."""
+
+    steps: List[PlanStep]
+    total: int
+
+    def describe(self) -> str:
+        if not self.steps:
+            return f"full scan of {self.total} tracks"
+        lines = []
+        for position, step in enumerate(self.steps):
+            role = "drive" if position == 0 and step.indexed else "filter"
+            source = "index" if step.indexed else "scan"
+            lines.append(f"{role:<6} {step.predicate.describe():<40} ~{step.estimate} rows ({source})")
+        return "\n".join(lines)
+
+
+class QueryPlanner:
+    """Choose the most selective indexed predicate and filter by the rest."""
+
+    def __init__(self, library: MusicLibrary) -> None:
+        self.library = library
+
+    def plan(self, predicates: Iterable[Predicate]) -> QueryPlan:
+        total = len(self.library)
+        steps = []
+        for predicate in predicates:
+            index = _index_for(self.library, predicate)
+            estimate = self._estimate(index, predicate, total)
+            steps.append(PlanStep(predicate, estimate, estimate < total))
+        steps.sort(key=lambda step: step.estimate)
+        return QueryPlan(steps, total)
+
+    def execute(self, plan: QueryPlan, limit: Optional[int] = None, offset: int = 0) -> List[str]:
+        library = self.library
+        if plan.steps and plan.steps[0].indexed:
+            driver, rest = plan.steps[0].predicate, plan.steps[1:]
+            candidates: Iterable[str] = self._candidates(_index_for(library, driver), driver)
+        else:
+            rest = plan.steps
+            candidates = library._tracks.keys()
+        filters: List[Callable[[Track], bool]] = [step.predicate.matches for step in rest]
+        matches = (
+            track_id
+            for track_id in metrics.counted(candidates, "music_tracks_scanned_total", operation="query")
+            if all(check(library._tracks[track_id]) for check in filters)
+        )
+        ordinal = library._track_ordinal
+        if limit is None:
+            return sorted(matches, key=ordinal)[offset:]
+        return heapq.nsmallest(offset + limit, matches, key=ordinal)[offset:]
+
+    @staticmethod
+    def _estimate(index: Optional[TrackIndex], predicate: Predicate, total: int) -> int:
+        if isinstance(index, SubstringIndex):
+            return index.estimate(predicate.values[0])
+        if isinstance(index, HashIndex) and predicate.kind == "eq":
+            return index.count(predicate.values)
+        if isinstance(index, SortedIndex):
+            if predicate.kind == "range":
+                return index.count_range(predicate.low, predicate.high, predicate.low_inclusive, predicate.high_inclusive)
+            if predicate.kind == "missing":
+                return total - len(index)
+        return total
+
+    def _candidates(self, index: Optional[TrackIndex], predicate: Predicate) -> Set[str] | Iterable[str]:
+        if isinstance(index, SubstringIndex):
+            return index.search(predicate.values[0])
+        if isinstance(index, HashIndex):
+            return index.lookup(predicate.values)
+        if isinstance(index, SortedIndex):
+            if predicate.kind == "missing":
+                return [track_id for track_id in self.library._tracks if track_id not in index]
+            return list(index.range(predicate.low, predicate.high, predicate.low_inclusive, predicate.high_inclusive))
+        return self.library._tracks.keys()
+
+
+__all__ = ["FIELDS", "Predicate", "QueryError", "QueryPlan", "QueryPlanner", "parse_query"]
@@ -2,50 +2,156 @@
 
 from __future__ import annotations
 
-from collections import Counter
-from typing import Iterable, List
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Union
 
+from . import metrics
+from .cache import CacheStats, ResultCache
+from .indexes import Profile, SimilarityIndex
 from .library import MusicLibrary, Track
+from .transitions import TransitionModel
+from .trending import TrendingTracker
+
+DECAYED = "decayed"
+
+# Set in recommend_similar_batch() worker processes.
+_worker_index: Optional[SimilarityIndex] = None
+
+
+def _init_worker(index: SimilarityIndex) -> None:
+    global _worker_index
+    _worker_index = index
+
+
+def _rank_profile(profile: Profile, limit: int) -> List[str]:
+    assert _worker_index is not None
+    return _worker_index.ranked(profile, limit)
 
 
 class RecommendationEngine:
-    """Suggest tracks using hybrid popularity and mood filtering."""
+    """Suggest tracks using hybrid popularity and mood filtering.
+
+    Results are cached per method and arguments in a bounded LRU that is
+    invalidated through the library's version counters. Popularity-based
+    results normally follow every play; with ``coarse_invalidation`` they
+    only follow catalog changes and go stale for at most ``cache_ttl``
+    seconds, so play-count churn does not empty the cache. That bound is why
+    ``coarse_invalidation`` requires a ``cache_ttl``.
+    """
 
-    def __init__(self, library: MusicLibrary) -> None:
+    def __init__(
+        self,
+        library: MusicLibrary,
+        cache_size: int = 256,
+        cache_ttl: Optional[float] = None,
+        coarse_invalidation: bool = False,
+        trending: Optional[TrendingTracker] = None,
+        transitions: Optional[TransitionModel] = None,
+    ) -> None:
+        if coarse_invalidation and cache_ttl is None:
+            raise ValueError("coarse_invalidation needs a cache_ttl to bound how stale results get")
         self.library = library
+        self.trending = trending
+        self.transitions = transitions
+        self.coarse_invalidation = coarse_invalidation
+        self._cache: ResultCache[List[Track]] = ResultCache(maxsize=cache_size, ttl=cache_ttl)
 
+    def cache_stats(self) -> CacheStats:
+        return self._cache.stats()
+
+    def clear_cache(self) -> None:
+        self._cache.clear()
+
+    def _cached(self, key: Hashable, by_popularity: bool, compute: Callable[[], List[Track]]) -> List[Track]:
+        library = self.library
+        token = library.version if by_popularity and not self.coarse_invalidation else library.catalog_version
+        # Hand out copies so callers cannot edit a cached list.
+        return list(self._cache.get_or_compute(key, token, compute))
+
+    @metrics.timed("music_recommendation_seconds", method="mood")
     def recommend_by_mood(self, mood: str, limit: int = 5) -> List[Track]:
-        mood_lower = mood.lower()
-        matching = [
-            track
-            for track in self.library.list_tracks()
-            if any(mood_lower in entry.lower() for entry in track.moods)
-        ]
-        return self._rank_by_popularity(matching)[:limit]
+        """Most popular tracks with a mood containing ``mood`` (case-insensitive)."""
+
+        return self._cached(("mood", mood.lower(), limit), True, lambda: self.library.popular_tracks(limit, mood=mood))
 
+    @metrics.timed("music_recommendation_seconds", method="similar")
     def recommend_similar(self, seed: Track, limit: int = 5) -> List[Track]:
-        candidates = [track for track in self.library.list_tracks() if track.id != seed.id]
-        ranked = sorted(
-            candidates,
-            key=lambda track: (
-                -self._shared_tags(seed, track),
-                track.genre != seed.genre,
-                abs((track.bpm or 0) - (seed.bpm or 0)),
-            ),
-        )
-        return ranked[:limit]
-
-    def top_trending(self, limit: int = 10) -> List[Track]:
-        return self._rank_by_popularity(self.library.list_tracks())[:limit]
-
-    def _rank_by_popularity(self, tracks: Iterable[Track]) -> List[Track]:
-        return sorted(tracks, key=lambda track: (track.play_count, track.last_played or ""), reverse=True)
-
-    @staticmethod
-    def _shared_tags(a: Track, b: Track) -> int:
-        a_tags = Counter([a.genre, *a.moods])
-        b_tags = Counter([b.genre, *b.moods])
-        return sum((a_tags & b_tags).values())
-
-
-__all__ = ["RecommendationEngine"]
+        """Rank by shared genre/mood tags, then same genre, then bpm distance.
+
+        Ties keep library order. ``seed`` itself is never recommended.
+        """
+
+        key = ("similar", seed.id, seed.genre, tuple(seed.moods), seed.bpm, limit)
+        return self._cached(key, False, lambda: self.recommend_similar_batch([seed], limit)[0])
+
+    @metrics.timed("music_recommendation_seconds", method="similar_batch")
+    def recommend_similar_batch(self, seeds: Iterable[Track], limit: int = 5, workers: int = 0) -> List[List[Track]]:
+        """:meth:`recommend_similar` for many seeds, one result list per seed.
+
+        Seeds with the same genre, moods and bpm share a single ranking. With
+        ``workers > 1`` the distinct rankings are computed in a process pool
+        that receives the similarity index once per worker.
+        """
+
+        index = self.library._index("similarity", SimilarityIndex)
+        seeds = list(seeds)
+        profiles = [index.profile(seed) for seed in seeds]
+        distinct = list(dict.fromkeys(profiles))
+        # One spare result, in case the seed itself ranks among the first.
+        depth = max(0, limit) + 1
+        ranked: Dict[Profile, List[str]]
+        if workers > 1 and len(distinct) > 1:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(index,)) as executor:
+                chunksize = max(1, len(distinct) // (workers * 4))
+                ranked = dict(zip(distinct, executor.map(_rank_profile, distinct, repeat(depth), chunksize=chunksize)))
+        else:
+            ranked = {profile: index.ranked(profile, depth) for profile in distinct}
+        get_track = self.library.get_track
+        return [
+            [get_track(track_id) for track_id in ranked[profile] if track_id != seed.id][: max(0, limit)]
+            for seed, profile in zip(seeds, profiles)
+        ]
+
+    @metrics.timed("music_recommendation_seconds", method="next")
+    def recommend_next(self, track_id: str, limit: int = 5) -> List[Track]:
+        """Tracks most often played right after ``track_id``; needs a ``TransitionModel``."""
+
+        if self.transitions is None:
+            raise ValueError("recommend_next needs a TransitionModel fed by MusicPlayer")
+        tracks: List[Track] = []
+        for successor, _ in self.transitions.successors(track_id):
+            if len(tracks) >= limit:
+                break
+            try:
+                tracks.append(self.library.get_track(successor))
+            except KeyError:
+                continue  # removed from the library since it was played
+        return tracks
+
+    @metrics.timed("music_recommendation_seconds", method="trending")
+    def top_trending(self, limit: int = 10, window: Union[None, float, str] = None) -> List[Track]:
+        """Rank by all-time plays, or by a ``TrendingTracker`` window.
+
+        ``window`` may be a number of seconds for a sliding window or
+        ``"decayed"`` for exponentially decayed play counts; both need the
+        engine's ``trending`` tracker.
+        """
+
+        if window is None:
+            return self._cached(("trending", limit), True, lambda: self.library.popular_tracks(limit))
+        if self.trending is None:
+            raise ValueError("windowed trending needs a TrendingTracker attached to the library")
+        ranked = self.trending.ranked(None if window == DECAYED else float(window))
+        tracks: List[Track] = []
+        for track_id, _ in ranked:
+            if len(tracks) >= limit:
+                break
+            try:
+                tracks.append(self.library.get_track(track_id))
+            except KeyError:
+                continue  # removed since it was played
+        return tracks
+
+
+__all__ = ["RecommendationEngine", "DECAYED"]
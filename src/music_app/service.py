@@ -0,0 +1,284 @@
+"""asyncio host for many concurrent listener sessions over one library.
+
+Each :class:`ListenerSession` drives its own :class:`MusicPlayer` queue with
+real timers: a track plays for its duration (scaled by ``time_scale``),
+minus the crossfade overlap when another track is queued. Sessions never
+call ``Track.mark_played`` themselves; plays are handed to one writer task
+that aggregates them and applies each batch with
+:meth:`MusicLibrary.record_plays` followed by a single ``save()``, so play
+counts cannot race and persistence cost is per batch, not per play. A
+failed save is logged and retried with the next batch, and the writer keeps
+running; only the final save in :meth:`PlayerService.stop` raises.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import itertools
+import logging
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+
+from .audio_effects import EqualizerBank
+from .history import HistoryLog
+from .library import MusicLibrary, Track
+from .player import MusicPlayer
+from .transitions import TransitionModel
+
+DEFAULT_FLUSH_INTERVAL = 5.0
+DEFAULT_FLUSH_PLAYS = 1000
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ServiceStats:
+    sessions: int = 0
+    pending_plays: int = 0
+    applied_plays: int = 0
+    batches: int = 0
+
+
+class ListenerSession:
+    """One listener's queue, played in real time by a background task."""
+
+    def __init__(self, service: PlayerService, session_id: str, player: MusicPlayer) -> None:
+        self.id = session_id
+        self.player = player
+        self._service = service
+        self._task: Optional[asyncio.Task] = None
+        self._skip = asyncio.Event()
+
+    @property
+    def playing(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def enqueue(self, track_ids: Iterable[str]) -> None:
+        """Queue tracks; playback starts if the session is idle."""
+
+        self.player.enqueue(track_ids)
+        if not self.playing:
+            self._task = asyncio.get_running_loop().create_task(self._run(), name=f"session-{self.id}")
+
+    def skip(self) -> None:
+        """Stop the current track now and move on to the next one."""
+
+        self._skip.set()
+
+    async def wait_idle(self) -> None:
+        if self._task is not None:
+            await asyncio.shield(self._task)
+
+    async def cancel(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self) -> None:
+        player = self.player
+        scale = self._service.time_scale
+        while player.queue:
+            track = player.play_next()
+            assert track is not None
+            overlap = min(player.crossfade_seconds, track.duration_seconds)
+            skipped = await self._sleep((track.duration_seconds - overlap) * scale)
+            if skipped:
+                player._log_event("skip", track.id)
+                continue
+            if player.queue:
+                player._apply_crossfade()
+            elif await self._sleep(overlap * scale):
+                player._log_event("skip", track.id)
+        player.play_next()  # logs queue_empty, ending the listening session
+
+    async def _sleep(self, seconds: float) -> bool:
+        """Wait ``seconds``; returns whether :meth:`skip` cut the wait short."""
+
+        self._skip.clear()
+        if seconds <= 0:
+            await asyncio.sleep(0)
+            return False
+        try:
+            await asyncio.wait_for(self._skip.wait(), seconds)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+
+class PlayerService:
+    """Schedules listener sessions and owns every play-count write.
+
+    Plays are flushed to the library when ``flush_plays`` are pending or
+    ``flush_interval`` seconds after the first pending play, and once more
+    on :meth:`stop`. ``time_scale`` multiplies every playback delay (use a
+    small value for tests and load simulation).
+    """
+
+    def __init__(
+        self,
+        library: MusicLibrary,
+        crossfade_seconds: int = 5,
+        time_scale: float = 1.0,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        flush_plays: int = DEFAULT_FLUSH_PLAYS,
+        equalizer_bank: Optional[EqualizerBank] = None,
+        history_log: Optional[HistoryLog] = None,
+        transitions: Optional[TransitionModel] = None,
+    ) -> None:
+        self.library = library
+        self.crossfade_seconds = crossfade_seconds
+        self.time_scale = time_scale
+        self.flush_interval = flush_interval
+        self.flush_plays = flush_plays
+        self.equalizer_bank = equalizer_bank
+        self.history_log = history_log
+        self.transitions = transitions
+        self.sessions: Dict[str, ListenerSession] = {}
+        self._numbers = itertools.count(1)
+        self._plays: Optional[asyncio.Queue] = None
+        self._writer: Optional[asyncio.Task] = None
+        self._unsaved = 0  # plays applied to the library but not saved yet
+        self._stats = ServiceStats()
+
+    async def __aenter__(self) -> PlayerService:
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        await self.stop()
+
+    async def start(self) -> None:
+        if self._writer is None:
+            self._plays = asyncio.Queue()
+            self._writer = asyncio.get_running_loop().create_task(self._write(), name="play-writer")
+
+    async def stop(self) -> None:
+        """Cancel every session, then apply and save the remaining plays."""
+
+        for session in list(self.sessions.values()):
+            await session.cancel()
+        self.sessions.clear()
+        try:
+            if self._writer is not None:
+                assert self._plays is not None
+                self._plays.put_nowait(None)
+                writer, self._writer = self._writer, None
+                await writer
+        finally:
+            if self.history_log is not None:
+                self.history_log.close()
+
+    # -- Sessions ----------------------------------------------------------
+    def open_session(self, session_id: Optional[str] = None) -> ListenerSession:
+        if self._writer is None:
+            raise RuntimeError("PlayerService.start() must be awaited before opening sessions")
+        session_id = session_id or f"s{next(self._numbers)}"
+        if session_id in self.sessions:
+            raise ValueError(f"Session {session_id!r} already exists")
+        player = MusicPlayer(
+            self.library,
+            equalizer_bank=self.equalizer_bank,
+            crossfade_seconds=self.crossfade_seconds,
+            transitions=self.transitions,
+            history_log=self.history_log,
+            on_play=self._record_play,
+            clock=datetime.utcnow,
+        )
+        session = self.sessions[session_id] = ListenerSession(self, session_id, player)
+        return session
+
+    def get_session(self, session_id: str) -> ListenerSession:
+        try:
+            return self.sessions[session_id]
+        except KeyError as exc:
+            raise KeyError(f"Session {session_id!r} not found") from exc
+
+    async def close_session(self, session_id: str) -> None:
+        session = self.sessions.pop(session_id, None)
+        if session is not None:
+            await session.cancel()
+
+    def stats(self) -> ServiceStats:
+        return ServiceStats(
+            sessions=len(self.sessions),
+            pending_plays=self._plays.qsize() if self._plays is not None else 0,
+            applied_plays=self._stats.applied_plays,
+            batches=self._stats.batches,
+        )
+
+    # -- Writer ------------------------------------------------------------
+    def _record_play(self, track: Track) -> None:
+        assert self._plays is not None
+        self._plays.put_nowait(track.id)
+
+    async def _write(self) -> None:
+        assert self._plays is not None
+        plays = self._plays
+        loop = asyncio.get_running_loop()
+        pending: Counter = Counter()
+        count = 0
+        deadline = 0.0
+        stopping = False
+        while not stopping:
+            timeout = max(0.0, deadline - loop.time()) if pending or self._unsaved else None
+            try:
+                track_id = await asyncio.wait_for(plays.get(), timeout)
+            except asyncio.TimeoutError:
+                await self._flush(pending)
+                count = 0
+                deadline = loop.time() + self.flush_interval  # a failed save is retried then
+                continue
+            if not pending:
+                deadline = loop.time() + self.flush_interval
+            # Drain whatever else is already queued before deciding to flush.
+            while True:
+                if track_id is None:
+                    stopping = True
+                    break
+                pending[track_id] += 1
+                count += 1
+                if plays.empty():
+                    break
+                track_id = plays.get_nowait()
+            if stopping or count >= self.flush_plays:
+                await self._flush(pending, final=stopping)
+                count = 0
+
+    async def _flush(self, pending: Counter, final: bool = False) -> None:
+        """Apply ``pending`` to the library, then save every unsaved play.
+
+        A failed save is logged and left for the next flush, unless ``final``.
+        """
+
+        library = self.library
+        if pending:
+            _, removed = library.get_tracks(list(pending))
+            for track_id in removed:
+                del pending[track_id]  # removed from the library since it was played
+            self._unsaved += library.record_plays(pending)
+            pending.clear()  # applied; only the save is outstanding
+        if not self._unsaved:
+            return
+        try:
+            if library.incremental:
+                library.save()
+            else:
+                # A full rewrite would stall every session; sessions only read
+                # tracks, and this task is the only writer, so save off-loop.
+                await asyncio.get_running_loop().run_in_executor(None, library.save)
+        except Exception:
+            if final:
+                raise
+            logger.exception("Saving %d plays failed; retrying with the next flush", self._unsaved)
+            return
+        self._stats.applied_plays += self._unsaved
+        self._stats.batches += 1
+        self._unsaved = 0
+
+
+__all__ = ["ListenerSession", "PlayerService", "ServiceStats"]
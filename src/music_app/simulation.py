@@ -0,0 +1,253 @@
+"""Headless batch playback simulation for load and capacity planning.
+
+:class:`PlaybackSimulator` plays playlists on the same timeline as
+:class:`~music_app.player.MusicPlayer` (``play`` after each track's duration,
+``crossfade`` overlapping the outgoing track, EQ events without advancing
+time) but writes events into an :class:`EventBuffer` of parallel arrays
+instead of allocating a :class:`~music_app.player.PlaybackEvent`, a
+``datetime`` and a metadata dict per event. A playlist's offsets are built
+with one ``accumulate`` over interleaved durations and overlaps, and plays
+are applied to the library in bulk by :meth:`PlaybackSimulator.apply`.
+"""
+
+from __future__ import annotations
+
+from array import array
+from collections import Counter
+from datetime import datetime, timedelta
+from itertools import accumulate, islice, repeat
+from operator import neg
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Optional, Union
+
+from .audio_effects import EqualizerBank
+from .library import MusicLibrary
+from .player import PlaybackEvent, default_equalizer_bank
+from .playlist import Playlist
+
+if TYPE_CHECKING:
+    from .player import MusicPlayer
+    from .transitions import TransitionModel
+
+ACTIONS = ("play", "crossfade", "queue_empty", "eq_change", "eq_transition")
+PLAY, CROSSFADE, QUEUE_EMPTY, EQ_CHANGE, EQ_TRANSITION = range(len(ACTIONS))
+NO_VALUE = -1
+_PLAY = bytes((PLAY,))
+_PLAY_CROSSFADE = bytes((PLAY, CROSSFADE))
+
+
+class EventBuffer:
+    """Playback events as parallel arrays.
+
+    ``offsets`` are whole seconds from ``start``; ``tracks`` index
+    :attr:`track_ids` (``-1`` for none); ``values`` hold the crossfade
+    seconds or an index into :attr:`presets`.
+    """
+
+    def __init__(self, start: datetime) -> None:
+        self.start = start
+        self.offsets = array("q")
+        self.actions = array("B")
+        self.tracks = array("i")
+        self.values = array("i")
+        self.track_ids: List[str] = []
+        self.presets: List[str] = []
+        self._preset_numbers: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.actions)
+
+    def preset_number(self, name: str) -> int:
+        number = self._preset_numbers.get(name)
+        if number is None:
+            number = self._preset_numbers[name] = len(self.presets)
+            self.presets.append(name)
+        return number
+
+    def append(self, offset: int, action: int, track: int = NO_VALUE, value: int = NO_VALUE) -> None:
+        self.offsets.append(offset)
+        self.actions.append(action)
+        self.tracks.append(track)
+        self.values.append(value)
+
+    def action_counts(self) -> Dict[str, int]:
+        return {ACTIONS[code]: count for code, count in sorted(Counter(self.actions).items())}
+
+    def events(self, start: int = 0, stop: Optional[int] = None) -> Iterator[PlaybackEvent]:
+        """Materialize events ``start:stop`` as :class:`PlaybackEvent` objects."""
+
+        rows = zip(self.offsets, self.actions, self.tracks, self.values)
+        for offset, action, track, value in islice(rows, start, stop):
+            metadata: Optional[dict[str, object]] = None
+            if action == CROSSFADE:
+                metadata = {"seconds": value}
+            elif action in (EQ_CHANGE, EQ_TRANSITION):
+                metadata = {"preset": self.presets[value]}
+            yield PlaybackEvent(
+                timestamp=self.start + timedelta(seconds=offset),
+                action=ACTIONS[action],
+                track_id=self.track_ids[track] if track != NO_VALUE else None,
+                metadata=metadata,
+            )
+
+    def clear(self) -> None:
+        """Drop recorded events; interned ids and presets are kept."""
+
+        for column in (self.offsets, self.actions, self.tracks, self.values):
+            del column[:]
+
+
+class PlaybackSimulator:
+    """Batch counterpart of :class:`MusicPlayer` for simulating heavy listening.
+
+    Plays accumulate as per-track counts and only reach the library when
+    :meth:`apply` is called. With ``record_events=False`` only the clock and
+    the counts are kept, for runs too long to buffer.
+    """
+
+    def __init__(
+        self,
+        library: MusicLibrary,
+        equalizer_bank: Optional[EqualizerBank] = None,
+        crossfade_seconds: int = 5,
+        start: Optional[datetime] = None,
+        record_events: bool = True,
+    ) -> None:
+        self.library = library
+        self.crossfade_seconds = crossfade_seconds
+        self.equalizer_bank = equalizer_bank or default_equalizer_bank()
+        self.active_preset = "flat"
+        self.record_events = record_events
+        self.buffer = EventBuffer(start or datetime.utcnow())
+        self.clock = 0
+        self._numbers: Dict[str, int] = {}
+        self._durations: List[int] = []
+        self._overlaps: List[int] = []  # min(crossfade, duration) per interned track
+        self._crossfade = crossfade_seconds
+        self._plays: Counter = Counter()
+        self._sequence = array("i")  # play order since the last apply(), for transition models
+
+    @classmethod
+    def for_player(cls, player: MusicPlayer, record_events: bool = True) -> PlaybackSimulator:
+        """Continue ``player``'s timeline, EQ state and crossfade setting."""
+
+        simulator = cls(
+            player.library,
+            equalizer_bank=player.equalizer_bank,
+            crossfade_seconds=player.crossfade_seconds,
+            start=player._time_pointer,
+            record_events=record_events,
+        )
+        simulator.active_preset = player.active_preset
+        return simulator
+
+    @property
+    def now(self) -> datetime:
+        return self.buffer.start + timedelta(seconds=self.clock)
+
+    @property
+    def pending_plays(self) -> int:
+        return sum(self._plays.values())
+
+    def _intern(self, track_ids: List[str]) -> List[int]:
+        numbers = self._numbers
+        try:
+            return list(map(numbers.__getitem__, track_ids))
+        except KeyError:
+            pass
+        missing = [track_id for track_id in dict.fromkeys(track_ids) if track_id not in numbers]
+        tracks, unknown = self.library.get_tracks(missing)
+        if unknown:
+            raise KeyError(f"Track with id {unknown[0]!r} not found")
+        for track in tracks:
+            numbers[track.id] = len(self.buffer.track_ids)
+            self.buffer.track_ids.append(track.id)
+            self._durations.append(track.duration_seconds)
+            self._overlaps.append(min(self._crossfade, track.duration_seconds))
+        return list(map(numbers.__getitem__, track_ids))
+
+    def _refresh_overlaps(self) -> None:
+        if self._crossfade != self.crossfade_seconds:
+            self._crossfade = crossfade = self.crossfade_seconds
+            self._overlaps = [min(crossfade, duration) for duration in self._durations]
+
+    # -- Playback ----------------------------------------------------------
+    def play_playlist(self, playlist: Union[Playlist, Iterable[str]]) -> int:
+        """Play every track with crossfades between them; returns the number of plays.
+
+        Like :meth:`MusicPlayer.play_playlist`, it ends with :meth:`stop`.
+        """
+
+        track_ids = list(playlist.track_ids if isinstance(playlist, Playlist) else playlist)
+        if not track_ids:
+            self.stop()
+            return 0
+        self._refresh_overlaps()
+        numbers = self._intern(track_ids)
+        count = len(numbers)
+        overlaps = list(map(self._overlaps.__getitem__, numbers[:-1]))
+        # Events alternate play, crossfade, play ... and end with a play.
+        deltas = [0] * (2 * count - 1)
+        deltas[0::2] = map(self._durations.__getitem__, numbers)
+        deltas[1::2] = map(neg, overlaps)
+        offsets = list(accumulate(deltas, initial=self.clock))
+        self.clock = offsets[-1]
+        if self.record_events:
+            buffer = self.buffer
+            buffer.offsets.extend(offsets[1:])
+            buffer.actions.frombytes(_PLAY_CROSSFADE * (count - 1) + _PLAY)
+            interleaved = [NO_VALUE] * (2 * count - 1)
+            interleaved[0::2] = numbers
+            buffer.tracks.extend(interleaved)
+            interleaved[0::2] = repeat(NO_VALUE, count)
+            interleaved[1::2] = overlaps
+            buffer.values.extend(interleaved)
+        self._plays.update(numbers)
+        self._sequence.extend(numbers)
+        self.stop()
+        return count
+
+    def play_playlists(self, playlists: Iterable[Union[Playlist, Iterable[str]]]) -> int:
+        return sum(self.play_playlist(playlist) for playlist in playlists)
+
+    def stop(self) -> None:
+        """Log ``queue_empty`` as :meth:`MusicPlayer.play_next` does on an empty queue."""
+
+        if self.record_events:
+            self.buffer.append(self.clock, QUEUE_EMPTY)
+        self._sequence.append(NO_VALUE)
+
+    # -- Equalizer ---------------------------------------------------------
+    def set_equalizer_preset(self, preset_name: str) -> None:
+        preset = self.equalizer_bank.get(preset_name)
+        self.active_preset = preset.name
+        if self.record_events:
+            self.buffer.append(self.clock, EQ_CHANGE, value=self.buffer.preset_number(preset.name))
+
+    def transition_equalizer(self, target_preset: str, steps: int = 5) -> None:
+        for intermediate in self.equalizer_bank.transition(self.active_preset, target_preset, steps):
+            self.active_preset = intermediate.name
+            if self.record_events:
+                self.buffer.append(self.clock, EQ_TRANSITION, value=self.buffer.preset_number(intermediate.name))
+
+    # -- Results -----------------------------------------------------------
+    def apply(self, transitions: Optional[TransitionModel] = None) -> int:
+        """Apply pending plays to the library in bulk; returns how many were applied.
+
+        With ``transitions``, consecutive plays are also counted in the model,
+        with :meth:`stop` ending a listening session as ``queue_empty`` does.
+        """
+
+        track_ids = self.buffer.track_ids
+        if transitions is not None:
+            previous = NO_VALUE
+            for number in self._sequence:
+                if previous != NO_VALUE and number != NO_VALUE:
+                    transitions.observe(track_ids[previous], track_ids[number])
+                previous = number
+        applied = self.library.record_plays({track_ids[number]: count for number, count in self._plays.items()})
+        self._plays.clear()
+        del self._sequence[:-1]  # the last play still precedes the next one
+        return applied
+
+
+__all__ = ["ACTIONS", "EventBuffer", "PlaybackSimulator"]
@@ -0,0 +1,182 @@
+"""Compact binary library snapshots that can be read lazily through ``mmap``.
+
+Layout (little endian)::
+
+    header    magic, version, counts and the absolute offset of each section
+    strings   (count + 1) u64 offsets into the blob, then the UTF-8 blob;
+              every distinct string (ids, titles, genres, moods ...) is stored once
+    moods     u32 string ids, referenced by (start, count) from each record
+    records   fixed-size track records in library order
+    index     (id string, ordinal) pairs sorted by id for binary search
+
+Opening a snapshot only reads the header, so startup cost does not depend on
+the number of tracks; records are decoded on demand.
+"""
+
+from __future__ import annotations
+
+import mmap
+import struct
+from array import array
+from functools import lru_cache
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional
+
+from .journal import atomic_write_bytes
+
+if TYPE_CHECKING:
+    from .library import Track
+
+MAGIC = b"ZTSNAP01"
+VERSION = 1
+HEADER = struct.Struct("<8sHHIIIQQQQQ")
+RECORD = struct.Struct("<IIIIIiiqIII")
+INDEX_ENTRY = struct.Struct("<II")
+OFFSET = struct.Struct("<Q")
+_OFFSET_PAIR = struct.Struct("<QQ")
+NO_STRING = 0xFFFFFFFF
+NO_BPM = -(2**31)
+
+
+class SnapshotError(ValueError):
+    """Raised when a file is not a readable snapshot."""
+
+
+def encode_snapshot(tracks: Iterable[Track]) -> bytes:
+    strings: Dict[str, int] = {}
+
+    def intern(value: str) -> int:
+        sid = strings.get(value)
+        if sid is None:
+            sid = strings[value] = len(strings)
+        return sid
+
+    records = bytearray()
+    moods = array("I")
+    index: List[tuple] = []
+    for ordinal, track in enumerate(tracks):
+        mood_start = len(moods)
+        moods.extend(intern(mood) for mood in track.moods)
+        id_sid = intern(track.id)
+        records += RECORD.pack(
+            id_sid,
+            intern(track.title),
+            intern(track.artist),
+            intern(track.album),
+            intern(track.genre),
+            track.duration_seconds,
+            NO_BPM if track.bpm is None else track.bpm,
+            track.play_count,
+            NO_STRING if track.last_played is None else intern(track.last_played),
+            mood_start,
+            len(track.moods),
+        )
+        index.append((track.id, id_sid, ordinal))
+    index.sort()
+
+    encoded = [value.encode("utf-8") for value in strings]
+    offsets = array("Q", [0])
+    for chunk in encoded:
+        offsets.append(offsets[-1] + len(chunk))
+    if offsets.itemsize != OFFSET.size or moods.itemsize != 4:  # pragma: no cover - exotic platforms
+        raise SnapshotError("unsupported platform array sizes")
+    string_offsets_pos = HEADER.size
+    blob_pos = string_offsets_pos + len(offsets) * OFFSET.size
+    moods_pos = blob_pos + offsets[-1]
+    records_pos = moods_pos + len(moods) * 4
+    index_pos = records_pos + len(records)
+    header = HEADER.pack(
+        MAGIC, VERSION, 0, len(index), len(strings), len(moods),
+        string_offsets_pos, blob_pos, moods_pos, records_pos, index_pos,
+    )
+    index_bytes = b"".join(INDEX_ENTRY.pack(sid, ordinal) for _, sid, ordinal in index)
+    return b"".join([header, offsets.tobytes(), *encoded, moods.tobytes(), bytes(records), index_bytes])
+
+
+def write_snapshot(path: Path, tracks: Iterable[Track]) -> int:
+    """Atomically replace ``path`` with a snapshot of ``tracks``; returns its size."""
+
+    data = encode_snapshot(tracks)
+    atomic_write_bytes(path, data)
+    return len(data)
+
+
+class SnapshotReader:
+    """Random access to a snapshot file mapped into memory."""
+
+    def __init__(self, path: Path, string_cache_size: int = 4096) -> None:
+        self.path = path
+        self._file = path.open("rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError as exc:
+            self._file.close()
+            raise SnapshotError(f"{path} is empty") from exc
+        if len(self._map) < HEADER.size:
+            self.close()
+            raise SnapshotError(f"{path} is truncated")
+        (
+            magic, version, _flags, self.track_count, self.string_count, _mood_count,
+            self._offsets_pos, self._blob_pos, self._moods_pos, self._records_pos, self._index_pos,
+        ) = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise SnapshotError(f"{path} is not a library snapshot")
+        self.string = lru_cache(maxsize=string_cache_size)(self._string)
+
+    def __len__(self) -> int:
+        return self.track_count
+
+    def _string(self, sid: int) -> str:
+        start, end = _OFFSET_PAIR.unpack_from(self._map, self._offsets_pos + sid * 8)
+        blob = self._blob_pos
+        return self._map[blob + start : blob + end].decode("utf-8")
+
+    def id_at(self, ordinal: int) -> str:
+        (sid,) = struct.unpack_from("<I", self._map, self._records_pos + ordinal * RECORD.size)
+        return self._string(sid)
+
+    def payload(self, ordinal: int) -> dict:
+        (
+            id_sid, title, artist, album, genre, duration, bpm, play_count, last_played, mood_start, mood_count,
+        ) = RECORD.unpack_from(self._map, self._records_pos + ordinal * RECORD.size)
+        shared = self.string
+        unique = self._string  # ids, titles and timestamps rarely repeat; skip the cache
+        mood_ids = struct.unpack_from(f"<{mood_count}I", self._map, self._moods_pos + mood_start * 4) if mood_count else ()
+        return {
+            "id": unique(id_sid),
+            "title": unique(title),
+            "artist": shared(artist),
+            "album": shared(album),
+            "duration_seconds": duration,
+            "genre": shared(genre),
+            "moods": [shared(sid) for sid in mood_ids],
+            "bpm": None if bpm == NO_BPM else bpm,
+            "last_played": None if last_played == NO_STRING else unique(last_played),
+            "play_count": play_count,
+        }
+
+    def find(self, track_id: str) -> Optional[int]:
+        """Binary-search the id index; returns the record ordinal or ``None``."""
+
+        low, high = 0, self.track_count
+        while low < high:
+            middle = (low + high) // 2
+            sid, ordinal = INDEX_ENTRY.unpack_from(self._map, self._index_pos + middle * INDEX_ENTRY.size)
+            candidate = self.string(sid)
+            if candidate == track_id:
+                return ordinal
+            if candidate < track_id:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def close(self) -> None:
+        if getattr(self, "_map", None) is not None:
+            self._map.close()
+            self._map = None  # type: ignore[assignment]
+        self._file.close()
+
+
+__all__ = ["SnapshotReader", "SnapshotError", "encode_snapshot", "write_snapshot"]
@@ -0,0 +1,698 @@
+"""Storage backends behind :class:`~music_app.library.MusicLibrary`.
+
+A backend turns persisted data into a mapping of track ids to tracks and
+persists the mutation entries the library records::
+
+    {"op": "put", "track": Track}
+    {"op": "delete", "id": "trk-1"}
+    {"op": "update", "id": "trk-1", "fields": {"title": "..."}}
+
+Backends that set ``supports_pushdown`` also answer search and ordering
+queries themselves so the library never has to materialize every track.
+"""
+
+from __future__ import annotations
+
+import json
+import sqlite3
+import weakref
+from collections import OrderedDict
+from dataclasses import asdict, is_dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, List, Mapping, MutableMapping, Optional, Set, Tuple, Union
+
+from .journal import DEFAULT_COMPACT_BYTES, DEFAULT_COMPACT_INTERVAL, LibraryJournal, atomic_write_bytes, journal_path_for
+from .snapshot import SnapshotReader, write_snapshot
+
+if TYPE_CHECKING:
+    from .library import Track
+
+TrackBuilder = Callable[[dict], "Track"]
+StorageLocation = Union[str, Path]
+
+SQLITE_SCHEME = "sqlite://"
+JSON_SCHEME = "json://"
+SNAPSHOT_SCHEME = "snapshot://"
+SQLITE_SUFFIXES = {".db", ".sqlite", ".sqlite3"}
+SNAPSHOT_SUFFIXES = {".ztsnap"}
+SCHEMES = {SQLITE_SCHEME: "sqlite", JSON_SCHEME: "json", SNAPSHOT_SCHEME: "snapshot"}
+
+# Overlay marker for a track removed since the backing store was written.
+_DELETED = object()
+
+
+def storage_location_path(location: StorageLocation) -> Path:
+    """Strip an optional ``sqlite://`` / ``json://`` scheme from ``location``."""
+
+    text = str(location)
+    for scheme in SCHEMES:
+        if text.startswith(scheme):
+            return Path(text[len(scheme) :]).expanduser()
+    return Path(text).expanduser()
+
+
+def storage_scheme(location: StorageLocation) -> str:
+    text = str(location)
+    for scheme, name in SCHEMES.items():
+        if text.startswith(scheme):
+            return name
+    suffix = Path(text).suffix.lower()
+    if suffix in SQLITE_SUFFIXES:
+        return "sqlite"
+    if suffix in SNAPSHOT_SUFFIXES:
+        return "snapshot"
+    return "json"
+
+
+def encode_entry(entry: dict) -> dict:
+    # Put entries keep a reference to the track until flush so that snapshot
+    # mode never pays for serializing them.
+    track = entry.get("track")
+    if track is not None and is_dataclass(track):
+        return {**entry, "track": asdict(track)}
+    return entry
+
+
+def replay_entry(tracks: MutableMapping[str, Track], entry: dict, build: TrackBuilder) -> None:
+    """Apply one decoded journal entry to ``tracks``."""
+
+    op = entry.get("op")
+    if op == "put":
+        track = build(entry["track"])
+        tracks[track.id] = track
+    elif op == "delete":
+        tracks.pop(entry["id"], None)
+    elif op == "update":
+        track = tracks.get(entry["id"])
+        if track is not None:
+            for key, value in entry["fields"].items():
+                setattr(track, key, value)
+            # Re-assigning pins the edited track in lazily loaded mappings.
+            tracks[track.id] = track
+
+
+class StorageBackend:
+    """Interface implemented by library storage backends."""
+
+    #: Persisting one mutation costs O(1) rather than O(library size).
+    incremental = False
+    #: The backend implements :meth:`search_ids`, :meth:`top_ids` and :meth:`recent_ids`.
+    supports_pushdown = False
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+
+    def load(self, build: TrackBuilder, into: Optional[MutableMapping[str, Track]] = None) -> MutableMapping[str, Track]:
+        """Return the stored tracks, filling ``into`` when the backend keeps them in memory.
+
+        Lazily loading backends return their own mapping and ignore ``into``.
+        """
+
+        raise NotImplementedError
+
+    def persist(self, entries: List[dict], tracks: Mapping[str, Track]) -> None:
+        """Durably apply ``entries``, which the library has already applied to ``tracks``."""
+
+        raise NotImplementedError
+
+    def save(self, tracks: Mapping[str, Track]) -> None:
+        raise NotImplementedError
+
+    def begin(self) -> None:
+        """Called when the outermost library batch starts."""
+
+    def record_play(self, track: Track) -> None:
+        """Called after ``track.mark_played()``; plays are saved with the next save()."""
+
+    def record_plays(self, tracks: List[Track]) -> None:
+        """Called once per ``MusicLibrary.record_plays()`` with the tracks it updated."""
+
+        for track in tracks:
+            self.record_play(track)
+
+    def close(self) -> None:
+        pass
+
+    def search_ids(self, query: str, limit: Optional[int], offset: int) -> List[str]:
+        raise NotImplementedError
+
+    def top_ids(self, limit: int) -> List[str]:
+        raise NotImplementedError
+
+    def recent_ids(self, limit: int) -> List[str]:
+        raise NotImplementedError
+
+    def popular_ids(self, limit: int, mood: Optional[str] = None) -> List[str]:
+        raise NotImplementedError
+
+
+class JSONStorage(StorageBackend):
+    """A JSON snapshot, optionally with an append-only journal of mutations."""
+
+    def __init__(
+        self,
+        path: Path,
+        journal: bool = False,
+        compact_bytes: int = DEFAULT_COMPACT_BYTES,
+        compact_interval: float = DEFAULT_COMPACT_INTERVAL,
+    ) -> None:
+        super().__init__(path)
+        self.journal: Optional[LibraryJournal] = None
+        if journal:
+            self.journal = LibraryJournal(
+                journal_path_for(path),
+                compact_bytes=compact_bytes,
+                compact_interval=compact_interval,
+            )
+        self.incremental = journal
+
+    def load(self, build: TrackBuilder, into: Optional[MutableMapping[str, Track]] = None) -> MutableMapping[str, Track]:
+        tracks: MutableMapping[str, Track] = {} if into is None else into
+        if self.path.exists():
+            with self.path.open("r", encoding="utf-8") as fh:
+                data = json.load(fh)
+            for track_id, payload in data.items():
+                tracks[track_id] = build(payload)
+        if self.journal is not None:
+            for entry in self.journal.replay():
+                replay_entry(tracks, entry, build)
+        return tracks
+
+    def persist(self, entries: List[dict], tracks: Mapping[str, Track]) -> None:
+        if self.journal is None:
+            self.save(tracks)
+            return
+        self.journal.append(encode_entry(entry) for entry in entries)
+        if self.journal.needs_compaction():
+            self.save(tracks)
+
+    def save(self, tracks: Mapping[str, Track]) -> None:
+        """Write a full snapshot atomically and truncate the journal, if any."""
+
+        payload = {track_id: asdict(track) for track_id, track in tracks.items()}
+        data = json.dumps(payload, ensure_ascii=False, indent=2).encode("utf-8")
+        atomic_write_bytes(self.path, data)
+        if self.journal is not None:
+            self.journal.reset()
+
+    def close(self) -> None:
+        if self.journal is not None:
+            self.journal.close()
+
+
+# -- Binary snapshot -----------------------------------------------------------
+class _SnapshotTracks(MutableMapping[str, "Track"]):
+    """Lazy id -> Track mapping over an mmapped snapshot plus an overlay.
+
+    Decoded tracks live in a weak identity map and a small LRU of recently
+    used ones. Added, edited and played tracks are pinned in the overlay
+    until the next snapshot is written; removals are kept as tombstones.
+    A base id removed and added again iterates last, as in a dict.
+    """
+
+    def __init__(self, reader: Optional[SnapshotReader], build: TrackBuilder, cache_size: int) -> None:
+        self._reader = reader
+        self._build = build
+        self._cache_size = cache_size
+        self._cache: MutableMapping[str, Track] = weakref.WeakValueDictionary()
+        self._recent: "OrderedDict[str, Track]" = OrderedDict()
+        self._overlay: Dict[str, object] = {}
+        self._readded: Set[str] = set()
+        self._size = len(reader) if reader is not None else 0
+
+    def _in_base(self, track_id: str) -> bool:
+        return self._reader is not None and self._reader.find(track_id) is not None
+
+    def _decode(self, ordinal: int, track_id: str) -> Track:
+        assert self._reader is not None
+        track = self._cache.get(track_id)
+        if track is None:
+            track = self._build(self._reader.payload(ordinal))
+            self._cache[track_id] = track
+        self._recent[track_id] = track
+        self._recent.move_to_end(track_id)
+        if len(self._recent) > self._cache_size:
+            self._recent.popitem(last=False)
+        return track
+
+    def __getitem__(self, track_id: str) -> Track:
+        if track_id in self._overlay:
+            value = self._overlay[track_id]
+            if value is _DELETED:
+                raise KeyError(track_id)
+            return value  # type: ignore[return-value]
+        track = self._cache.get(track_id)
+        if track is not None:
+            return track
+        ordinal = self._reader.find(track_id) if self._reader is not None else None
+        if ordinal is None:
+            raise KeyError(track_id)
+        return self._decode(ordinal, track_id)
+
+    def __contains__(self, track_id: object) -> bool:
+        if track_id in self._overlay:
+            return self._overlay[track_id] is not _DELETED  # type: ignore[index]
+        return isinstance(track_id, str) and (track_id in self._cache or self._in_base(track_id))
+
+    def __setitem__(self, track_id: str, track: Track) -> None:
+        if track_id not in self:
+            self._size += 1
+            if self._overlay.pop(track_id, None) is _DELETED and self._in_base(track_id):
+                self._readded.add(track_id)  # moves to the overlay tail
+        self._overlay[track_id] = track
+
+    def __delitem__(self, track_id: str) -> None:
+        if track_id not in self:
+            raise KeyError(track_id)
+        self._size -= 1
+        self._overlay[track_id] = _DELETED
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __iter__(self) -> Iterator[str]:
+        for track_id, _ in self._iter_items():
+            yield track_id
+
+    def items(self) -> Iterator[Tuple[str, Track]]:  # type: ignore[override]
+        return self._iter_items()
+
+    def values(self) -> Iterator[Track]:  # type: ignore[override]
+        return (track for _, track in self._iter_items())
+
+    def _iter_items(self) -> Iterator[Tuple[str, Track]]:
+        seen = set()
+        if self._reader is not None:
+            for ordinal in range(len(self._reader)):
+                track_id = self._reader.id_at(ordinal)
+                if track_id in self._readded:
+                    continue
+                if track_id in self._overlay:
+                    seen.add(track_id)
+                    value = self._overlay[track_id]
+                    if value is not _DELETED:
+                        yield track_id, value  # type: ignore[misc]
+                    continue
+                yield track_id, self._decode(ordinal, track_id)
+        for track_id, value in list(self._overlay.items()):
+            if track_id not in seen and value is not _DELETED:
+                yield track_id, value  # type: ignore[misc]
+
+    def rebase(self, reader: Optional[SnapshotReader]) -> None:
+        """Switch to a freshly written snapshot that contains the overlay."""
+
+        for track_id, value in self._overlay.items():
+            if value is not _DELETED:
+                self._cache[track_id] = value  # type: ignore[assignment]
+        self._overlay.clear()
+        self._readded.clear()
+        self._reader = reader
+        self._size = len(reader) if reader is not None else 0
+
+
+class SnapshotStorage(StorageBackend):
+    """Binary snapshot opened with ``mmap`` plus a journal for single edits.
+
+    Startup maps the file and reads its header only; tracks are decoded when
+    they are looked up or iterated. :meth:`save` writes a new snapshot
+    atomically and truncates the journal.
+    """
+
+    incremental = True
+
+    def __init__(
+        self,
+        path: Path,
+        compact_bytes: int = DEFAULT_COMPACT_BYTES,
+        compact_interval: float = DEFAULT_COMPACT_INTERVAL,
+        cache_size: int = 1024,
+    ) -> None:
+        super().__init__(path)
+        self.cache_size = cache_size
+        self.journal = LibraryJournal(journal_path_for(path), compact_bytes=compact_bytes, compact_interval=compact_interval)
+        self.reader: Optional[SnapshotReader] = None
+        self._tracks: Optional[_SnapshotTracks] = None
+
+    def _open_reader(self) -> Optional[SnapshotReader]:
+        if not self.path.exists() or self.path.stat().st_size == 0:
+            return None
+        return SnapshotReader(self.path)
+
+    def load(self, build: TrackBuilder, into: Optional[MutableMapping[str, Track]] = None) -> MutableMapping[str, Track]:
+        self.reader = self._open_reader()
+        self._tracks = _SnapshotTracks(self.reader, build, self.cache_size)
+        for entry in self.journal.replay():
+            replay_entry(self._tracks, entry, build)
+        return self._tracks
+
+    def persist(self, entries: List[dict], tracks: Mapping[str, Track]) -> None:
+        self.journal.append(encode_entry(entry) for entry in entries)
+        if self.journal.needs_compaction():
+            self.save(tracks)
+
+    def save(self, tracks: Mapping[str, Track]) -> None:
+        write_snapshot(self.path, tracks.values())
+        self.journal.reset()
+        previous, self.reader = self.reader, self._open_reader()
+        if self._tracks is not None:
+            self._tracks.rebase(self.reader)
+        if previous is not None:
+            previous.close()
+
+    def record_play(self, track: Track) -> None:
+        if self._tracks is not None:
+            self._tracks[track.id] = track
+
+    def close(self) -> None:
+        self.journal.close()
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
+
+
+# -- SQLite ------------------------------------------------------------------
+_COLUMNS = ("id", "title", "artist", "album", "duration_seconds", "genre", "moods", "bpm", "last_played", "play_count")
+_SELECT = f"SELECT {', '.join(_COLUMNS)} FROM tracks"
+_MOOD_SEPARATOR = "\x1f"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tracks (
+    rowid INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    title TEXT NOT NULL,
+    artist TEXT NOT NULL,
+    album TEXT NOT NULL,
+    duration_seconds INTEGER NOT NULL,
+    genre TEXT NOT NULL,
+    moods TEXT NOT NULL,
+    mood_text TEXT NOT NULL,
+    bpm INTEGER,
+    last_played TEXT,
+    play_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS tracks_play_count ON tracks (play_count DESC);
+CREATE INDEX IF NOT EXISTS tracks_popularity ON tracks (play_count DESC, last_played DESC);
+CREATE INDEX IF NOT EXISTS tracks_last_played ON tracks (last_played DESC) WHERE last_played IS NOT NULL;
+CREATE INDEX IF NOT EXISTS tracks_genre ON tracks (genre COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS tracks_artist ON tracks (artist COLLATE NOCASE);
+"""
+
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS tracks_fts USING fts5 (
+    title, artist, album, genre, mood_text,
+    content='tracks', content_rowid='rowid', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS tracks_fts_insert AFTER INSERT ON tracks BEGIN
+    INSERT INTO tracks_fts (rowid, title, artist, album, genre, mood_text)
+    VALUES (new.rowid, new.title, new.artist, new.album, new.genre, new.mood_text);
+END;
+CREATE TRIGGER IF NOT EXISTS tracks_fts_delete AFTER DELETE ON tracks BEGIN
+    INSERT INTO tracks_fts (tracks_fts, rowid, title, artist, album, genre, mood_text)
+    VALUES ('delete', old.rowid, old.title, old.artist, old.album, old.genre, old.mood_text);
+END;
+CREATE TRIGGER IF NOT EXISTS tracks_fts_update AFTER UPDATE OF title, artist, album, genre, mood_text ON tracks BEGIN
+    INSERT INTO tracks_fts (tracks_fts, rowid, title, artist, album, genre, mood_text)
+    VALUES ('delete', old.rowid, old.title, old.artist, old.album, old.genre, old.mood_text);
+    INSERT INTO tracks_fts (rowid, title, artist, album, genre, mood_text)
+    VALUES (new.rowid, new.title, new.artist, new.album, new.genre, new.mood_text);
+END;
+"""
+
+_UPSERT = """
+INSERT INTO tracks (id, title, artist, album, duration_seconds, genre, moods, mood_text, bpm, last_played, play_count)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (id) DO UPDATE SET
+    title = excluded.title, artist = excluded.artist, album = excluded.album,
+    duration_seconds = excluded.duration_seconds, genre = excluded.genre, moods = excluded.moods,
+    mood_text = excluded.mood_text, bpm = excluded.bpm, last_played = excluded.last_played,
+    play_count = excluded.play_count
+"""
+
+
+def _like_pattern(text: str) -> str:
+    return "%" + text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+def _track_row(track: Track) -> Tuple[object, ...]:
+    return (
+        track.id,
+        track.title,
+        track.artist,
+        track.album,
+        track.duration_seconds,
+        track.genre,
+        json.dumps(track.moods, ensure_ascii=False),
+        _MOOD_SEPARATOR.join(track.moods),
+        track.bpm,
+        track.last_played,
+        track.play_count,
+    )
+
+
+def _row_payload(row: Tuple[object, ...]) -> dict:
+    payload = dict(zip(_COLUMNS, row))
+    payload["moods"] = json.loads(payload["moods"])  # type: ignore[arg-type]
+    return payload
+
+
+class _SQLiteTracks(MutableMapping[str, "Track"]):
+    """Lazy id -> Track mapping over the ``tracks`` table.
+
+    Materialized tracks are kept in a weak identity map, so repeated lookups
+    hand out the same object while it is in use. Library mutations land in an
+    in-memory overlay until the backend persists them.
+    """
+
+    def __init__(self, backend: SQLiteStorage, build: TrackBuilder) -> None:
+        self._backend = backend
+        self._build = build
+        self._cache: MutableMapping[str, Track] = weakref.WeakValueDictionary()
+        self._overlay: Dict[str, object] = {}
+
+    def _materialize(self, row: Tuple[object, ...]) -> Track:
+        track_id = row[0]
+        track = self._cache.get(track_id)  # type: ignore[arg-type]
+        if track is None:
+            track = self._build(_row_payload(row))
+            self._cache[track.id] = track
+        return track
+
+    def _stored(self, track_id: str) -> bool:
+        return self._backend.execute("SELECT 1 FROM tracks WHERE id = ?", (track_id,)).fetchone() is not None
+
+    def __getitem__(self, track_id: str) -> Track:
+        if track_id in self._overlay:
+            value = self._overlay[track_id]
+            if value is _DELETED:
+                raise KeyError(track_id)
+            return value  # type: ignore[return-value]
+        track = self._cache.get(track_id)
+        if track is not None:
+            return track
+        row = self._backend.execute(f"{_SELECT} WHERE id = ?", (track_id,)).fetchone()
+        if row is None:
+            raise KeyError(track_id)
+        return self._materialize(row)
+
+    def __contains__(self, track_id: object) -> bool:
+        if track_id in self._overlay:
+            return self._overlay[track_id] is not _DELETED  # type: ignore[index]
+        return isinstance(track_id, str) and (track_id in self._cache or self._stored(track_id))
+
+    def __setitem__(self, track_id: str, track: Track) -> None:
+        self._overlay[track_id] = track
+
+    def __delitem__(self, track_id: str) -> None:
+        if track_id not in self:
+            raise KeyError(track_id)
+        self._overlay[track_id] = _DELETED
+
+    def __len__(self) -> int:
+        (count,) = self._backend.execute("SELECT COUNT(*) FROM tracks").fetchone()
+        for track_id, value in self._overlay.items():
+            stored = self._stored(track_id)
+            if value is _DELETED and stored:
+                count -= 1
+            elif value is not _DELETED and not stored:
+                count += 1
+        return count
+
+    def __iter__(self) -> Iterator[str]:
+        for track_id, _ in self._iter_items():
+            yield track_id
+
+    def items(self) -> Iterator[Tuple[str, Track]]:  # type: ignore[override]
+        return self._iter_items()
+
+    def values(self) -> Iterator[Track]:  # type: ignore[override]
+        return (track for _, track in self._iter_items())
+
+    def _iter_items(self) -> Iterator[Tuple[str, Track]]:
+        seen = set()
+        cursor = self._backend.connection.cursor()
+        for row in cursor.execute(f"{_SELECT} ORDER BY rowid"):
+            track_id = row[0]
+            if track_id in self._overlay:
+                seen.add(track_id)
+                value = self._overlay[track_id]
+                if value is not _DELETED:
+                    yield track_id, value  # type: ignore[misc]
+                continue
+            yield track_id, self._materialize(row)
+        for track_id, value in list(self._overlay.items()):
+            if track_id not in seen and value is not _DELETED:
+                yield track_id, value  # type: ignore[misc]
+
+    def settle(self) -> None:
+        """Move persisted overlay entries into the identity map."""
+
+        for track_id, value in self._overlay.items():
+            if value is not _DELETED:
+                self._cache[track_id] = value  # type: ignore[assignment]
+            else:
+                self._cache.pop(track_id, None)
+        self._overlay.clear()
+
+
+class SQLiteStorage(StorageBackend):
+    """SQLite database in WAL mode with indexed search and ordering queries."""
+
+    incremental = True
+    supports_pushdown = True
+
+    def __init__(self, path: Path) -> None:
+        super().__init__(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(str(path))
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(_SCHEMA)
+        try:
+            self.connection.executescript(_FTS_SCHEMA)
+            self.has_fts = True
+        except sqlite3.OperationalError:
+            # FTS5 or its trigram tokenizer is unavailable; fall back to scans.
+            self.has_fts = False
+        self.connection.commit()
+        self._tracks: Optional[_SQLiteTracks] = None
+
+    def execute(self, sql: str, parameters: Tuple[object, ...] = ()) -> sqlite3.Cursor:
+        return self.connection.execute(sql, parameters)
+
+    def load(self, build: TrackBuilder, into: Optional[MutableMapping[str, Track]] = None) -> MutableMapping[str, Track]:
+        self._tracks = _SQLiteTracks(self, build)
+        return self._tracks
+
+    def begin(self) -> None:
+        # Start the batch from a clean slate so that play updates recorded
+        # earlier are committed independently of it.
+        self.connection.commit()
+
+    def persist(self, entries: List[dict], tracks: Mapping[str, Track]) -> None:
+        with self.connection:
+            for entry in entries:
+                op = entry["op"]
+                if op == "put":
+                    self.connection.execute(_UPSERT, _track_row(entry["track"]))
+                elif op == "delete":
+                    self.connection.execute("DELETE FROM tracks WHERE id = ?", (entry["id"],))
+                elif op == "update" and entry["id"] in tracks:
+                    self.connection.execute(_UPSERT, _track_row(tracks[entry["id"]]))
+        if self._tracks is not None:
+            self._tracks.settle()
+
+    def save(self, tracks: Mapping[str, Track]) -> None:
+        if self._tracks is not None and tracks is not self._tracks:
+            raise ValueError("SQLiteStorage can only save the mapping it loaded")
+        self.connection.commit()
+
+    def record_play(self, track: Track) -> None:
+        self.record_plays([track])
+
+    def record_plays(self, tracks: List[Track]) -> None:
+        # Committed right away: an open write transaction would lock out
+        # every other writer (a migrate or --no-daemon run beside the
+        # daemon) until the next save().
+        with self.connection:
+            self.connection.executemany(
+                "UPDATE tracks SET play_count = ?, last_played = ? WHERE id = ?",
+                [(track.play_count, track.last_played, track.id) for track in tracks],
+            )
+
+    def close(self) -> None:
+        self.connection.commit()
+        self.connection.close()
+
+    # -- Pushdown ---------------------------------------------------------
+    def search_ids(self, query: str, limit: Optional[int], offset: int) -> List[str]:
+        paging = " LIMIT ? OFFSET ?"
+        page: Tuple[object, ...] = (-1 if limit is None else limit, offset)
+        if not query:
+            rows = self.execute(f"SELECT id FROM tracks ORDER BY rowid{paging}", page)
+        elif self.has_fts and len(query) >= 3:
+            phrase = '"' + query.replace('"', '""') + '"'
+            rows = self.execute(
+                "SELECT t.id FROM tracks_fts f JOIN tracks t ON t.rowid = f.rowid "
+                f"WHERE tracks_fts MATCH ? ORDER BY t.rowid{paging}",
+                (phrase, *page),
+            )
+        else:
+            pattern = _like_pattern(query)
+            columns = ("title", "artist", "album", "genre", "mood_text")
+            where = " OR ".join(f"{column} LIKE ? ESCAPE '\\'" for column in columns)
+            rows = self.execute(f"SELECT id FROM tracks WHERE {where} ORDER BY rowid{paging}", (*[pattern] * 5, *page))
+        return [track_id for (track_id,) in rows]
+
+    def top_ids(self, limit: int) -> List[str]:
+        rows = self.execute("SELECT id FROM tracks ORDER BY play_count DESC, rowid LIMIT ?", (limit,))
+        return [track_id for (track_id,) in rows]
+
+    def recent_ids(self, limit: int) -> List[str]:
+        rows = self.execute(
+            "SELECT id FROM tracks WHERE last_played IS NOT NULL AND last_played != '' "
+            "ORDER BY last_played DESC, rowid LIMIT ?",
+            (limit,),
+        )
+        return [track_id for (track_id,) in rows]
+
+    def popular_ids(self, limit: int, mood: Optional[str] = None) -> List[str]:
+        where = ""
+        parameters: Tuple[object, ...] = (limit,)
+        if mood is not None:
+            where = "WHERE mood_text != '' AND mood_text LIKE ? ESCAPE '\\' "
+            parameters = (_like_pattern(mood), limit)
+        rows = self.execute(
+            f"SELECT id FROM tracks {where}ORDER BY play_count DESC, COALESCE(last_played, '') DESC, rowid LIMIT ?",
+            parameters,
+        )
+        return [track_id for (track_id,) in rows]
+
+
+def open_storage(
+    location: StorageLocation,
+    journal: bool = False,
+    compact_bytes: int = DEFAULT_COMPACT_BYTES,
+    compact_interval: float = DEFAULT_COMPACT_INTERVAL,
+) -> StorageBackend:
+    """Pick a backend from a ``sqlite://``, ``snapshot://`` or ``json://`` scheme or the file suffix."""
+
+    path = storage_location_path(location)
+    scheme = storage_scheme(location)
+    if scheme == "sqlite":
+        return SQLiteStorage(path)
+    if scheme == "snapshot":
+        return SnapshotStorage(path, compact_bytes=compact_bytes, compact_interval=compact_interval)
+    return JSONStorage(path, journal=journal, compact_bytes=compact_bytes, compact_interval=compact_interval)
+
+
+__all__ = [
+    "StorageBackend",
+    "JSONStorage",
+    "SQLiteStorage",
+    "SnapshotStorage",
+    "replay_entry",
+    "open_storage",
+    "storage_location_path",
+    "storage_scheme",
+    "encode_entry",
+]
@@ -0,0 +1,117 @@
+"""Sparse "played next" model learned from consecutive plays.
+
+For every track the model keeps counts of the tracks played right after
+it. Successor lists are pruned back to the ``max_successors`` most frequent
+entries whenever they grow past twice that size, so memory stays linear in
+the number of tracks no matter how many sessions are observed.
+
+The model is saved next to the library as a compact binary file: an id
+table followed by ``(source, successor count, [successor, count]...)``
+runs of 32-bit integers.
+"""
+
+from __future__ import annotations
+
+import heapq
+import struct
+from array import array
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .journal import atomic_write_bytes
+
+MAGIC = b"ZTTRANS1"
+HEADER = struct.Struct("<8sIII")  # magic, max successors, id count, body length
+DEFAULT_MAX_SUCCESSORS = 20
+
+
+def transitions_path_for(library_path: Path) -> Path:
+    return library_path.with_name(library_path.name + ".transitions")
+
+
+class TransitionModel:
+    """Counts of track A -> track B transitions with top-N pruning."""
+
+    def __init__(self, max_successors: int = DEFAULT_MAX_SUCCESSORS, path: Optional[Path] = None) -> None:
+        self.max_successors = max_successors
+        self.path = path
+        self._successors: Dict[str, Dict[str, int]] = {}
+        if path is not None and path.exists():
+            self._load(path)
+
+    def __len__(self) -> int:
+        return len(self._successors)
+
+    def observe(self, previous_id: str, next_id: str) -> None:
+        """Count one play of ``next_id`` directly after ``previous_id``."""
+
+        if previous_id == next_id:
+            return
+        successors = self._successors.setdefault(previous_id, {})
+        successors[next_id] = successors.get(next_id, 0) + 1
+        if len(successors) > 2 * self.max_successors:
+            self._prune(previous_id)
+
+    def _prune(self, track_id: str) -> None:
+        successors = self._successors[track_id]
+        keep = heapq.nlargest(self.max_successors, successors.items(), key=lambda item: item[1])
+        self._successors[track_id] = dict(keep)
+
+    def successors(self, track_id: str, limit: Optional[int] = None) -> List[Tuple[str, int]]:
+        """Most frequent successors first; equal counts in first-seen order."""
+
+        successors = self._successors.get(track_id, {})
+        limit = self.max_successors if limit is None else min(limit, self.max_successors)
+        return heapq.nlargest(limit, successors.items(), key=lambda item: item[1])
+
+    # -- Persistence -------------------------------------------------------
+    def save(self, path: Optional[Path] = None) -> None:
+        path = path or self.path
+        if path is None:
+            raise ValueError("TransitionModel has no path to save to")
+        atomic_write_bytes(path, self.encode())
+
+    def encode(self) -> bytes:
+        ids: Dict[str, int] = {}
+        body = array("I")
+        for source, successors in self._successors.items():
+            kept = sorted(successors.items(), key=lambda item: -item[1])[: self.max_successors]
+            body.extend((ids.setdefault(source, len(ids)), len(kept)))
+            for successor, count in kept:
+                body.extend((ids.setdefault(successor, len(ids)), min(count, 0xFFFFFFFF)))
+        encoded = [track_id.encode("utf-8") for track_id in ids]
+        lengths = array("I", map(len, encoded))
+        header = HEADER.pack(MAGIC, self.max_successors, len(ids), len(body))
+        return b"".join([header, lengths.tobytes(), *encoded, body.tobytes()])
+
+    def _load(self, path: Path) -> None:
+        data = path.read_bytes()
+        magic, max_successors, id_count, body_length = HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a transition model")
+        self.max_successors = max_successors
+        offset = HEADER.size
+        lengths = array("I")
+        lengths.frombytes(data[offset : offset + 4 * id_count])
+        offset += 4 * id_count
+        ids: List[str] = []
+        for length in lengths:
+            ids.append(data[offset : offset + length].decode("utf-8"))
+            offset += length
+        body = array("I")
+        body.frombytes(data[offset : offset + 4 * body_length])
+        for source, successors in _runs(body):
+            self._successors[ids[source]] = {ids[successor]: count for successor, count in successors}
+
+
+def _runs(body: array) -> Iterator[Tuple[int, List[Tuple[int, int]]]]:
+    position = 0
+    while position < len(body):
+        source, count = body[position], body[position + 1]
+        position += 2
+        pairs = body[position : position + 2 * count]
+        position += 2 * count
+        yield source, list(zip(pairs[::2], pairs[1::2]))
+
+
+__all__ = ["TransitionModel", "transitions_path_for", "DEFAULT_MAX_SUCCESSORS"]
@@ -0,0 +1,190 @@
+"""Streaming trending counters fed by library play events.
+
+:class:`TrendingTracker` keeps two views of recent plays:
+
+* an exponentially decayed score per track. Decay is lazy: a play at time
+  ``t`` adds ``exp(rate * t)`` to the track's total, so totals never need to
+  be touched as time passes and ranking them equals ranking the decayed
+  scores at any moment. Totals are kept as logarithms so they cannot
+  overflow.
+* fixed-size time buckets of play counts for sliding windows.
+
+For very large catalogs the decayed totals can live in a count-min sketch,
+with only the current heavy hitters ranked exactly.
+"""
+
+from __future__ import annotations
+
+import math
+import random
+import time
+from collections import Counter, deque
+from itertools import islice
+from typing import TYPE_CHECKING, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+from .indexes import SortedEntries
+
+if TYPE_CHECKING:
+    from .library import MusicLibrary, Track
+
+DEFAULT_HALF_LIFE = 6 * 3600.0
+DEFAULT_WINDOW = 24 * 3600.0
+DEFAULT_BUCKET = 300.0
+NEGATIVE_INFINITY = float("-inf")
+
+
+def _log_add(a: float, b: float) -> float:
+    """``log(exp(a) + exp(b))`` without overflow."""
+
+    if a < b:
+        a, b = b, a
+    if b == NEGATIVE_INFINITY:
+        return a
+    return a + math.log1p(math.exp(b - a))
+
+
+class CountMinSketch:
+    """Count-min sketch over log-space totals; estimates never undercount."""
+
+    def __init__(self, width: int = 1 << 16, depth: int = 4, seed: int = 0) -> None:
+        self.width = width
+        self.depth = depth
+        rng = random.Random(seed)
+        self._salts = [rng.getrandbits(64) for _ in range(depth)]
+        self._rows = [[NEGATIVE_INFINITY] * width for _ in range(depth)]
+
+    def _cells(self, key: str) -> Iterator[Tuple[List[float], int]]:
+        for row, salt in zip(self._rows, self._salts):
+            yield row, hash((salt, key)) % self.width
+
+    def add(self, key: str, log_weight: float) -> float:
+        """Add ``exp(log_weight)`` to ``key``; returns the new log estimate."""
+
+        estimate = math.inf
+        for row, cell in self._cells(key):
+            row[cell] = _log_add(row[cell], log_weight)
+            estimate = min(estimate, row[cell])
+        return estimate
+
+    def get(self, key: str) -> float:
+        return min(row[cell] for row, cell in self._cells(key))
+
+
+class TrendingTracker:
+    """Decayed and sliding-window play counts, updated per play.
+
+    A play costs O(1) for the counters plus one O(log n) update of the
+    ranking, and :meth:`top` reads the head of that ranking. With
+    ``sketch_width`` set, decayed totals go to a :class:`CountMinSketch` and
+    only ``capacity`` heavy hitters are ranked.
+    """
+
+    def __init__(
+        self,
+        half_life: float = DEFAULT_HALF_LIFE,
+        window: float = DEFAULT_WINDOW,
+        bucket_seconds: float = DEFAULT_BUCKET,
+        sketch_width: int = 0,
+        sketch_depth: int = 4,
+        capacity: int = 1000,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.half_life = half_life
+        self.window = window
+        self.bucket_seconds = bucket_seconds
+        self._rate = math.log(2) / half_life
+        self._clock = clock
+        self._sketch = CountMinSketch(sketch_width, sketch_depth) if sketch_width else None
+        self._capacity = capacity if self._sketch is not None else None
+        self._totals: Dict[str, float] = {}
+        self._ranking = SortedEntries()
+        self._ranked: Dict[str, Tuple[float, str]] = {}
+        self._buckets: Deque[Tuple[float, Counter]] = deque()
+
+    def attach(self, library: MusicLibrary) -> TrendingTracker:
+        """Record every play of a track in ``library`` from now on."""
+
+        library.add_play_listener(lambda track: self.record(track.id))
+        return self
+
+    # -- Recording ---------------------------------------------------------
+    def record(self, track_id: str, when: Optional[float] = None) -> None:
+        when = self._clock() if when is None else when
+        log_weight = self._rate * when
+        if self._sketch is not None:
+            total = self._sketch.add(track_id, log_weight)
+        else:
+            total = self._totals[track_id] = _log_add(self._totals.get(track_id, NEGATIVE_INFINITY), log_weight)
+        self._rank(track_id, total)
+        self._count(track_id, when)
+
+    def _rank(self, track_id: str, total: float) -> None:
+        entry = self._ranked.pop(track_id, None)
+        if entry is not None:
+            self._ranking.remove(entry)
+        elif self._capacity is not None and len(self._ranked) >= self._capacity:
+            weakest = next(reversed(self._ranking))
+            if -weakest[0] >= total:
+                return
+            self._ranking.remove(weakest)
+            del self._ranked[weakest[1]]
+        entry = self._ranked[track_id] = (-total, track_id)
+        self._ranking.add(entry)
+
+    def _count(self, track_id: str, when: float) -> None:
+        start = when - when % self.bucket_seconds
+        buckets = self._buckets
+        # Plays normally land in the newest bucket; late ones walk back.
+        position = len(buckets) - 1
+        while position >= 0 and buckets[position][0] > start:
+            position -= 1
+        if position < 0 or buckets[position][0] != start:
+            position += 1
+            buckets.insert(position, (start, Counter()))
+        buckets[position][1][track_id] += 1
+        self._expire(max(when, buckets[-1][0]))
+
+    def _expire(self, now: float) -> None:
+        horizon = now - self.window - self.bucket_seconds
+        while self._buckets and self._buckets[0][0] < horizon:
+            self._buckets.popleft()
+
+    # -- Queries -----------------------------------------------------------
+    def score(self, track_id: str, now: Optional[float] = None) -> float:
+        """Decayed play count: each play is worth ``0.5 ** (age / half_life)``."""
+
+        now = self._clock() if now is None else now
+        if self._sketch is not None:
+            total = self._sketch.get(track_id)
+        else:
+            total = self._totals.get(track_id, NEGATIVE_INFINITY)
+        return math.exp(total - self._rate * now)
+
+    def ranked(self, window: Optional[float] = None, now: Optional[float] = None) -> Iterator[Tuple[str, float]]:
+        """Yield ``(track_id, score)`` best first.
+
+        Without ``window`` scores are decayed play counts; with it they are
+        play counts in the last ``window`` seconds (at bucket granularity,
+        up to the configured window). Equal scores are ordered by track id.
+        """
+
+        now = self._clock() if now is None else now
+        if window is None:
+            offset = self._rate * now
+            return ((track_id, math.exp(-negated - offset)) for negated, track_id in self._ranking)
+        if window > self.window:
+            raise ValueError(f"window {window} exceeds the tracked window of {self.window} seconds")
+        self._expire(now)
+        since = now - window
+        counts: Counter = Counter()
+        for bucket_start, bucket in self._buckets:
+            if bucket_start + self.bucket_seconds > since and bucket_start <= now:
+                counts.update(bucket)
+        ordered = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+        return ((track_id, float(count)) for track_id, count in ordered)
+
+    def top(self, limit: int = 10, window: Optional[float] = None, now: Optional[float] = None) -> List[Tuple[str, float]]:
+        return list(islice(self.ranked(window, now), max(0, limit)))
+
+
+__all__ = ["CountMinSketch", "TrendingTracker", "DEFAULT_HALF_LIFE", "DEFAULT_WINDOW"]
@@ -0,0 +1,35 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+from benchmarks.__main__ import main
+from benchmarks.generators import synthetic_tracks
+
+
+def test_generator_is_deterministic() -> None:
+    first = list(synthetic_tracks(200, seed=3))
+    assert first == list(synthetic_tracks(200, seed=3))
+    assert first != list(synthetic_tracks(200, seed=4))
+    assert len({track.genre for track in first}) > 5 and any(track.bpm is None for track in first)
+
+
+def test_run_writes_json_and_fails_on_regression(tmp_path: Path) -> None:
+    baseline = tmp_path / "baseline.json"
+    common = ["--sizes", "300", "--repeats", "1", "--scenario", "library.save", "--scenario", "player.play_playlist"]
+    common += ["--workdir", str(tmp_path / "work")]
+
+    assert main(common + ["--baseline", str(baseline), "--update-baseline"]) == 0
+    stored = json.loads(baseline.read_text())
+    assert {(entry["scenario"], entry["size"]) for entry in stored["results"]} == {
+        ("library.save", 300),
+        ("player.play_playlist", 300),
+    }
+    assert all(entry["peak_bytes"] > 0 for entry in stored["results"])
+
+    for entry in stored["results"]:
+        entry["seconds"] = 1e-9 if entry["scenario"] == "library.save" else 1e3
+    baseline.write_text(json.dumps(stored))
+    output = tmp_path / "results.json"
+    assert main(common + ["--baseline", str(baseline), "--threshold", "0.5", "--output", str(output)]) == 1
+    assert len(json.loads(output.read_text())["results"]) == 2
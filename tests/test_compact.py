@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import pickle
+from dataclasses import asdict
+from pathlib import Path
+
+import pytest
+
+from music_app.compact import CompactTrackStore, TrackView
+from music_app.library import MusicLibrary, Track
+from music_app.player import MusicPlayer
+from music_app.playlist import Playlist
+from music_app.recommendation import RecommendationEngine
+
+
+def _tracks() -> list[Track]:
+    return [
+        Track(id="1", title="Calm Sea", artist="Aurora", album="Dawn", duration_seconds=100, genre="Ambient", moods=["calm"], bpm=80),
+        Track(id="2", title="Storm", artist="Circuit", album="City", duration_seconds=120, genre="Rock", moods=["energetic"]),
+        Track(id="3", title="Night Drive", artist="Aurora", album="Moon", duration_seconds=90, genre="Ambient", moods=["late night", "calm"], last_played="2024-05-01T10:00:00+02:00"),
+    ]
+
+
+def test_compact_store_round_trips_values_and_identity() -> None:
+    originals = [Track(**asdict(track)) for track in _tracks()]
+    inserted = _tracks()
+    store = CompactTrackStore(inserted)
+
+    assert list(store) == ["1", "2", "3"]
+    assert [store[track_id] for track_id in store] == originals
+    assert isinstance(store["1"], TrackView) and type(inserted[0]) is Track
+    inserted[0].title = "Changed"
+    assert store["1"].title == "Calm Sea"
+    assert store["3"].last_played == "2024-05-01T10:00:00+02:00"
+    assert pickle.loads(pickle.dumps(store["1"])) == originals[0]
+
+    view = store["2"]
+    view.mark_played()
+    assert store["2"].play_count == 1 and store["2"].last_played == view.last_played
+    with pytest.raises(AttributeError):
+        view.id = "other"
+
+    del store["2"]
+    assert view.play_count == 1 and view.title == "Storm" and "2" not in store
+    store["2"] = view
+    assert store["2"] is view and list(store) == ["1", "3", "2"]
+
+
+def test_compact_moods_edits_and_non_int_numbers_persist() -> None:
+    store = CompactTrackStore(_tracks())
+    store["3"].moods.append("dreamy")
+    store["3"].moods.remove("calm")
+    assert store["3"].moods == ["late night", "dreamy"]
+
+    store["1"] = Track(id="1", title="Calm Sea", artist="Aurora", album="Dawn", duration_seconds=100.5, genre="Ambient", bpm=92.5, play_count=2**40)
+    track = store["1"]
+    assert (track.duration_seconds, track.bpm, track.play_count) == (100.5, 92.5, 2**40)
+    store["1"] = Track(id="1", title="Calm Sea", artist="Aurora", album="Dawn", duration_seconds=100, genre="Ambient")
+    assert (store["1"].duration_seconds, store["1"].bpm, store["1"].play_count) == (100, None, 0)
+
+
+def test_compact_library_works_with_player_playlists_and_recommendations(tmp_path: Path) -> None:
+    library = MusicLibrary(storage_path=tmp_path / "library.json", compact=True)
+    library.import_tracks(_tracks())
+    assert isinstance(library._tracks, CompactTrackStore)
+
+    MusicPlayer(library).play_playlist(Playlist(name="mix", track_ids=["1", "3"]))
+    assert [track.id for track in library.top_tracks(2)] == ["1", "3"]
+    assert [track.title for track in Playlist(name="p", track_ids=["3", "2"]).expand(library)] == ["Night Drive", "Storm"]
+    engine = RecommendationEngine(library)
+    assert [track.id for track in engine.recommend_similar(library.get_track("1"), limit=1)] == ["3"]
+
+    with pytest.raises(RuntimeError):
+        with library.batch():
+            library.remove_track("1")
+            library.update_track_metadata("2", genre="Jazz")
+            raise RuntimeError("abort")
+    assert [track.id for track in library.list_tracks()] == ["1", "2", "3"]
+    assert library.get_track("1").play_count == 1 and library.get_track("2").genre == "Rock"
+
+    library.save()
+    reopened = MusicLibrary(storage_path=tmp_path / "library.json")
+    assert reopened.list_tracks() == library.list_tracks()
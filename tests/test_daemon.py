@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import json
+import os
+import subprocess
+import sys
+import threading
+from pathlib import Path
+from typing import Iterator, Tuple
+
+import pytest
+
+from music_app import cli, daemon
+from music_app.library import MusicLibrary, Track
+
+pytestmark = pytest.mark.skipif(not hasattr(__import__("socket"), "AF_UNIX"), reason="needs Unix sockets")
+
+
+def _track(number: int) -> Track:
+    return Track(
+        id=f"t{number}",
+        title=f"Song {number}",
+        artist="Band",
+        album="Album",
+        duration_seconds=200,
+        genre="Rock",
+        moods=["happy"],
+        bpm=120,
+    )
+
+
+@pytest.fixture
+def served(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Iterator[Tuple[cli.CommandContext, daemon.LibraryDaemon]]:
+    path = tmp_path / "library.json"
+    library = MusicLibrary(storage_path=path)
+    library.import_tracks(_track(number) for number in range(3))
+    library.save()
+    monkeypatch.setenv("ZTSCR_LIBRARY_PATH", str(path))
+    monkeypatch.delenv("ZTSCR_DAEMON_SOCKET", raising=False)
+    context = cli.CommandContext(library)
+    server = daemon.LibraryDaemon(daemon.default_socket_path(), path, lambda argv: cli.run_argv(argv, context))
+    server.start()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield context, server
+    server.shutdown()
+    thread.join()
+    server.close()
+    context.close()
+
+
+def test_library_commands_run_in_the_warm_daemon(
+    served: Tuple[cli.CommandContext, daemon.LibraryDaemon],
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    capsys: pytest.CaptureFixture[str],
+) -> None:
+    context, server = served
+    monkeypatch.chdir(tmp_path)
+    Path("new.json").write_text(json.dumps([{**_track(9).__dict__, "title": "Fresh"}]), encoding="utf-8")
+
+    assert cli.main(["import", "new.json", "--duplicates", "off"]) == 0  # relative to the client's directory
+    assert "Imported 1 tracks" in capsys.readouterr().out
+    assert context.library.get_track("t9").title == "Fresh"  # the daemon's library, not a fresh one
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(daemon.forward(["list", "--filter", "song"]))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [0] * 8
+    assert server.requests == 9
+
+    capsys.readouterr()
+    assert cli.main(["list", "--filter", "bpm=fast"]) == 2  # argparse errors come back with their status
+    assert "invalid filter" in capsys.readouterr().err
+
+
+def test_client_falls_back_without_a_daemon_and_imports_lazily(
+    served: Tuple[cli.CommandContext, daemon.LibraryDaemon], tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    _, server = served
+    with pytest.raises(RuntimeError):
+        daemon.LibraryDaemon(server.socket_path, server.library_path, lambda argv: 0).start()
+    monkeypatch.setenv("ZTSCR_LIBRARY_PATH", str(tmp_path / "other.json"))
+    monkeypatch.setenv("ZTSCR_DAEMON_SOCKET", str(server.socket_path))
+    assert daemon.forward(["list"]) is None  # the daemon serves another library
+    assert server.requests == 0
+
+    probe = "import sys, music_app.cli; print(sorted(m for m in sys.modules if m.startswith('music_app')))"
+    env = {**os.environ, "PYTHONPATH": str(Path(cli.__file__).parents[1])}
+    loaded = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True, check=True, env=env).stdout
+    assert loaded.strip() == "['music_app', 'music_app.cli', 'music_app.daemon', 'music_app.metrics']"
@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Iterator, Tuple
+
+import pytest
+
+from music_app import dedup
+from music_app.dedup import DedupIndex, normalize_text
+from music_app.importer import StreamingImporter
+from music_app.library import MusicLibrary, Track
+
+
+def _track(track_id: str, title: str, artist: str = "The Beatles", album: str = "Past Masters", **extra: object) -> Track:
+    return Track(id=track_id, title=title, artist=artist, album=album, duration_seconds=200, genre="Rock", **extra)  # type: ignore[arg-type]
+
+
+def _library(tmp_path: Path, *tracks: Track) -> MusicLibrary:
+    library = MusicLibrary(storage_path=tmp_path / "library.json")
+    library.import_tracks(tracks)
+    return library
+
+
+def test_normalize_text_folds_case_accents_and_release_notes() -> None:
+    assert normalize_text("HEY JUDE (2015 Remaster)") == "hey jude"
+    assert normalize_text("Let It Be - Mono Version") == "let it be"
+    assert normalize_text("Señorita [feat. Someone]") == "senorita"
+    assert normalize_text("Song (Live at Wembley)") == "song live at wembley"
+    assert normalize_text("") == ""
+
+
+def test_saved_index_round_trips_and_merges_pending_in_key_order(tmp_path: Path) -> None:
+    library = _library(tmp_path, _track("a", "Hey Jude"), _track("b", "Let It Be"))
+    path = tmp_path / "library.json.dedup"
+    index = DedupIndex(library, path)
+    index.save()
+    library.add_track(_track("c", "Yesterday"))
+    index.add(library.get_track("c"))
+    index.save()
+
+    for band in range(dedup.BANDS):
+        entries = list(zip(index._keys[band], index._ordinals[band]))
+        assert entries == sorted(entries) and len(entries) == 3
+    reopened = DedupIndex(library, path)
+    assert len(reopened) == 3 and [reopened._id(ordinal) for ordinal in range(3)] == ["a", "b", "c"]
+    assert reopened._keys == index._keys and reopened._ordinals == index._ordinals
+    match = reopened.match(_track("d", "Yesterday (Remastered 2009)"))
+    assert match is not None and match.duplicate_of == "c"
+
+
+def test_index_built_with_other_parameters_is_rebuilt(tmp_path: Path) -> None:
+    library = _library(tmp_path, _track("a", "Hey Jude"))
+    path = tmp_path / "library.json.dedup"
+    path.write_bytes(dedup.HEADER.pack(dedup.MAGIC, dedup.NUM_PERM * 2, dedup.BANDS, 0, 0, 0))
+
+    index = DedupIndex(library, path)
+    assert len(index) == 1
+    match = index.match(_track("b", "Hey Jude - Mono"))
+    assert match is not None and match.duplicate_of == "a"
+
+
+def test_non_string_text_is_not_indexed(tmp_path: Path) -> None:
+    library = _library(tmp_path, _track("a", "Hey Jude"))
+    index = DedupIndex(library)
+
+    assert not index.add(_track("b", "Hey Jude", artist=None))  # type: ignore[arg-type]
+    assert not index.add(_track("c", 7))  # type: ignore[arg-type]
+    assert index.match(_track("d", "Hey Jude", album=["Past Masters"])) is None  # type: ignore[arg-type]
+    assert len(index) == 1
+
+
+def test_tracks_added_around_the_index_are_picked_up(tmp_path: Path) -> None:
+    library = _library(tmp_path, _track("a", "Hey Jude"))
+    path = tmp_path / "library.json.dedup"
+    DedupIndex(library, path).save()
+    library.add_track(_track("b", "Let It Be"))  # e.g. `cli add`, not through the index
+
+    index = DedupIndex(library, path)
+    match = index.match(_track("c", "Let It Be - Mono Version"))
+    assert match is not None and match.duplicate_of == "b"
+
+    library.update_track_metadata("a", title="Yesterday")
+    assert index.refresh() and not index.refresh()
+    match = index.match(_track("d", "Yesterday (Remastered)"))
+    assert match is not None and match.duplicate_of == "a"
+
+
+def test_index_is_saved_with_each_committed_batch(tmp_path: Path) -> None:
+    library = MusicLibrary(storage_path=tmp_path / "library.json", journal=True)
+    path = tmp_path / "library.json.dedup"
+    records = [
+        {"id": str(n), "title": title, "artist": "The Beatles", "album": "Past Masters", "duration_seconds": 200, "genre": "Rock"}
+        for n, title in enumerate(["Hey Jude", "Let It Be", "Yesterday"], 1)
+    ]
+
+    def failing() -> Iterator[Tuple[int, dict]]:
+        yield from enumerate(records[:2], 1)
+        raise RuntimeError("feed dropped")
+
+    with pytest.raises(RuntimeError):
+        StreamingImporter(library, batch_size=1, chunk_size=1, dedup=DedupIndex(library, path)).import_records(failing())
+    assert len(library) == 2
+
+    index = DedupIndex(library, path)
+    assert len(index) == 2 and index._synced_version == library.catalog_version
+    match = index.match(_track("x", "LET IT BE (2009 Remaster)"))
+    assert match is not None and match.duplicate_of == "2"
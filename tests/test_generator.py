@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import random
+from pathlib import Path
+
+import pytest
+
+from music_app.generator import FlowSpec, PlaylistGenerator, wall_clock_seconds
+from music_app.library import MusicLibrary, Track
+from music_app.player import MusicPlayer
+
+
+def _library(tmp_path: Path, count: int = 1500) -> MusicLibrary:
+    rng = random.Random(3)
+    library = MusicLibrary(storage_path=tmp_path / "library.json")
+    library.import_tracks(
+        Track(
+            id=str(number),
+            title=f"T{number}",
+            artist="A",
+            album="",
+            duration_seconds=rng.randrange(3, 400),
+            genre=rng.choice(["Jazz", "Rock"]),
+            moods=rng.sample(["calm", "happy", "dark"], rng.randrange(0, 3)),
+            bpm=rng.randrange(80, 140) if number else 100,
+        )
+        for number in range(count)
+    )
+    return library
+
+
+def test_generated_flow_respects_bpm_and_tag_constraints(tmp_path: Path) -> None:
+    library = _library(tmp_path)
+    spec = FlowSpec(length=25, min_bpm_step=0, max_bpm_step=3, target_bpm_step=1, moods=["Calm"], genres=["jazz"])
+    playlist = PlaylistGenerator(library).generate("0", spec, name="up")
+
+    tracks = playlist.expand(library)
+    assert playlist.name == "up" and tracks[0].id == "0"
+    assert len(tracks) == 25 and len(set(playlist.track_ids)) == 25
+    assert all(0 <= after.bpm - before.bpm <= 3 for before, after in zip(tracks, tracks[1:]))
+    assert all(track.genre == "Jazz" and "calm" in track.moods for track in tracks[1:])
+    with pytest.raises(ValueError):
+        PlaylistGenerator(library).generate("0", FlowSpec())
+
+
+def test_duration_target_matches_player_timeline(tmp_path: Path) -> None:
+    library = _library(tmp_path)
+    player = MusicPlayer(library, crossfade_seconds=8)
+    playlist = PlaylistGenerator.for_player(player).generate("0", FlowSpec(duration_seconds=3600))
+    tracks = playlist.expand(library)
+    seconds = wall_clock_seconds(tracks, player.crossfade_seconds)
+    assert abs(seconds - 3600) <= max(track.duration_seconds for track in tracks)
+
+    start = player._time_pointer
+    player.play_playlist(playlist)
+    assert (player._time_pointer - start).total_seconds() == seconds
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+from music_app import cli
+from music_app.history import HistoryLog
+from music_app.library import MusicLibrary, Track
+from music_app.player import MusicPlayer, PlaybackEvent
+
+START = datetime(2024, 3, 1)
+
+
+def _events(count: int) -> list:
+    return [
+        PlaybackEvent(
+            timestamp=START + timedelta(minutes=minute),
+            action="play" if minute % 3 else "crossfade",
+            track_id=f"t{minute % 7}" if minute % 3 else None,
+            metadata=None if minute % 3 else {"seconds": 5},
+        )
+        for minute in range(count)
+    ]
+
+
+def test_range_queries_read_only_matching_blocks(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    path = tmp_path / "library.json.history"
+    log = HistoryLog(path, segment_bytes=2048, block_events=8, flush_events=5, fsync=False)
+    events = _events(400)
+    for event in events:
+        log.append(event)
+    log.close()
+    assert log.segment_count() > 5
+
+    with (path / "00000001.log").open("ab") as fh:
+        fh.write(b'{"t":')  # torn tail of an interrupted write; not the active segment, so never read
+    last = sorted(path.glob("*.log"))[-1]
+    with last.open("ab") as fh:
+        fh.write(b'{"t":1,"a":"pl')
+
+    reopened = HistoryLog(path, segment_bytes=2048, block_events=8, fsync=False)
+    reads = []
+    original = HistoryLog._read
+    monkeypatch.setattr(HistoryLog, "_read", staticmethod(lambda segment, block: reads.append(block) or original(segment, block)))
+    since, until = START + timedelta(minutes=100), START + timedelta(minutes=130)
+    expected = [event for event in events if since <= event.timestamp < until and event.track_id == "t2"]
+    assert reopened.query(since, until, track_id="t2") == expected
+    assert len(reads) <= 6
+    assert reopened.query(action="crossfade", limit=2) == [event for event in events if event.action == "crossfade"][-2:]
+
+    reopened.append(events[0])
+    reopened.close()
+    assert HistoryLog(path).query(limit=2) == [events[-1], events[0]]
+
+
+def test_rollup_folds_old_segments_into_daily_counts(tmp_path: Path) -> None:
+    library = MusicLibrary(storage_path=tmp_path / "library.json")
+    library.add_track(Track(id="1", title="A", artist="A", album="", duration_seconds=3600, genre="Pop"))
+    path = tmp_path / "library.json.history"
+    log = HistoryLog(path, segment_bytes=256, flush_events=1, retention=timedelta(days=2), fsync=False)
+    player = MusicPlayer(library, history_log=log)
+    player._time_pointer = START
+    for _ in range(24 * 5):
+        player.enqueue(["1"])
+        player.play_next()
+    log.close()
+
+    rolled = log.daily_counts(track_id="1")
+    assert rolled[:2] == [("2024-03-01", "1", 23), ("2024-03-02", "1", 24)]
+    assert all(day < "2024-03-04" for day, _, _ in rolled)
+    kept = log.query(action="play")
+    assert sum(plays for _, _, plays in rolled) + len(kept) == 24 * 5
+    assert kept[-1].timestamp == START + timedelta(hours=24 * 5)
+    assert HistoryLog(path).daily_counts() == rolled
+
+
+def test_cli_play_logs_events_at_wall_clock_time(tmp_path: Path) -> None:
+    library = MusicLibrary(storage_path=tmp_path / "library.json")
+    library.import_tracks(
+        Track(id=str(number), title="T", artist="A", album="", duration_seconds=3600, genre="Pop") for number in range(3)
+    )
+    playlist = tmp_path / "mix.json"
+    playlist.write_text('["0", "1", "2"]', encoding="utf-8")
+    context = cli.CommandContext(library)
+    before = datetime.utcnow()
+
+    assert cli.run_argv(["play", str(playlist)], context) == 0
+    after = datetime.utcnow()
+    events = context.history.query(since=before - timedelta(seconds=1))
+    assert [event.action for event in events].count("play") == 3
+    assert all(before <= event.timestamp <= after for event in events)
+    context.close()
@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import io
+import json
+from pathlib import Path
+from typing import Iterator, Tuple
+
+import pytest
+
+from music_app.dedup import DedupIndex
+from music_app.importer import StreamingImporter, iter_json_array, track_from_payload
+from music_app.library import MusicLibrary
+
+
+def _record(track_id: str, **extra: object) -> dict:
+    return {"id": track_id, "title": f"Track {track_id}", "duration_seconds": 100, "genre": "Ambient", **extra}
+
+
+def test_iter_json_array_decodes_across_read_boundaries() -> None:
+    payload = json.dumps([_record(str(index), bpm=100 + index) for index in range(50)])
+    records = list(iter_json_array(io.StringIO(payload), read_size=7))
+
+    assert [number for number, _ in records] == list(range(1, 51))
+    assert records[-1][1]["bpm"] == 149
+
+
+def test_ndjson_import_reports_bad_records_without_aborting(tmp_path: Path) -> None:
+    source = tmp_path / "catalog.ndjson"
+    lines = [json.dumps(_record("1")), "{not json", json.dumps({"title": "No id"}), json.dumps(_record("2"))]
+    source.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    library = MusicLibrary(storage_path=tmp_path / "library.json")
+    batches: list[int] = []
+
+    report = StreamingImporter(library, batch_size=1, progress=lambda r: batches.append(r.imported)).import_path(source)
+
+    assert report.records == 4
+    assert report.inserted == 2
+    assert [error.record for error in report.errors] == [2, 3]
+    assert [track.id for track in library.list_tracks()] == ["1", "2"]
+    assert batches[-1] == 2
+
+
+def test_non_string_text_fields_are_record_errors(tmp_path: Path) -> None:
+    source = tmp_path / "catalog.ndjson"
+    lines = [json.dumps(_record("1", artist=None)), json.dumps(_record("2", album=7)), json.dumps(_record("3", genre=["Rock"]))]
+    source.write_text("\n".join([*lines, json.dumps(_record("4"))]) + "\n", encoding="utf-8")
+    library = MusicLibrary(storage_path=tmp_path / "library.json")
+
+    report = StreamingImporter(library, dedup=DedupIndex(library, tmp_path / "library.json.dedup")).import_path(source)
+
+    assert [error.record for error in report.errors] == [1, 2, 3]
+    assert "'artist' must be a string" in report.errors[0].message
+    assert [track.id for track in library.list_tracks()] == ["4"]
+    assert library.search("unknown") == library.list_tracks()  # absent fields still default
+
+
+def test_json_array_import_with_worker_pool(tmp_path: Path) -> None:
+    source = tmp_path / "catalog.json"
+    source.write_text(json.dumps([_record(str(index)) for index in range(20)]), encoding="utf-8")
+    library = MusicLibrary(storage_path=tmp_path / "library.json", journal=True)
+
+    report = StreamingImporter(library, batch_size=8, chunk_size=5, workers=2).import_path(source)
+
+    assert report.inserted == 20 and not report.errors
+    assert len(MusicLibrary(storage_path=tmp_path / "library.json", journal=True).list_tracks()) == 20
+
+
+def test_import_flags_and_merges_near_duplicates(tmp_path: Path) -> None:
+    library = MusicLibrary(storage_path=tmp_path / "library.json")
+    library.import_tracks([track_from_payload(_record("a", title="Hey Jude", artist="The Beatles", album="Past Masters"))])
+    index_path = tmp_path / "library.json.dedup"
+    records = [
+        _record("b", title="HEY JUDE (2015 Remaster)", artist="The Beatles", album="Past Masters"),
+        _record("c", title="Let It Be", artist="The Beatles", album="Past Masters"),
+        _record("d", title="Let It Be - Mono Version", artist="the beatles", album="Past Masters", duration_seconds=102),
+        _record("e", title="Hey Jude", artist="The Beatles", album="Past Masters", duration_seconds=400),
+    ]
+
+    index = DedupIndex(library, index_path)  # indexes the existing library once
+    report = StreamingImporter(library, dedup=index, merge_duplicates=True).import_records(enumerate(records, 1))
+
+    assert [(match.track_id, match.duplicate_of) for match in report.duplicates] == [("b", "a"), ("d", "c")]
+    assert report.merged == 2 and report.inserted == 2
+    assert sorted(track.id for track in library.list_tracks()) == ["a", "c", "e"]
+
+    reopened = DedupIndex(library, index_path)
+    assert len(reopened) == 3
+    match = reopened.match(track_from_payload(_record("f", title="Hey  Jude", artist="The Béatles", album="Past Masters")))
+    assert match is not None and match.duplicate_of == "a"
+
+
+@pytest.mark.parametrize("journal", [False, True])
+def test_failed_import_keeps_committed_batches(tmp_path: Path, monkeypatch: pytest.MonkeyPatch, journal: bool) -> None:
+    library = MusicLibrary(storage_path=tmp_path / "library.json", journal=journal)
+    saves: list[int] = []
+    original_save = library.backend.save
+    monkeypatch.setattr(library.backend, "save", lambda tracks: saves.append(1) or original_save(tracks))
+
+    def records() -> Iterator[Tuple[int, dict]]:
+        yield from enumerate([_record("1"), _record("2"), _record("3")], 1)
+        raise OSError("connection reset")
+
+    with pytest.raises(OSError):
+        StreamingImporter(library, batch_size=2, chunk_size=1).import_records(records())
+
+    assert [track.id for track in library.list_tracks()] == ["1", "2"]
+    assert [track.id for track in MusicLibrary(storage_path=tmp_path / "library.json", journal=journal).list_tracks()] == ["1", "2"]
+    assert len(saves) == (0 if journal else 1)
@@ -2,7 +2,10 @@ from __future__ import annotations
 
 from pathlib import Path
 
+import pytest
+
 from music_app.library import MusicLibrary, Track
+from music_app.recommendation import RecommendationEngine
 
 
 def test_add_and_retrieve_track(tmp_path: Path) -> None:
@@ -35,3 +38,143 @@ def test_search_tracks(tmp_path: Path) -> None:
 
     results = library.search("calm")
     assert [track.id for track in results] == ["1"]
+
+
+def test_journal_mode_appends_and_replays(tmp_path: Path) -> None:
+    storage = tmp_path / "library.json"
+    library = MusicLibrary(storage_path=storage, journal=True)
+    library.add_track(Track(id="1", title="One", artist="A", album="", duration_seconds=100, genre="Ambient"))
+    library.add_track(Track(id="2", title="Two", artist="B", album="", duration_seconds=100, genre="Rock"))
+    library.update_track_metadata("1", title="Uno")
+    library.remove_track("2")
+    library.close()
+
+    assert not storage.exists()
+    journal = storage.with_name("library.json.journal")
+    with journal.open("ab") as fh:
+        fh.write(b'{"op":"put","track":{"id":"torn"')
+
+    reloaded = MusicLibrary(storage_path=storage, journal=True)
+    assert [track.id for track in reloaded.list_tracks()] == ["1"]
+    assert reloaded.get_track("1").title == "Uno"
+
+    reloaded.update_track_metadata("1", genre="Jazz")
+    reloaded.save()
+    reloaded.close()
+    assert journal.stat().st_size == 0
+    assert MusicLibrary(storage_path=storage, journal=True).get_track("1").genre == "Jazz"
+
+
+def test_journal_compacts_on_size_threshold(tmp_path: Path) -> None:
+    storage = tmp_path / "library.json"
+    library = MusicLibrary(storage_path=storage, journal=True, compact_bytes=256)
+    for index in range(5):
+        library.add_track(Track(id=str(index), title="T", artist="A", album="", duration_seconds=1, genre="G"))
+
+    assert storage.exists()
+    assert library.backend.journal is not None and library.backend.journal.size < 256
+    assert len(MusicLibrary(storage_path=storage, journal=True).list_tracks()) == 5
+
+
+def test_import_tracks_flushes_once_and_reports_counts(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    library = MusicLibrary(storage_path=tmp_path / "library.json")
+    library.add_track(Track(id="1", title="Old", artist="A", album="", duration_seconds=100, genre="Ambient"))
+    saves: list[int] = []
+    original_save = library.backend.save
+    monkeypatch.setattr(library.backend, "save", lambda tracks: saves.append(1) or original_save(tracks))
+
+    result = library.import_tracks(
+        [
+            Track(id="1", title="New", artist="A", album="", duration_seconds=100, genre="Ambient"),
+            Track(id="2", title="Two", artist="B", album="", duration_seconds=100, genre="Rock"),
+            Track(id="3", title="Three", artist="C", album="", duration_seconds=100, genre="Rock"),
+        ],
+        overwrite=True,
+    )
+
+    assert (result.inserted, result.overwritten, result.skipped) == (2, 1, 0)
+    assert len(saves) == 1
+
+    skipped = library.import_tracks(
+        [Track(id="2", title="Dup", artist="B", album="", duration_seconds=1, genre="Rock")],
+        skip_existing=True,
+    )
+    assert skipped.skipped == 1
+    assert library.get_track("2").title == "Two"
+
+
+def test_batch_rolls_back_on_exception(tmp_path: Path) -> None:
+    storage = tmp_path / "library.json"
+    library = MusicLibrary(storage_path=storage)
+    library.import_tracks(
+        [
+            Track(id="1", title="One", artist="A", album="", duration_seconds=100, genre="Ambient"),
+            Track(id="2", title="Two", artist="B", album="", duration_seconds=100, genre="Rock"),
+        ]
+    )
+
+    with pytest.raises(RuntimeError, match="abort"):
+        with library.batch():
+            library.remove_track("1")
+            library.update_track_metadata("2", title="Changed")
+            library.add_track(Track(id="3", title="Three", artist="C", album="", duration_seconds=1, genre="Pop"))
+            raise RuntimeError("abort")
+
+    assert [track.id for track in library.list_tracks()] == ["1", "2"]
+    assert library.get_track("2").title == "Two"
+    assert [track.id for track in MusicLibrary(storage_path=storage).list_tracks()] == ["1", "2"]
+
+
+def test_search_index_matches_scan_after_mutations(tmp_path: Path) -> None:
+    library = MusicLibrary(storage_path=tmp_path / "library.json", journal=True)
+    words = ["Calm", "Storm", "Night", "Sea", "Neon", "Jazz", "Dawn"]
+    library.import_tracks(
+        Track(
+            id=str(index),
+            title=f"{words[index % 7]} {words[(index * 3) % 7]}",
+            artist=f"Artist {index % 5}",
+            album="",
+            duration_seconds=100,
+            genre=words[(index * 2) % 7],
+            moods=["calm"] if index % 4 == 0 else ["energetic"],
+        )
+        for index in range(60)
+    )
+    queries = ["calm", "a", "ni", "ST 3", "sea n", "zz", "artist 4", "missing", ""]
+    library.search("warm up")
+    library.remove_track("8")
+    library.update_track_metadata("9", title="Calm Harbour", moods=["late night"])
+    library.add_track(Track(id="8", title="Sea Calm", artist="X", album="", duration_seconds=1, genre="Pop"))
+
+    for query in queries:
+        expected = [track.id for track in library._scan_search(query, None, 0)]
+        assert [track.id for track in library.search(query)] == expected
+        assert [track.id for track in library.search(query, limit=3, offset=2)] == expected[2:5]
+
+
+def test_rankings_match_stable_sorts_after_plays_and_edits(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr("music_app.indexes.SORTED_CHUNK_SIZE", 4)
+    library = MusicLibrary(storage_path=tmp_path / "library.json")
+    library.import_tracks(
+        Track(id=str(index), title=f"T{index}", artist="A", album="", duration_seconds=60, genre="Pop", play_count=index % 3)
+        for index in range(40)
+    )
+    engine = RecommendationEngine(library)
+
+    def check() -> None:
+        tracks = library.list_tracks()
+        by_plays = sorted(tracks, key=lambda t: t.play_count, reverse=True)
+        by_recency = sorted((t for t in tracks if t.last_played), key=lambda t: t.last_played or "", reverse=True)
+        by_popularity = sorted(tracks, key=lambda t: (t.play_count, t.last_played or ""), reverse=True)
+        assert [t.id for t in library.top_tracks(15)] == [t.id for t in by_plays[:15]]
+        assert [t.id for t in library.recently_played(15)] == [t.id for t in by_recency[:15]]
+        assert [t.id for t in engine.top_trending(15)] == [t.id for t in by_popularity[:15]]
+
+    check()
+    for track_id in ["5", "7", "5", "30", "2"]:
+        library.get_track(track_id).mark_played()
+    library.update_track_metadata("11", play_count=9, last_played="2000-01-01T00:00:00")
+    library.update_track_metadata("12", last_played="2000-01-01T00:00:00")
+    library.remove_track("7")
+    library.add_track(Track(id="7", title="T7", artist="A", album="", duration_seconds=60, genre="Pop", play_count=2))
+    check()
@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import multiprocessing
+from pathlib import Path
+from typing import Iterator
+
+import pytest
+
+from music_app import cli, metrics
+from music_app import library as library_module
+from music_app.library import MusicLibrary, Track
+from music_app.recommendation import RecommendationEngine
+
+
+def _track(number: int) -> Track:
+    return Track(
+        id=f"t{number}",
+        title=f"Song {number}",
+        artist="Band" if number % 2 else "Solo",
+        album="Album",
+        duration_seconds=200,
+        genre="Rock",
+        moods=["happy"],
+        bpm=120,
+    )
+
+
+@pytest.fixture
+def registry(monkeypatch: pytest.MonkeyPatch) -> Iterator[metrics.MetricsRegistry]:
+    monkeypatch.setattr(metrics.REGISTRY, "enabled", True)
+    metrics.REGISTRY.reset()
+    yield metrics.REGISTRY
+    metrics.REGISTRY.reset()
+
+
+def test_hot_paths_record_latency_bytes_and_scans(tmp_path: Path, registry: metrics.MetricsRegistry) -> None:
+    library = MusicLibrary(storage_path=tmp_path / "library.json")
+    library.import_tracks(_track(number) for number in range(20))
+    library.save()
+    assert library.search("song 1", limit=2) == [library.get_track("t1"), library.get_track("t10")]
+    RecommendationEngine(library).recommend_by_mood("happy")
+
+    timers = {(name, dict(labels).get("operation", dict(labels).get("method"))) for name, labels in registry.histograms}
+    assert {
+        ("music_library_operation_seconds", "import_tracks"),
+        ("music_library_operation_seconds", "save"),
+        ("music_library_operation_seconds", "search"),
+        ("music_recommendation_seconds", "mood"),
+    } <= timers
+    # islice stops the scan at the second match.
+    assert registry.counters[("music_tracks_scanned_total", (("operation", "search"),))] == 11
+    assert registry.counters[("music_bytes_written_total", (("file", "json"),))] > 0
+
+    state, prom = tmp_path / "library.json.metrics.json", tmp_path / "library.json.prom"
+    metrics.flush(state, prom)
+    assert not registry
+    library.search("song")
+    totals = metrics.flush(state, prom)
+    search = totals.histograms[("music_library_operation_seconds", (("operation", "search"),))]
+    assert search.count == 2
+    assert 0 < search.quantile(0.5) <= search.quantile(0.99)
+
+    text = prom.read_text()
+    assert "# TYPE music_library_operation_seconds histogram" in text
+    assert 'music_library_operation_seconds_bucket{operation="search",le="+Inf"} 2' in text
+    assert 'music_tracks_scanned_total{operation="search"} 11' in text  # the second search used the index
+
+
+def test_disabled_hooks_record_nothing_and_cli_reports_totals(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str]
+) -> None:
+    assert not metrics.enabled()
+    tracks = [_track(1)]
+    assert metrics.counted(tracks, "music_tracks_scanned_total") is tracks
+    library = MusicLibrary(storage_path=tmp_path / "library.json")
+    library.add_track(_track(1))
+    library.search("song")
+    assert not metrics.REGISTRY
+
+    monkeypatch.setattr(library_module, "DEFAULT_STORAGE_PATH", tmp_path / "library.json")
+    assert cli.main(["stats"]) == 1
+    monkeypatch.setattr(metrics.REGISTRY, "enabled", True)
+    metrics.inc("music_player_events_total", action="play")
+    assert cli.main(["--profile", str(tmp_path / "stats.prof"), "stats", "--prometheus"]) == 1
+    assert (tmp_path / "stats.prof").exists()
+    metrics.flush(metrics.metrics_path_for(tmp_path / "library.json"))
+    capsys.readouterr()
+    assert cli.main(["stats", "--prometheus"]) == 0
+    assert 'music_player_events_total{action="play"} 1' in capsys.readouterr().out
+
+
+def _flush_counts(state: str, runs: int) -> None:
+    for _ in range(runs):
+        metrics.REGISTRY.enabled = True
+        metrics.inc("music_player_events_total", action="play")
+        metrics.flush(Path(state))
+
+
+def test_concurrent_flushes_keep_every_count(tmp_path: Path) -> None:
+    state = tmp_path / "library.json.metrics.json"
+    context = multiprocessing.get_context("fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn")
+    workers = [context.Process(target=_flush_counts, args=(str(state), 25)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert metrics.load_metrics(state).counters[("music_player_events_total", (("action", "play"),))] == 100
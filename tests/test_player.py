@@ -5,6 +5,7 @@ from pathlib import Path
 from music_app.library import MusicLibrary, Track
 from music_app.player import MusicPlayer
 from music_app.playlist import Playlist
+from music_app.transitions import TransitionModel
 
 
 def test_play_playlist_records_history(tmp_path: Path) -> None:
@@ -36,3 +37,18 @@ def test_equalizer_transition(tmp_path: Path) -> None:
     player.transition_equalizer("bass_boost", steps=3)
 
     assert any(event.action == "eq_transition" for event in player.history)
+
+
+def test_play_playlist_ends_the_session(tmp_path: Path) -> None:
+    library = MusicLibrary(storage_path=tmp_path / "library.json")
+    library.import_tracks(
+        Track(id=track_id, title=track_id, artist="A", album="", duration_seconds=60, genre="Pop") for track_id in "abcd"
+    )
+    model = TransitionModel()
+    player = MusicPlayer(library, transitions=model)
+    player.play_playlist(Playlist(name="first", track_ids=["a", "b"]))
+    player.play_playlist(Playlist(name="second", track_ids=["c", "d"]))
+
+    assert player.history[-1].action == "queue_empty"
+    assert model.successors("b") == []
+    assert model.successors("a") == [("b", 1)] and model.successors("c") == [("d", 1)]
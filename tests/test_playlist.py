@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import json
+import pickle
+import random
+from pathlib import Path
+
+import pytest
+
+from music_app import cli, playlist_store
+from music_app.library import MusicLibrary, Track
+from music_app.playlist import MissingTracksError, Playlist, PlaylistCollection, TrackIdList
+
+
+def test_track_id_list_matches_list_semantics_under_random_edits() -> None:
+    rng = random.Random(7)
+    playlist = Playlist(name="mix", track_ids=["a", "b", "a", "c"])
+    reference = ["a", "b", "a", "c"]
+    assert isinstance(playlist.track_ids, TrackIdList) and playlist.track_ids == reference
+
+    for _ in range(500):
+        track_id = str(rng.randrange(30))
+        choice = rng.random()
+        if choice < 0.3:
+            playlist.add_track(track_id)
+            if track_id not in reference:
+                reference.append(track_id)
+        elif choice < 0.4:
+            playlist.track_ids.append(track_id)
+            reference.append(track_id)
+        elif choice < 0.55:
+            playlist.remove_track(track_id)
+            if track_id in reference:
+                reference.remove(track_id)
+        elif choice < 0.65 and reference:
+            start = rng.randrange(len(reference))
+            replacement = [str(rng.randrange(30)) for _ in range(rng.randrange(3))]
+            playlist.track_ids[start : start + 2] = replacement
+            reference[start : start + 2] = replacement
+        elif reference:
+            old, new = rng.randrange(-len(reference), len(reference)), rng.randrange(-len(reference) - 2, len(reference) + 2)
+            reference.insert(new, reference.pop(old))
+            playlist.reorder(old, new)
+        assert playlist.track_ids == reference
+        assert all(playlist.track_ids.count(str(n)) == reference.count(str(n)) for n in range(30))
+        assert all((str(n) in playlist.track_ids) == (str(n) in reference) for n in range(30))
+
+
+def test_playlist_track_ids_stay_a_list(tmp_path: Path) -> None:
+    playlist = Playlist(name="mix", track_ids=["1", "2", "1"])
+    assert json.loads(json.dumps(playlist.track_ids)) == ["1", "2", "1"]
+    assert isinstance(playlist.track_ids, list) and playlist.track_ids.index("2") == 1
+    assert pickle.loads(pickle.dumps(playlist)) == playlist
+    playlist.track_ids = ["3"]  # plain lists can still be assigned
+    playlist.add_tracks(["3", "4"])
+    assert playlist.track_ids == ["3", "4"]
+
+
+def test_expand_reports_every_missing_id(tmp_path: Path) -> None:
+    library = MusicLibrary(storage_path=tmp_path / "library.json")
+    library.add_track(Track(id="1", title="A", artist="A", album="", duration_seconds=60, genre="Pop"))
+    playlist = Playlist(name="mix", track_ids=["1", "gone", "2"])
+
+    with pytest.raises(MissingTracksError) as excinfo:
+        playlist.expand(library)
+    assert excinfo.value.missing == ["gone", "2"]
+    playlist.remove_track("gone")
+    playlist.remove_track("2")
+    assert [track.title for track in playlist.expand(library)] == ["A"]
+
+
+def test_persistent_collection_loads_lazily_and_appends_incrementally(tmp_path: Path) -> None:
+    path = tmp_path / "library.json.playlists"
+    collection = PlaylistCollection(path)
+    collection.add(Playlist(name="mix", track_ids=["a", "b"]))
+    collection.add(Playlist(name="other", track_ids=["b", "c"]))
+    array_file = path / "0.u32"
+    written = array_file.stat().st_mtime_ns, (path / "1.u32").stat().st_mtime_ns
+
+    assert collection.append("mix", ["c", "a", "d"]) == 2
+    assert array_file.stat().st_size == 4 * 4
+    assert (path / "1.u32").stat().st_mtime_ns == written[1]
+
+    reopened = PlaylistCollection(path)
+    assert reopened.names() == ["mix", "other"]
+    assert reopened._playlists == {}
+    playlist = reopened.get("mix")
+    assert playlist.track_ids == ["a", "b", "c", "d"]
+    playlist.reorder(0, -1)
+    playlist.remove_track("c")
+    reopened.update(playlist)
+    reopened.remove("other")
+
+    assert PlaylistCollection(path).get("mix").track_ids == ["b", "a", "d"]
+    assert "other" not in PlaylistCollection(path)
+
+
+def test_stored_ids_decode_window_by_window(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(playlist_store, "WINDOW_BYTES", 8)
+    store = playlist_store.PlaylistStore(tmp_path / "library.json.playlists")
+    ids = [f"t{number}" for number in range(7)]
+    store.create("mix", ids)
+
+    lazy = store.iter_ids("mix")
+    assert [next(lazy) for _ in range(3)] == ids[:3]
+    assert list(lazy) == ids[3:]
+    assert store.read("mix") == ids
+
+
+def test_cli_rejects_unknown_track_ids(tmp_path: Path, capsys: pytest.CaptureFixture[str]) -> None:
+    library = MusicLibrary(storage_path=tmp_path / "library.json")
+    library.add_track(Track(id="1", title="A", artist="A", album="", duration_seconds=60, genre="Pop"))
+    context = cli.CommandContext(library)
+
+    assert cli.run_argv(["playlist", "create", "focus", "1"], context) == 0
+    assert cli.run_argv(["playlist", "add", "focus", "1", "trk-404"], context) == 1
+    assert "trk-404" in capsys.readouterr().err
+    assert cli.run_argv(["playlist", "create", "other", "nope"], context) == 1
+    assert "other" not in context.playlists
+    assert cli.run_argv(["play", "focus"], context) == 0
+    assert context.playlists.get("focus").track_ids == ["1"]
+    context.close()
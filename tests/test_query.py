@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+
+from music_app.library import MusicLibrary, Track
+from music_app.query import QueryError, parse_query
+
+
+def _library(tmp_path: Path) -> MusicLibrary:
+    library = MusicLibrary(storage_path=tmp_path / "library.json")
+    genres = ["Ambient", "Rock", "Jazz"]
+    moods = [["calm"], ["energetic"], ["calm", "focus"], []]
+    library.import_tracks(
+        Track(
+            id=str(index),
+            title=f"Track {index}",
+            artist=f"Artist {index % 4}",
+            album="",
+            duration_seconds=150 + (index * 37) % 300,
+            genre=genres[index % 3],
+            moods=list(moods[index % 4]),
+            bpm=None if index % 10 == 0 else 70 + (index * 7) % 60,
+            play_count=index % 3,
+        )
+        for index in range(120)
+    )
+    return library
+
+
+@pytest.mark.parametrize(
+    "expression",
+    [
+        "genre=Ambient, bpm=85..100, duration<300, mood=calm, plays=0",
+        "genre=rock|jazz bpm>=100 artist='Artist 1'",
+        "bpm=none",
+        "mood!=calm duration=..200",
+        "plays>0 track",
+        "genre=Ambient 'Track 1'",
+    ],
+)
+def test_query_matches_brute_force(tmp_path: Path, expression: str) -> None:
+    library = _library(tmp_path)
+    library.get_track("3").mark_played()
+    library.update_track_metadata("6", genre="Jazz", moods=["calm"])
+    predicates = parse_query(expression)
+
+    expected = [track.id for track in library.list_tracks() if all(p.matches(track) for p in predicates)]
+    assert expected
+    assert [track.id for track in library.query(expression)] == expected
+    assert [track.id for track in library.query(expression, limit=2, offset=1)] == expected[1:3]
+
+
+def test_played_never_tracks_play_updates(tmp_path: Path) -> None:
+    library = _library(tmp_path)
+    never = {track.id for track in library.query("played=never")}
+    assert len(never) == 120
+
+    library.get_track("5").mark_played()
+    assert "5" not in {track.id for track in library.query("played=never")}
+    assert "5" in {track.id for track in library.query("played>=2000-01-01")}
+
+
+def test_planner_drives_with_most_selective_index(tmp_path: Path) -> None:
+    library = _library(tmp_path)
+    plan = library.explain("genre=Ambient bpm=71..72")
+
+    assert plan.splitlines()[0].startswith("drive  71<=bpm<=72")
+    with pytest.raises(QueryError):
+        library.query("bpm>fast")
+
+
+def test_unbalanced_apostrophe_is_free_text(tmp_path: Path) -> None:
+    library = _library(tmp_path)
+    library.update_track_metadata("7", title="Don't Stop")
+
+    assert [track.id for track in library.query("Don't Stop")] == ["7"]
+    assert [track.id for track in library.query("don't")] == ["7"]
@@ -1,7 +1,12 @@
 from __future__ import annotations
 
+import random
+from collections import Counter
 from pathlib import Path
 
+import pytest
+
+from music_app.cache import ResultCache
 from music_app.library import MusicLibrary, Track
 from music_app.recommendation import RecommendationEngine
 
@@ -34,3 +39,95 @@ def test_recommend_similar(tmp_path: Path) -> None:
     seed = library.get_track("1")
     results = engine.recommend_similar(seed)
     assert results[0].id == "2"
+
+
+def test_recommend_similar_matches_reference_ranking(tmp_path: Path) -> None:
+    rng = random.Random(3)
+    tags = ["Ambient", "Rock", "calm", "focus", "late night"]
+    library = MusicLibrary(storage_path=tmp_path / "library.json")
+    library.import_tracks(
+        Track(
+            id=str(index),
+            title=f"T{index}",
+            artist="A",
+            album="",
+            duration_seconds=100,
+            genre=rng.choice(tags[:3]),
+            moods=rng.choices(tags, k=rng.randrange(4)),
+            bpm=rng.choice([None, 0, 88, 90, 92, 94, 120]),
+        )
+        for index in range(120)
+    )
+    library.update_track_metadata("7", moods=["calm", "calm"], bpm=91)
+    engine = RecommendationEngine(library)
+
+    def reference(seed: Track, limit: int) -> list[str]:
+        def key(track: Track) -> tuple:
+            shared = sum((Counter([seed.genre, *seed.moods]) & Counter([track.genre, *track.moods])).values())
+            return -shared, track.genre != seed.genre, abs((track.bpm or 0) - (seed.bpm or 0))
+
+        return [t.id for t in sorted((t for t in library.list_tracks() if t.id != seed.id), key=key)[:limit]]
+
+    seeds = library.list_tracks()[:30] + [Track(id="x", title="X", artist="", album="", duration_seconds=1, genre="Jazz", moods=["calm"], bpm=93)]
+    expected = [reference(seed, 8) for seed in seeds]
+    assert [[t.id for t in engine.recommend_similar(seed, limit=8)] for seed in seeds] == expected
+    assert [[t.id for t in ranked] for ranked in engine.recommend_similar_batch(seeds, limit=8, workers=2)] == expected
+
+
+def test_recommend_by_mood_follows_plays_and_edits(tmp_path: Path) -> None:
+    rng = random.Random(5)
+    moods = ["Calm", "calmer", "Focus", "late night", "energetic"]
+    library = MusicLibrary(storage_path=tmp_path / "library.json")
+    library.import_tracks(
+        Track(id=str(index), title="T", artist="A", album="", duration_seconds=60, genre="Pop", moods=rng.sample(moods, rng.randrange(3)), play_count=rng.randrange(3))
+        for index in range(80)
+    )
+    engine = RecommendationEngine(library)
+
+    def check() -> None:
+        for query in ["calm", "ALM", "night", "", "missing"]:
+            matching = [t for t in library.list_tracks() if any(query.lower() in mood.lower() for mood in t.moods)]
+            expected = sorted(matching, key=lambda t: (t.play_count, t.last_played or ""), reverse=True)[:6]
+            assert [t.id for t in engine.recommend_by_mood(query, limit=6)] == [t.id for t in expected]
+
+    check()
+    for track_id in ["3", "9", "3", "40"]:
+        library.get_track(track_id).mark_played()
+    library.update_track_metadata("12", moods=["CALM", "calm"], play_count=50)
+    library.remove_track("9")
+    check()
+
+
+def test_recommendation_cache_tracks_library_versions(tmp_path: Path) -> None:
+    library = MusicLibrary(storage_path=tmp_path / "library.json")
+    _seed_library(library)
+    exact = RecommendationEngine(library)
+    coarse = RecommendationEngine(library, cache_ttl=60, coarse_invalidation=True)
+    with pytest.raises(ValueError):
+        RecommendationEngine(library, coarse_invalidation=True)
+
+    for engine in (exact, coarse):
+        assert [t.id for t in engine.top_trending(2)] == ["3", "1"]
+        assert [t.id for t in engine.top_trending(2)] == ["3", "1"]
+    assert (exact.cache_stats().hits, exact.cache_stats().misses) == (1, 1)
+
+    for _ in range(16):
+        library.get_track("2").mark_played()
+    assert [t.id for t in exact.top_trending(2)] == ["2", "3"]
+    assert [t.id for t in coarse.top_trending(2)] == ["3", "1"]
+    assert exact.cache_stats().invalidations == 1 and coarse.cache_stats().hits == 2
+
+    library.add_track(Track(id="4", title="D", artist="D", album="", duration_seconds=1, genre="Pop", play_count=99))
+    assert [t.id for t in coarse.top_trending(2)] == ["4", "2"]
+
+
+def test_result_cache_evicts_and_expires() -> None:
+    now = [0.0]
+    cache: ResultCache[int] = ResultCache(maxsize=2, ttl=10, clock=lambda: now[0])
+    for key in ["a", "b", "a", "c"]:
+        cache.get_or_compute(key, 0, lambda: len(key))
+    now[0] = 11
+    cache.get_or_compute("a", 0, lambda: 1)
+
+    stats = cache.stats()
+    assert (stats.hits, stats.misses, stats.evictions, stats.expirations, stats.size) == (1, 4, 1, 1, 2)
@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import asyncio
+from pathlib import Path
+
+import pytest
+
+from music_app.library import MusicLibrary, Track
+from music_app.service import PlayerService
+
+
+def _library(tmp_path: Path) -> MusicLibrary:
+    library = MusicLibrary(storage_path=tmp_path / "library.json")
+    library.import_tracks(
+        Track(id=str(number), title=f"T{number}", artist="A", album="", duration_seconds=30 + number, genre="Pop")
+        for number in range(10)
+    )
+    return library
+
+
+def test_sessions_share_one_batched_writer(tmp_path: Path) -> None:
+    library = _library(tmp_path)
+    saves = []
+    save = library.save
+    library.save = lambda: saves.append(save())  # type: ignore[method-assign]
+
+    async def run() -> PlayerService:
+        async with PlayerService(library, time_scale=0, flush_plays=10_000, flush_interval=60) as service:
+            sessions = [service.open_session() for _ in range(50)]
+            for number, session in enumerate(sessions):
+                session.enqueue([str(number % 10), str((number + 1) % 10), str((number + 2) % 10)])
+            await asyncio.gather(*(session.wait_idle() for session in sessions))
+            assert all(session.player.history[-1].action == "queue_empty" for session in sessions)
+        return service
+
+    service = asyncio.run(run())
+
+    assert sum(track.play_count for track in library.list_tracks()) == 150
+    assert library.get_track("0").play_count == 15
+    assert service.stats().applied_plays == 150
+    assert len(saves) == service.stats().batches == 1
+    assert MusicLibrary(storage_path=tmp_path / "library.json").get_track("0").play_count == 15
+
+
+def test_skip_moves_to_next_track_and_interval_flushes(tmp_path: Path) -> None:
+    library = _library(tmp_path)
+
+    async def run() -> None:
+        async with PlayerService(library, time_scale=10.0, flush_interval=0.01) as service:
+            session = service.open_session("listener")
+            session.enqueue(["0", "1"])
+            await asyncio.sleep(0.01)
+            session.skip()
+            await asyncio.sleep(0.05)
+            assert library.get_track("0").play_count == 1
+            assert library.get_track("1").play_count == 1
+            actions = [event.action for event in session.player.history]
+            assert actions == ["play", "skip", "play"]
+            await service.close_session("listener")
+
+    asyncio.run(run())
+
+
+def test_failed_save_is_retried_without_stopping_the_writer(tmp_path: Path, caplog: pytest.LogCaptureFixture) -> None:
+    library = _library(tmp_path)
+    failures = [OSError("disk full")]
+    save = library.save
+
+    def flaky_save() -> None:
+        if failures:
+            raise failures.pop()
+        save()
+
+    library.save = flaky_save  # type: ignore[method-assign]
+
+    async def run() -> PlayerService:
+        async with PlayerService(library, time_scale=0, flush_plays=1, flush_interval=0.01) as service:
+            session = service.open_session()
+            session.enqueue(["0"])
+            await session.wait_idle()
+            await asyncio.sleep(0.05)  # the failed save is retried after flush_interval
+            assert not failures and service.stats().applied_plays == 1
+            session.enqueue(["1"])
+            await session.wait_idle()
+        return service
+
+    service = asyncio.run(run())
+
+    assert "retrying with the next flush" in caplog.text
+    assert service.stats().applied_plays == 2
+    reopened = MusicLibrary(storage_path=tmp_path / "library.json")
+    assert reopened.get_track("0").play_count == 1 and reopened.get_track("1").play_count == 1
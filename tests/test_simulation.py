@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+from datetime import datetime
+from pathlib import Path
+
+from music_app.library import MusicLibrary, Track
+from music_app.player import MusicPlayer
+from music_app.playlist import Playlist
+from music_app.simulation import PlaybackSimulator
+from music_app.transitions import TransitionModel
+
+
+def _library(tmp_path: Path) -> MusicLibrary:
+    library = MusicLibrary(storage_path=tmp_path / "library.json")
+    library.import_tracks(
+        Track(id=str(number), title=f"T{number}", artist="A", album="", duration_seconds=duration, genre="Pop")
+        for number, duration in enumerate([200, 3, 95, 41])
+    )
+    return library
+
+
+def test_simulator_reproduces_player_events(tmp_path: Path) -> None:
+    playlists = [Playlist(name="a", track_ids=["0", "1", "2"]), Playlist(name="b", track_ids=["3", "1"])]
+    start = datetime(2024, 5, 1, 12, 0)
+
+    player = MusicPlayer(_library(tmp_path / "player"), crossfade_seconds=4)
+    player._time_pointer = start
+    for playlist in playlists:
+        player.play_playlist(playlist)
+    player.transition_equalizer("bass_boost", steps=2)
+    player.play_next()
+
+    library = _library(tmp_path / "simulated")
+    simulator = PlaybackSimulator(library, crossfade_seconds=4, start=start)
+    assert simulator.play_playlists(playlists) == 5
+    simulator.transition_equalizer("bass_boost", steps=2)
+    simulator.stop()
+
+    assert list(simulator.buffer.events()) == list(player.history)
+    assert simulator.now == player._time_pointer
+    assert simulator.buffer.action_counts() == {"play": 5, "crossfade": 3, "queue_empty": 3, "eq_transition": 2}
+
+
+def test_apply_bulk_updates_library_and_transitions(tmp_path: Path) -> None:
+    library = _library(tmp_path)
+    played = []
+    library.add_play_listener(lambda track: played.append(track.id))
+    version = library.version
+    simulator = PlaybackSimulator(library, record_events=False)
+    for _ in range(1000):
+        simulator.play_playlist(["0", "1", "0"])
+    simulator.stop()
+    model = TransitionModel()
+
+    assert len(simulator.buffer) == 0
+    assert simulator.apply(model) == 3000
+    assert library.get_track("0").play_count == 2000 and library.get_track("1").play_count == 1000
+    assert library.get_track("2").play_count == 0
+    assert library.top_tracks(1)[0].id == "0"
+    assert library.version == version + 1
+    assert len(played) == 3000
+    assert model.successors("0") == [("1", 1000)]
+    assert model.successors("1") == [("0", 1000)]
+    assert simulator.apply() == 0
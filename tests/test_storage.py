@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import os
+import stat
+from pathlib import Path
+
+import pytest
+
+from music_app.library import MusicLibrary, Track, migrate_library
+from music_app.storage import SQLiteStorage
+
+
+def _tracks() -> list[Track]:
+    return [
+        Track(id="1", title="Calm Sea", artist="Aurora", album="Dawn", duration_seconds=100, genre="Ambient", moods=["calm"], play_count=3),
+        Track(id="2", title="Storm", artist="Circuit", album="City", duration_seconds=120, genre="Rock", moods=["energetic"], play_count=7),
+        Track(id="3", title="Night Drive", artist="Soul", album="Moon", duration_seconds=90, genre="Jazz", moods=["late night", "calm"], play_count=3),
+    ]
+
+
+def test_sqlite_backend_round_trip_and_pushdown(tmp_path: Path) -> None:
+    location = f"sqlite://{tmp_path / 'library.db'}"
+    library = MusicLibrary(storage_path=location)
+    assert isinstance(library.backend, SQLiteStorage)
+    library.import_tracks(_tracks())
+    library.update_track_metadata("2", title="Storm Front")
+    library.remove_track("1")
+    library.add_track(Track(id="1", title="Calm Sea", artist="Aurora", album="", duration_seconds=100, genre="Ambient"))
+
+    assert [track.id for track in library.search("calm")] == ["3", "1"]
+    assert [track.id for track in library.search("o", limit=2)] == ["2", "3"]
+    assert [track.id for track in library.top_tracks(2)] == ["2", "3"]
+
+    track = library.get_track("3")
+    assert library.get_track("3") is track
+    track.mark_played()
+    assert [t.id for t in library.recently_played()] == ["3"]
+    assert [t.id for t in library.popular_tracks(3)] == ["2", "3", "1"]
+    assert [t.id for t in library.popular_tracks(3, mood="AL")] == ["3"]
+    library.save()
+    library.close()
+
+    reopened = MusicLibrary(storage_path=tmp_path / "library.db")
+    assert [track.id for track in reopened.list_tracks()] == ["2", "3", "1"]
+    assert reopened.get_track("2").title == "Storm Front"
+    assert reopened.get_track("3").play_count == 4
+    assert len(reopened) == 3
+
+
+def test_sqlite_plays_are_committed_for_other_connections(tmp_path: Path) -> None:
+    library = MusicLibrary(storage_path=tmp_path / "library.db")
+    library.import_tracks(_tracks())
+    library.get_track("1").mark_played()
+    library.record_plays({"2": 2, "3": 1})
+    assert not library.backend.connection.in_transaction
+
+    other = SQLiteStorage(tmp_path / "library.db")
+    counts = dict(other.execute("SELECT id, play_count FROM tracks"))
+    assert counts == {"1": 4, "2": 9, "3": 4}
+    with other.connection:
+        other.execute("UPDATE tracks SET genre = 'Pop' WHERE id = '1'")  # not locked out
+    other.close()
+    library.close()
+
+
+def test_sqlite_batch_rollback_leaves_database_untouched(tmp_path: Path) -> None:
+    library = MusicLibrary(storage_path=tmp_path / "library.db")
+    library.import_tracks(_tracks())
+    try:
+        with library.batch():
+            library.remove_track("1")
+            library.add_track(Track(id="4", title="New", artist="X", album="", duration_seconds=1, genre="Pop"))
+            raise RuntimeError("abort")
+    except RuntimeError:
+        pass
+
+    assert [track.id for track in library.list_tracks()] == ["1", "2", "3"]
+    assert [track.id for track in MusicLibrary(storage_path=tmp_path / "library.db").list_tracks()] == ["1", "2", "3"]
+
+
+def test_migrate_json_library_to_sqlite(tmp_path: Path) -> None:
+    source = tmp_path / "library.json"
+    json_library = MusicLibrary(storage_path=source, journal=True)
+    json_library.import_tracks(_tracks())
+    json_library.update_track_metadata("1", genre="Drone")
+    json_library.close()
+
+    result = migrate_library(source, f"sqlite://{tmp_path / 'library.db'}")
+
+    migrated = MusicLibrary(storage_path=tmp_path / "library.db")
+    assert result.inserted == 3
+    assert [track.id for track in migrated.list_tracks()] == ["1", "2", "3"]
+    assert migrated.get_track("1").genre == "Drone"
+    assert [track.id for track in migrated.query("genre=jazz|drone")] == ["1", "3"]
+
+
+def test_snapshot_backend_loads_tracks_lazily(tmp_path: Path) -> None:
+    location = tmp_path / "library.ztsnap"
+    library = MusicLibrary(storage_path=location)
+    library.import_tracks(_tracks())
+    library.save()
+    library.update_track_metadata("2", moods=["loud", "energetic"])
+    library.remove_track("1")
+    library.close()
+
+    reopened = MusicLibrary(storage_path=location)
+    lazy = reopened._tracks
+    assert len(lazy) == 2 and set(lazy._recent) <= {"1", "2"}  # only journaled tracks were decoded
+    track = reopened.get_track("3")
+    assert track is reopened.get_track("3")
+    assert track.moods == ["late night", "calm"]
+    track.mark_played()
+    assert reopened.get_track("2").moods == ["loud", "energetic"]
+    assert "1" not in lazy
+
+    reopened.save()
+    reopened.close()
+    assert location.with_name("library.ztsnap.journal").stat().st_size == 0
+    final = MusicLibrary(storage_path=f"snapshot://{location}")
+    assert [(t.id, t.play_count) for t in final.list_tracks()] == [("2", 7), ("3", 4)]
+
+
+def _orders(library: MusicLibrary) -> list[list[str]]:
+    searched: list[str] = []
+    for _ in range(3):  # the last search goes through the substring index
+        searched = [track.id for track in library.search("o")]
+    return [[track.id for track in library.list_tracks()], [track.id for track in library.popular_tracks(10)], searched]
+
+
+def test_snapshot_readded_track_orders_like_json(tmp_path: Path) -> None:
+    def run(location: Path) -> list[list[str]]:
+        library = MusicLibrary(storage_path=location)
+        library.import_tracks(_tracks())
+        library.save()
+        library.remove_track("1")
+        library.add_track(_tracks()[0])
+        library.remove_track("2")
+        library.add_track(Track(id="4", title="Storm Two", artist="Circuit", album="City", duration_seconds=1, genre="Rock"))
+        library.add_track(_tracks()[1])
+        orders = _orders(library)
+        library.close()
+        reopened = MusicLibrary(storage_path=location)  # replays the journal
+        orders += _orders(reopened)
+        reopened.close()
+        return orders
+
+    expected = run(tmp_path / "json" / "library.json")
+    assert expected[0] == ["3", "1", "4", "2"]
+    assert run(tmp_path / "snap" / "library.ztsnap") == expected
+
+
+def test_atomic_writes_keep_the_usual_file_mode(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    path = tmp_path / "library.json"
+    umask = os.umask(0o022)
+    # Changing the umask, even briefly, would race with other threads.
+    monkeypatch.setattr(os, "umask", lambda mask: pytest.fail("atomic_write_bytes changed the umask"))
+    try:
+        library = MusicLibrary(storage_path=path)
+        library.import_tracks(_tracks())
+        assert stat.S_IMODE(path.stat().st_mode) == 0o644
+        path.chmod(0o640)
+        library.save()
+        assert stat.S_IMODE(path.stat().st_mode) == 0o640
+    finally:
+        monkeypatch.undo()
+        os.umask(umask)
@@ -0,0 +1,44 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+from music_app.library import MusicLibrary, Track
+from music_app.player import MusicPlayer
+from music_app.playlist import Playlist
+from music_app.recommendation import RecommendationEngine
+from music_app.transitions import TransitionModel, transitions_path_for
+
+
+def test_player_feeds_transition_model_and_recommend_next(tmp_path: Path) -> None:
+    library = MusicLibrary(storage_path=tmp_path / "library.json")
+    library.import_tracks(
+        Track(id=track_id, title=track_id, artist="A", album="", duration_seconds=60, genre="Pop") for track_id in "abcd"
+    )
+    model = TransitionModel(path=transitions_path_for(library.storage_path))
+    player = MusicPlayer(library, transitions=model)
+    for order in (["a", "b", "c"], ["a", "b"], ["d", "a", "c"]):
+        player.play_playlist(Playlist(name="session", track_ids=order))  # each ends its session
+
+    engine = RecommendationEngine(library, transitions=model)
+    assert [track.id for track in engine.recommend_next("a")] == ["b", "c"]
+    assert model.successors("b") == [("c", 1)]
+    assert model.successors("c") == []
+
+    model.save()
+    library.remove_track("b")
+    reloaded = TransitionModel(path=model.path)
+    assert reloaded.successors("a") == [("b", 2), ("c", 1)]
+    assert [track.id for track in RecommendationEngine(library, transitions=reloaded).recommend_next("a")] == ["c"]
+
+
+def test_transition_model_prunes_to_top_successors() -> None:
+    model = TransitionModel(max_successors=2)
+    for _ in range(3):
+        model.observe("seed", "hit")
+    model.observe("seed", "second")
+    model.observe("seed", "second")
+    for index in range(10):
+        model.observe("seed", f"rare-{index}")
+
+    assert model.successors("seed") == [("hit", 3), ("second", 2)]
+    assert len(model._successors["seed"]) <= 4
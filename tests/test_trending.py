@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+
+from music_app.library import MusicLibrary, Track
+from music_app.player import MusicPlayer
+from music_app.recommendation import DECAYED, RecommendationEngine
+from music_app.trending import TrendingTracker
+
+HOUR = 3600.0
+
+
+def test_decayed_scores_and_sliding_windows() -> None:
+    tracker = TrendingTracker(half_life=HOUR, window=6 * HOUR, bucket_seconds=60)
+    for _ in range(8):
+        tracker.record("old-hit", when=0)
+    for _ in range(3):
+        tracker.record("new", when=3 * HOUR)
+    tracker.record("older", when=-HOUR)
+
+    assert tracker.score("old-hit", now=3 * HOUR) == pytest.approx(1.0)
+    assert [track_id for track_id, _ in tracker.top(3, now=3 * HOUR)] == ["new", "old-hit", "older"]
+    assert tracker.top(5, window=HOUR, now=3 * HOUR + 10) == [("new", 3.0)]
+    assert tracker.top(5, window=6 * HOUR, now=3 * HOUR + 10) == [("old-hit", 8.0), ("new", 3.0), ("older", 1.0)]
+    with pytest.raises(ValueError):
+        tracker.top(window=7 * HOUR)
+
+
+def test_sketch_mode_keeps_heavy_hitters() -> None:
+    exact = TrendingTracker(half_life=HOUR)
+    sketched = TrendingTracker(half_life=HOUR, sketch_width=512, capacity=8)
+    plays = [f"t{index % 40}" for index in range(400)] + ["hot"] * 60 + ["warm"] * 30
+    for position, track_id in enumerate(plays):
+        exact.record(track_id, when=position)
+        sketched.record(track_id, when=position)
+
+    now = float(len(plays))
+    assert [track_id for track_id, _ in sketched.top(2, now=now)] == ["hot", "warm"]
+    assert sketched.score("hot", now) >= exact.score("hot", now) - 1e-9
+
+
+def test_engine_trending_windows_follow_player_plays(tmp_path: Path) -> None:
+    library = MusicLibrary(storage_path=tmp_path / "library.json")
+    library.import_tracks(
+        [
+            Track(id="1", title="A", artist="A", album="", duration_seconds=60, genre="Pop", play_count=100),
+            Track(id="2", title="B", artist="B", album="", duration_seconds=60, genre="Pop"),
+        ]
+    )
+    tracker = TrendingTracker().attach(library)
+    engine = RecommendationEngine(library, trending=tracker)
+    player = MusicPlayer(library)
+    player.enqueue(["2", "2", "1"])
+    while player.queue:
+        player.play_next()
+
+    assert [track.id for track in engine.top_trending(2)] == ["1", "2"]
+    assert [track.id for track in engine.top_trending(2, window=DECAYED)] == ["2", "1"]
+    assert [track.id for track in engine.top_trending(2, window=HOUR)] == ["2", "1"]